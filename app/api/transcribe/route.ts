@@ -52,11 +52,17 @@ export async function POST(request: NextRequest) {
 
       if (!response.ok) {
         const error = await response.json()
+        // Serveur saturé (429) : le client doit réessayer après le délai indiqué
+        const retryAfter = response.headers.get("Retry-After")
         return NextResponse.json(
           {
             error: error.detail || "Erreur de transcription",
+            ...(retryAfter && { retry_after: Number(retryAfter) }),
+          },
+          {
+            status: response.status,
+            headers: retryAfter ? { "Retry-After": retryAfter } : undefined,
           },
-          { status: response.status },
         )
       }
 
@@ -0,0 +1,110 @@
+"""Contrôle d'admission : refuse le travail dont l'attente prévue dépasse le SLA, dégrade le décodage avant
+
+L'attente est prédite par l'ordonnanceur (ou par la file partagée, QueueLoad, quand des workers
+séparés transcrivent) à partir de la durée audio des jobs et de la vitesse mesurée des workers
+(secondes de calcul par seconde d'audio, par modèle). Les envois acceptés
+mais pas encore dans la file (upload en cours de décodage) sont réservés pour qu'une rafale ne
+soit pas admise en entier.
+"""
+
+import math
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+from decoding import PROFILE_ORDER, get_profile
+from job_queue import QueueLoad
+from scheduler import TranscriptionScheduler
+
+
+class Overloaded(Exception):
+    """Attente prévue au-delà du SLA ; retry_after : secondes avant qu'une place se libère"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, scheduler: Union[TranscriptionScheduler, QueueLoad], max_wait_seconds: float):
+        self.scheduler = scheduler
+        self.max_wait_seconds = max_wait_seconds  # 0 = pas de refus, estimations seulement
+        self._lock = threading.Lock()
+        # jeton -> secondes de calcul prévues d'un envoi admis pas encore soumis
+        self._reserved: Dict[str, float] = {}
+
+    def estimate(self, user_id: str, payload: Dict[str, Any], expected_duration: Optional[float] = None) -> Dict[str, Any]:
+        """Attente et fin prévues (en secondes à partir de maintenant) d'un job soumis maintenant"""
+        planned = self.scheduler.estimate(user_id, payload, expected_duration)
+        now = time.time()
+        with self._lock:
+            reserved = sum(self._reserved.values())
+        backlog = reserved / self.scheduler.workers
+        wait = max(0.0, planned["expected_start"] - now) + backlog
+        return {
+            "queue_position": planned["position"],
+            "wait_seconds": wait,
+            "runtime_seconds": planned["expected_end"] - planned["expected_start"],
+            "completion_seconds": max(0.0, planned["expected_end"] - now) + backlog,
+        }
+
+    def check(self, user_id: str, payload: Dict[str, Any], expected_duration: Optional[float] = None) -> Dict[str, Any]:
+        """Estimation d'un envoi, ou Overloaded si son attente dépasse le SLA"""
+        estimate = self.estimate(user_id, payload, expected_duration)
+        if self.max_wait_seconds > 0 and estimate["wait_seconds"] > self.max_wait_seconds:
+            # La file se vide d'une seconde de calcul par seconde et par worker
+            retry_after = max(1, math.ceil(estimate["wait_seconds"] - self.max_wait_seconds))
+            raise Overloaded(f"Serveur saturé : attente prévue {_format_wait(estimate['wait_seconds'])} (maximum {_format_wait(self.max_wait_seconds)})", retry_after)
+        return estimate
+
+    def admit(self, token: str, user_id: str, payload: Dict[str, Any], expected_duration: Optional[float] = None) -> Dict[str, Any]:
+        """Comme check, puis réserve la place jusqu'à release(token)"""
+        estimate = self.check(user_id, payload, expected_duration)
+        with self._lock:
+            self._reserved[token] = estimate["runtime_seconds"]
+        return estimate
+
+    def release(self, token: str):
+        with self._lock:
+            self._reserved.pop(token, None)
+
+    def retry_after(self) -> int:
+        """Secondes avant qu'un worker se libère (file pleine)"""
+        running = self.scheduler.snapshot()["running"]
+        if not running:
+            return 1
+        return max(1, math.ceil(min(entry["expected_end"] for entry in running) - time.time()))
+
+    @property
+    def reserved_count(self) -> int:
+        with self._lock:
+            return len(self._reserved)
+
+
+class ProfileController:
+    """Profil de décodage d'un job : plus rapide d'un cran quand l'attente prévue dépasse degrade_wait_seconds,
+    le plus rapide au-delà de 4 fois ce seuil ou quand degrade_queue_length jobs attendent"""
+
+    def __init__(self, admission: AdmissionController, default_profile: str, degrade_wait_seconds: float, degrade_queue_length: int):
+        self.admission = admission
+        self.default_profile = get_profile(default_profile).name
+        self.degrade_wait_seconds = degrade_wait_seconds  # 0 = profil par défaut quelle que soit la charge
+        self.degrade_queue_length = degrade_queue_length
+
+    def select(self, user_id: str, model_name: str, requested: Optional[str] = None) -> str:
+        """Profil demandé par le client (UnknownProfile s'il n'existe pas), sinon selon la charge"""
+        if requested:
+            return get_profile(requested).name
+        if self.degrade_wait_seconds <= 0:
+            return self.default_profile
+        wait = self.admission.estimate(user_id, {"model_name": model_name, "profile": self.default_profile})["wait_seconds"]
+        steps = 0
+        if wait > self.degrade_wait_seconds:
+            steps = 1
+        if wait > 4 * self.degrade_wait_seconds or (self.degrade_queue_length and self.admission.scheduler.pending_count >= self.degrade_queue_length):
+            steps = len(PROFILE_ORDER)
+        return PROFILE_ORDER[min(len(PROFILE_ORDER) - 1, PROFILE_ORDER.index(self.default_profile) + steps)]
+
+
+def _format_wait(seconds: float) -> str:
+    return f"{seconds:.0f}s" if seconds < 120 else f"{seconds / 60:.0f}min"
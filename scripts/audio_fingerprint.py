@@ -0,0 +1,90 @@
+"""Empreinte acoustique du PCM décodé : reconnaît un même audio ré-encodé (m4a -> mp3, re-muxage...)
+
+Chaque trame (pas de 25 ms) donne 16 bits : signe de la variation, d'une trame à l'autre, de la
+différence d'énergie entre bandes voisines (300 Hz - 4 kHz, zone préservée par les codecs).
+Les trames de silence valent 0 et sont ignorées à la comparaison.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+HOP_SAMPLES = 400  # 25 ms
+FRAME_SAMPLES = 3200  # 200 ms
+BAND_EDGES = np.geomspace(300, 4000, 18)  # 17 bandes -> 16 bits par trame
+SILENCE_DB = 25.0  # Trames à plus de 25 dB sous les passages les plus forts
+SILENCE_FLOOR_DBFS = -70.0  # Silence numérique
+BLOCK_FRAMES = 2400  # Calcul par blocs de 60 s : mémoire bornée même sur les longs fichiers
+
+# Correspondance : taux de bits différents, décalage toléré (délai d'encodeur) et recouvrement minimal
+MATCH_THRESHOLD = 0.2
+MAX_SHIFT_FRAMES = 12
+MIN_VOICED_FRAMES = 80
+
+
+def _band_energies(audio: np.ndarray) -> np.ndarray:
+    frames = max(0, (len(audio) - FRAME_SAMPLES) // HOP_SAMPLES + 1)
+    frequencies = np.fft.rfftfreq(FRAME_SAMPLES, 1 / SAMPLING_RATE)
+    band_index = np.digitize(frequencies, BAND_EDGES) - 1
+    # Matrice fréquence -> bande (les fréquences hors bandes ne comptent pas)
+    bands = (band_index[:, None] == np.arange(len(BAND_EDGES) - 1)[None, :]).astype(np.float64)
+    window = np.hanning(FRAME_SAMPLES).astype(np.float32)
+    # Énergies ramenées à une moyenne quadratique (0 dB = pleine échelle)
+    scale = 2.0 / (FRAME_SAMPLES * float(np.sum(window ** 2)))
+
+    energies = np.zeros((frames, len(BAND_EDGES) - 1), dtype=np.float64)
+    for first in range(0, frames, BLOCK_FRAMES):
+        count = min(BLOCK_FRAMES, frames - first)
+        start = first * HOP_SAMPLES
+        block = np.asarray(audio[start:start + (count - 1) * HOP_SAMPLES + FRAME_SAMPLES], dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(block, FRAME_SAMPLES)[::HOP_SAMPLES][:count]
+        power = np.abs(np.fft.rfft(windows * window, axis=1)) ** 2
+        energies[first:first + count] = power @ bands * scale
+    return energies
+
+
+def compute_fingerprint(audio: np.ndarray) -> Optional[bytes]:
+    """Empreinte de l'audio 16 kHz mono (None si trop court ou silencieux pour être fiable)"""
+    energies = _band_energies(audio)
+    if len(energies) < 2:
+        return None
+    loudness = 10 * np.log10(energies.sum(axis=1) + 1e-12)
+    voiced = (loudness > np.percentile(loudness, 95) - SILENCE_DB) & (loudness > SILENCE_FLOOR_DBFS)
+
+    band_diff = energies[:, :-1] - energies[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    values = np.packbits(bits, axis=1, bitorder="little").view("<u2").reshape(-1)
+    values[~(voiced[1:] & voiced[:-1])] = 0
+    if np.count_nonzero(values) < MIN_VOICED_FRAMES:
+        return None
+    return values.astype("<u2").tobytes()
+
+
+def fingerprint_distance(first: bytes, second: bytes) -> float:
+    """Taux de bits différents au meilleur alignement (0 = identiques, ~0.5 = sans rapport)"""
+    a = np.frombuffer(first, dtype="<u2")
+    b = np.frombuffer(second, dtype="<u2")
+    best = 1.0
+    for shift in range(-MAX_SHIFT_FRAMES, MAX_SHIFT_FRAMES + 1):
+        x = a[max(0, shift):]
+        y = b[max(0, -shift):]
+        length = min(len(x), len(y))
+        x, y = x[:length], y[:length]
+        both = (x != 0) & (y != 0)
+        compared = int(both.sum())
+        # Les deux empreintes doivent couvrir l'essentiel de la même parole
+        if compared < MIN_VOICED_FRAMES or compared < 0.8 * min(np.count_nonzero(a), np.count_nonzero(b)):
+            continue
+        differing = np.unpackbits((x[both] ^ y[both]).view(np.uint8)).sum()
+        best = min(best, differing / (16 * compared))
+    return best
+
+
+def is_same_audio(first: bytes, second: bytes) -> bool:
+    return fingerprint_distance(first, second) <= MATCH_THRESHOLD
+
+
+def is_audio_prefix(prefix: bytes, audio: bytes) -> bool:
+    """prefix est le début de audio : version plus courte d'un enregistrement qui s'est prolongé"""
+    return len(prefix) < len(audio) and is_same_audio(prefix, audio[:len(prefix)])
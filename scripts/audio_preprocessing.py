@@ -0,0 +1,126 @@
+"""Pré-traitement audio : chaque upload est décodé une seule fois en PCM 16 kHz mono, mappé en mémoire"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import av
+import numpy as np
+
+from audio_fingerprint import compute_fingerprint
+
+SAMPLING_RATE = 16000
+PCM_SUFFIX = ".f32"
+FIFO_GROUP_SAMPLES = 500000  # Même regroupement que faster_whisper.decode_audio
+
+
+class PreparedAudio(NamedTuple):
+    pcm_path: Path
+    samples: int
+    fingerprint: Optional[bytes] = None
+
+    @property
+    def duration(self) -> float:
+        return self.samples / SAMPLING_RATE
+
+
+def pcm_path_for(upload_path: Path) -> Path:
+    return upload_path.with_name(upload_path.stem + PCM_SUFFIX)
+
+
+def _decoded_frames(container):
+    frames = container.decode(audio=0)
+    while True:
+        try:
+            yield next(frames)
+        except StopIteration:
+            return
+        except av.error.InvalidDataError:
+            continue
+
+
+def _grouped_frames(frames):
+    fifo = av.audio.fifo.AudioFifo()
+    for frame in frames:
+        frame.pts = None
+        fifo.write(frame)
+        if fifo.samples >= FIFO_GROUP_SAMPLES:
+            yield fifo.read()
+    if fifo.samples > 0:
+        yield fifo.read()
+
+
+def decode_to_pcm(input_path: Path, pcm_path: Path) -> PreparedAudio:
+    """Décode en flux vers un fichier float32 brut : mêmes échantillons que decode_audio, mémoire bornée"""
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=SAMPLING_RATE)
+    tmp_path = pcm_path.with_name(pcm_path.name + ".tmp")
+    samples = 0
+
+    def write(frames, out):
+        nonlocal samples
+        for frame in frames:
+            array = frame.to_ndarray().reshape(-1)
+            out.write((array.astype(np.float32) / 32768.0).tobytes())
+            samples += array.shape[0]
+
+    try:
+        with av.open(str(input_path), mode="r", metadata_errors="ignore") as container, open(tmp_path, 'wb') as out:
+            for group in _grouped_frames(_decoded_frames(container)):
+                write(resampler.resample(group), out)
+            write(resampler.resample(None), out)
+        tmp_path.replace(pcm_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return PreparedAudio(pcm_path, samples)
+
+
+def probe_duration(input_path: Path) -> Optional[float]:
+    """Durée annoncée par le conteneur, sans décoder (None si inconnue ou fichier illisible)"""
+    try:
+        with av.open(str(input_path), mode="r", metadata_errors="ignore") as container:
+            if container.duration:
+                return container.duration / av.time_base
+            stream = container.streams.audio[0]
+            if stream.duration and stream.time_base:
+                return float(stream.duration * stream.time_base)
+    except (av.error.FFmpegError, IndexError):
+        pass
+    return None
+
+
+def load_pcm(pcm_path: Path) -> np.ndarray:
+    """Audio prêt pour WhisperModel.transcribe, sans copie : les pages restent adossées au fichier"""
+    if pcm_path.stat().st_size == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(pcm_path, dtype=np.float32, mode="c")
+
+
+def prepare_audio(upload_path: Path, fingerprint: bool = False) -> PreparedAudio:
+    """Décodage, puis empreinte acoustique calculée sur le PCM tant qu'il est dans le cache de pages"""
+    prepared = decode_to_pcm(upload_path, pcm_path_for(upload_path))
+    if not fingerprint:
+        return prepared
+    return prepared._replace(fingerprint=compute_fingerprint(load_pcm(prepared.pcm_path)))
+
+
+class AudioPreprocessor:
+    """Décodage en amont de l'ordonnanceur, pendant que le modèle traite le job précédent"""
+
+    def __init__(self, workers: int = 1, fingerprint: bool = False):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="audio-preprocess")
+        self._lock = threading.Lock()
+        self.fingerprint = fingerprint
+        self.in_progress = 0
+
+    def submit(self, upload_path: Path) -> "Future[PreparedAudio]":
+        with self._lock:
+            self.in_progress += 1
+        future = self._executor.submit(prepare_audio, upload_path, self.fingerprint)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future: Future):
+        with self._lock:
+            self.in_progress -= 1
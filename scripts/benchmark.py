@@ -0,0 +1,445 @@
+"""Banc d'essai des serveurs de transcription : fixtures synthétiques, clients concurrents, moteur simulé
+
+Exemples :
+    python scripts/benchmark.py --server async --durations 10,30,120 --requests 24 --concurrency 4
+    python scripts/benchmark.py --server both --engine stub --stub-rtf 0.1 --json bench.json
+    python scripts/benchmark.py --server async --engine real   # modèles réels (déjà téléchargés)
+
+Chaque serveur tourne dans un processus séparé (répertoire de travail temporaire, RSS isolé),
+servi par uvicorn sur un port local et interrogé en HTTP par des clients concurrents.
+"""
+
+import argparse
+import contextlib
+import http.client
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+SERVERS = {
+    "async": SCRIPTS_DIR / "transcription-server-async.py",
+    "legacy": SCRIPTS_DIR / "transcription-server.py",
+}
+SAMPLING_RATE = 16000
+
+# --- Fixtures audio ---
+
+# Formants (F1, F2, F3) de quelques voyelles : le VAD Silero reconnaît ces bouffées comme de la parole
+VOWEL_FORMANTS = [(730, 1090, 2440), (270, 2290, 3010), (300, 870, 2240), (530, 1840, 2480), (640, 1190, 2390), (490, 1350, 1690)]
+FORMANT_BANDWIDTHS = (80, 100, 120)
+
+
+def _resonance(signal: np.ndarray, frequency: float, bandwidth: float) -> np.ndarray:
+    spectrum = np.fft.rfft(signal)
+    frequencies = np.fft.rfftfreq(len(signal), 1 / SAMPLING_RATE)
+    return np.fft.irfft(spectrum / (1 + ((frequencies - frequency) / (bandwidth / 2)) ** 2), len(signal))
+
+
+def _syllable(rng: np.random.Generator, seconds: float) -> np.ndarray:
+    """Train d'impulsions glottiques filtré par les formants d'une voyelle, précédé d'une consonne bruitée"""
+    n = int(seconds * SAMPLING_RATE)
+    t = np.arange(n) / SAMPLING_RATE
+    pitch = rng.uniform(100, 220) * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+    pulses = (np.diff(np.floor(np.cumsum(pitch) / SAMPLING_RATE), prepend=0) > 0).astype(np.float64)
+    source = pulses + 0.02 * rng.standard_normal(n)
+    formants = VOWEL_FORMANTS[rng.integers(len(VOWEL_FORMANTS))]
+    vowel = sum(_resonance(source, f, bw) for f, bw in zip(formants, FORMANT_BANDWIDTHS))
+    consonant = np.zeros(n)
+    attack = min(n, int(0.04 * SAMPLING_RATE))
+    consonant[:attack] = 0.3 * rng.standard_normal(attack)
+    return vowel * np.sqrt(np.sin(np.pi * np.arange(n) / n)) + _resonance(consonant, rng.uniform(2500, 5000), 800)
+
+
+def synthetic_speech(seconds: float, seed: int = 0) -> np.ndarray:
+    """Bouffées de pseudo-parole séparées de silences de 0,6 à 2 s (le VAD a du travail)"""
+    rng = np.random.default_rng(seed)
+    target = int(seconds * SAMPLING_RATE)
+    parts = []
+    total = 0
+    while total < target:
+        burst_samples = int(rng.uniform(0.8, 3.0) * SAMPLING_RATE)
+        syllables = []
+        while sum(len(s) for s in syllables) < burst_samples:
+            syllables.append(_syllable(rng, rng.uniform(0.12, 0.3)))
+        burst = np.concatenate(syllables)
+        burst *= 0.5 / max(np.abs(burst).max(), 1e-9)
+        gap = np.zeros(int(rng.uniform(0.6, 2.0) * SAMPLING_RATE))
+        parts += [burst, gap]
+        total += len(burst) + len(gap)
+    audio = np.concatenate(parts)[:target]
+    audio += 0.002 * rng.standard_normal(len(audio))
+    return audio.astype(np.float32)
+
+
+def make_fixture(seconds: float, seed: int = 0) -> bytes:
+    """Fichier WAV 16 kHz mono 16 bits ; deux graines différentes donnent deux fichiers différents"""
+    samples = np.clip(synthetic_speech(seconds, seed) * 32767, -32768, 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLING_RATE)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+# --- Moteur simulé ---
+
+StubSegment = namedtuple("StubSegment", "id seek start end text tokens temperature avg_logprob compression_ratio no_speech_prob words")
+StubInfo = namedtuple("StubInfo", "language language_probability duration duration_after_vad all_language_probs transcription_options vad_options")
+
+
+class StubWhisperModel:
+    """Remplace faster_whisper.WhisperModel : même interface, calcul simulé proportionnel à l'audio
+
+    Le VAD réel découpe l'audio comme le ferait faster-whisper ; chaque zone de parole « coûte »
+    sa durée × realtime_factor en sommeil (qui libère le GIL, comme CTranslate2).
+    """
+
+    realtime_factor = 0.05
+    load_seconds = 0.0
+
+    def __init__(self, model_size_or_path: str, device: str = "cpu", compute_type: str = "default", cpu_threads: int = 0, num_workers: int = 1, **kwargs):
+        self.model_size_or_path = model_size_or_path
+        # Pas de modèle CTranslate2 : le micro-batching retombe sur des transcriptions parallèles
+        self.model = None
+        time.sleep(self.load_seconds)
+
+    def transcribe(self, audio, language: Optional[str] = None, vad_filter: bool = False, vad_parameters=None, chunk_length: Optional[int] = None, **kwargs):
+        from faster_whisper import decode_audio
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=SAMPLING_RATE)
+        duration = len(audio) / SAMPLING_RATE
+        if vad_filter:
+            vad_options = vad_parameters if isinstance(vad_parameters, VadOptions) else VadOptions(**(vad_parameters or {}))
+            speech = get_speech_timestamps(audio, vad_options)
+        else:
+            speech = [{"start": 0, "end": len(audio)}] if len(audio) else []
+
+        # Fenêtres de 30 s au plus, comme le décodeur
+        window = int((chunk_length or 30) * SAMPLING_RATE)
+        regions = [
+            (start, min(start + window, chunk["end"]))
+            for chunk in speech
+            for start in range(chunk["start"], chunk["end"], window)
+        ]
+        info = StubInfo(
+            language=language or "fr",
+            language_probability=1.0,
+            duration=duration,
+            duration_after_vad=sum(end - start for start, end in regions) / SAMPLING_RATE,
+            all_language_probs=None,
+            transcription_options=None,
+            vad_options=None,
+        )
+
+        def segments():
+            for index, (start, end) in enumerate(regions):
+                time.sleep((end - start) / SAMPLING_RATE * self.realtime_factor)
+                yield StubSegment(index, start // 160, round(start / SAMPLING_RATE, 2), round(end / SAMPLING_RATE, 2), f" segment {index}", [], 0.0, -0.1, 1.0, 0.0, None)
+
+        return segments(), info
+
+
+# --- Serveur en processus ---
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_server(name: str, engine: str):
+    """Importe le script du serveur (le moteur simulé remplace WhisperModel avant l'import)"""
+    if engine == "stub":
+        import faster_whisper
+        faster_whisper.WhisperModel = StubWhisperModel
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    spec = importlib.util.spec_from_file_location(f"bench_{name}_server", SERVERS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ServerThread:
+    def __init__(self, app):
+        import uvicorn
+        self.port = _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", timeout_keep_alive=600))
+        self.thread = threading.Thread(target=self.server.run, name="bench-uvicorn", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+# --- Client HTTP ---
+
+def _request(port: int, method: str, path: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None, timeout: float = 3600):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def post_file(port: int, path: str, filename: str, content: bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: audio/wav\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return _request(port, "POST", path, body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+def transcribe(port: int, filename: str, content: bytes) -> Dict[str, Any]:
+    """Transcription complète, y compris l'attente d'un job asynchrone (gros fichiers)"""
+    status, body = post_file(port, "/transcribe", filename, content)
+    if status != 200:
+        raise RuntimeError(f"HTTP {status}: {body[:200]!r}")
+    result = json.loads(body)
+    job_id = result.get("job_id") if result.get("mode") == "async" else None
+    while job_id:
+        time.sleep(0.2)
+        status, body = _request(port, "GET", f"/transcribe/result/{job_id}")
+        if status == 200 and not json.loads(body).get("partial"):
+            return json.loads(body)
+        if status not in (200, 400):
+            raise RuntimeError(f"HTTP {status}: {body[:200]!r}")
+        _, status_body = _request(port, "GET", f"/transcribe/status/{job_id}")
+        if json.loads(status_body).get("status") == "error":
+            raise RuntimeError(json.loads(status_body).get("error"))
+    return result
+
+
+def wait_ready(port: int, path: str, timeout: float = 600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if _request(port, "GET", path, timeout=5)[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Serveur non prêt après {timeout:.0f}s")
+
+
+# --- Mesures ---
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentile au rang le plus proche"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(np.ceil(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def run_scenario(server_name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Exécuté dans un processus dédié : démarre le serveur, envoie la charge, mesure"""
+    work_dir = Path(tempfile.mkdtemp(prefix=f"retexte-bench-{server_name}-"))
+    os.chdir(work_dir)
+    StubWhisperModel.realtime_factor = options["stub_rtf"]
+    StubWhisperModel.load_seconds = options["stub_load_seconds"]
+
+    output = sys.stdout if options["verbose"] else open(os.devnull, 'w')
+    with contextlib.redirect_stdout(output):
+        module = load_server(server_name, options["engine"])
+
+        # Attente dans la file : mesurée à la sortie de l'ordonnanceur (serveur async uniquement)
+        queue_waits: List[float] = []
+        scheduler = getattr(module, "scheduler", None)
+        if scheduler is not None:
+            handler, batch_handler = scheduler.handler, scheduler.batch_handler
+
+            def timed_handler(job):
+                queue_waits.append(job.started_at - job.submitted_at)
+                return handler(job)
+
+            def timed_batch_handler(jobs):
+                queue_waits.extend(job.started_at - job.submitted_at for job in jobs)
+                return batch_handler(jobs)
+
+            scheduler.handler = timed_handler
+            if batch_handler is not None:
+                scheduler.batch_handler = timed_batch_handler
+
+        durations = options["durations"]
+        requests = [(index, durations[index % len(durations)]) for index in range(options["requests"])]
+        fixtures = {index: make_fixture(seconds, seed=options["seed"] + index) for index, seconds in requests}
+
+        with ServerThread(module.app) as server:
+            started = time.time()
+            wait_ready(server.port, "/ready" if server_name == "async" else "/health")
+            startup_seconds = time.time() - started
+
+            def one(request):
+                index, seconds = request
+                start = time.time()
+                try:
+                    result = transcribe(server.port, f"bench-{index}.wav", fixtures[index])
+                    return {"audio_seconds": seconds, "latency": time.time() - start, "processing_time": result["info"]["processing_time"], "error": None}
+                except Exception as e:
+                    return {"audio_seconds": seconds, "latency": time.time() - start, "processing_time": None, "error": str(e)}
+
+            run_started = time.time()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                results = list(executor.map(one, requests))
+            wall_seconds = time.time() - run_started
+
+            # Deuxième passage sur les mêmes fichiers : latence d'un hit de cache
+            cache_latencies = []
+            for index, _ in requests[:options["cache_requests"]]:
+                start = time.time()
+                status, _ = post_file(server.port, "/transcribe", f"bench-{index}.wav", fixtures[index])
+                if status == 200:
+                    cache_latencies.append(time.time() - start)
+
+    ok = [r for r in results if r["error"] is None]
+    audio_total = sum(r["audio_seconds"] for r in ok)
+    return {
+        "server": server_name,
+        "engine": options["engine"],
+        "requests": len(results),
+        "errors": [r["error"] for r in results if r["error"]],
+        "concurrency": options["concurrency"],
+        "startup_seconds": startup_seconds,
+        "wall_seconds": wall_seconds,
+        "audio_seconds": audio_total,
+        "throughput_audio_per_second": audio_total / wall_seconds if wall_seconds > 0 else None,
+        # Facteur temps réel : secondes de calcul par seconde d'audio (côté serveur puis de bout en bout)
+        "rtf": summarize([r["processing_time"] / r["audio_seconds"] for r in ok]),
+        "end_to_end_rtf": summarize([r["latency"] / r["audio_seconds"] for r in ok]),
+        "latency": summarize([r["latency"] for r in ok]),
+        "queue_wait": summarize(queue_waits) if scheduler is not None else None,
+        "cache_hit_latency": summarize(cache_latencies),
+        # ru_maxrss est en Ko sous Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _scenario_process(server_name: str, options: Dict[str, Any], queue):
+    try:
+        queue.put(run_scenario(server_name, options))
+    except Exception as e:
+        queue.put({"server": server_name, "failed": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(server_name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_scenario_process, args=(server_name, options, queue))
+    process.start()
+    report = queue.get()
+    process.join()
+    return report
+
+
+# --- Rapport ---
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def _ratio(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n=== Serveur {report['server']} ===")
+    if "failed" in report:
+        print(f"  Échec: {report['failed']}")
+        return
+    print(f"  Moteur: {report['engine']}, {report['requests']} requêtes, {report['concurrency']} clients, {len(report['errors'])} erreur(s)")
+    print(f"  Démarrage jusqu'à disponibilité: {report['startup_seconds']:.2f}s")
+    print(f"  Durée totale: {report['wall_seconds']:.2f}s pour {report['audio_seconds']:.0f}s d'audio ({report['throughput_audio_per_second'] or 0:.1f}x temps réel)")
+    rtf, e2e = report["rtf"], report["end_to_end_rtf"]
+    print(f"  RTF serveur p50/p95: {_ratio(rtf['p50'])} / {_ratio(rtf['p95'])}   bout en bout p50/p95: {_ratio(e2e['p50'])} / {_ratio(e2e['p95'])}")
+    latency = report["latency"]
+    print(f"  Latence p50/p95/p99: {_ms(latency['p50'])} / {_ms(latency['p95'])} / {_ms(latency['p99'])}")
+    if report["queue_wait"] is not None:
+        wait = report["queue_wait"]
+        print(f"  Attente en file p50/p95/p99: {_ms(wait['p50'])} / {_ms(wait['p95'])} / {_ms(wait['p99'])}")
+    cache = report["cache_hit_latency"]
+    print(f"  Hit de cache p50/p95: {_ms(cache['p50'])} / {_ms(cache['p95'])}")
+    print(f"  RSS max: {report['peak_rss_mb']:.0f}Mo")
+    for error in report["errors"][:5]:
+        print(f"  ! {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai des serveurs de transcription ReTexte")
+    parser.add_argument("--server", choices=["async", "legacy", "both"], default="both")
+    parser.add_argument("--engine", choices=["stub", "real"], default="stub", help="stub : moteur simulé, sans téléchargement de modèle")
+    parser.add_argument("--durations", default="10,30,120", help="Durées des fixtures en secondes, utilisées à tour de rôle")
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--cache-requests", type=int, default=5, help="Requêtes rejouées pour mesurer les hits de cache")
+    parser.add_argument("--stub-rtf", type=float, default=0.05, help="Secondes de calcul simulé par seconde de parole")
+    parser.add_argument("--stub-load-seconds", type=float, default=0.0, help="Durée simulée du chargement du modèle")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit aussi le rapport complet dans ce fichier")
+    parser.add_argument("--verbose", action="store_true", help="Affiche les journaux des serveurs")
+    args = parser.parse_args()
+
+    options = {
+        "engine": args.engine,
+        "durations": [float(value) for value in args.durations.split(",")],
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "cache_requests": args.cache_requests,
+        "stub_rtf": args.stub_rtf,
+        "stub_load_seconds": args.stub_load_seconds,
+        "seed": args.seed,
+        "verbose": args.verbose,
+    }
+    servers = ["async", "legacy"] if args.server == "both" else [args.server]
+    reports = []
+    for server_name in servers:
+        report = run_isolated(server_name, options)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"options": options, "reports": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Transcription parallèle des longs enregistrements : découpe aux silences, décodage en parallèle, recollage"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+SAMPLING_RATE = 16000
+LANGUAGE_DETECTION_SECONDS = 30
+
+
+class ChunkSegment(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+
+class ChunkedInfo(NamedTuple):
+    language: str
+    language_probability: float
+    duration: float
+    chunks: int
+
+
+def plan_chunks(audio: np.ndarray, chunk_seconds: float) -> List[Tuple[int, int]]:
+    """Bornes (en échantillons) des morceaux, coupés au milieu des silences détectés par le VAD"""
+    total = len(audio)
+    target = int(chunk_seconds * SAMPLING_RATE)
+    if total <= target * 3 // 2:
+        return [(0, total)]
+
+    # max_speech_duration_s force des coupures dans les longues prises de parole
+    speech = get_speech_timestamps(
+        audio,
+        VadOptions(min_silence_duration_ms=300, speech_pad_ms=0, max_speech_duration_s=chunk_seconds),
+    )
+    cuts = [(current["end"] + following["start"]) // 2 for current, following in zip(speech, speech[1:])]
+
+    chunks = []
+    start = 0
+    while total - start > target * 3 // 2:
+        ideal = start + target
+        window = [cut for cut in cuts if start + target // 2 <= cut <= start + target * 3 // 2]
+        cut = min(window, key=lambda candidate: abs(candidate - ideal)) if window else ideal
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, total))
+    return chunks
+
+
+def stitch_segments(chunk_results: Iterable[List[ChunkSegment]]) -> Iterator[ChunkSegment]:
+    """Recolle les segments des morceaux successifs en supprimant les doublons aux frontières"""
+    last_end = 0.0
+    last_text = None
+    for segments in chunk_results:
+        for index, segment in enumerate(segments):
+            text = segment.text.strip()
+            # Segment entièrement couvert par le morceau précédent
+            if segment.end <= last_end:
+                continue
+            # Phrase répétée de part et d'autre de la coupure
+            if index == 0 and text and text == last_text:
+                continue
+            yield ChunkSegment(max(segment.start, last_end), segment.end, segment.text)
+            last_end = segment.end
+            last_text = text
+
+
+class ChunkedTranscriber:
+    """Décode les morceaux d'un même fichier en parallèle sur un modèle à plusieurs réplicas
+
+    CTranslate2 relâche le GIL pendant l'inférence : des threads Python qui se partagent
+    un modèle à num_workers réplicas décodent réellement en parallèle. Le modèle est fourni
+    à chaque appel (réservé par l'appelant, qui en tient le budget mémoire).
+    """
+
+    def __init__(self, workers: int, chunk_seconds: float):
+        self.workers = max(1, workers)
+        self.chunk_seconds = chunk_seconds
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chunk-worker")
+
+    def transcribe(self, model: WhisperModel, audio, language: Optional[str], decode_options: Dict[str, Any]) -> Tuple[Iterator[ChunkSegment], ChunkedInfo]:
+        """Même contrat que WhisperModel.transcribe : générateur de segments ordonnés + infos"""
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio, sampling_rate=SAMPLING_RATE)
+        duration = len(audio) / SAMPLING_RATE
+        chunks = plan_chunks(audio, self.chunk_seconds)
+
+        language_probability = 1.0
+        if language is None:
+            language, language_probability = self._detect_language(model, audio)
+
+        futures = [
+            self._executor.submit(self._transcribe_chunk, model, audio[start:end], start / SAMPLING_RATE, language, decode_options)
+            for start, end in chunks
+        ]
+        info = ChunkedInfo(language=language, language_probability=language_probability, duration=duration, chunks=len(chunks))
+        return stitch_segments(self._results_in_order(futures)), info
+
+    def _detect_language(self, model: WhisperModel, audio: np.ndarray) -> Tuple[str, float]:
+        # La détection a lieu dans transcribe(), avant toute consommation du générateur
+        speech = get_speech_timestamps(audio[: 10 * 60 * SAMPLING_RATE], VadOptions())
+        start = speech[0]["start"] if speech else 0
+        head = audio[start:start + LANGUAGE_DETECTION_SECONDS * SAMPLING_RATE]
+        _, info = model.transcribe(head, language=None)
+        return info.language, info.language_probability
+
+    def _transcribe_chunk(self, model: WhisperModel, audio_chunk: np.ndarray, offset: float, language: str, decode_options: Dict[str, Any]) -> List[ChunkSegment]:
+        segments, _ = model.transcribe(audio_chunk, language=language, **decode_options)
+        return [
+            ChunkSegment(round(segment.start + offset, 2), round(segment.end + offset, 2), segment.text)
+            for segment in segments
+        ]
+
+    def _results_in_order(self, futures: List[Future]) -> Iterator[List[ChunkSegment]]:
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
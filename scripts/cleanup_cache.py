@@ -1,18 +1,19 @@
 import os
-import time
 from pathlib import Path
 
+from transcript_cache import TranscriptCache
+
 def cleanup_cache():
-    CACHE_DIR = Path(__file__).parent / "cache"
+    # Même dossier que le serveur, lancé depuis la racine du projet
+    CACHE_DIR = Path(__file__).resolve().parent.parent / "cache"
     MAX_AGE_DAYS = 5
-    now = time.time()
+    CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024))
 
-    for file in CACHE_DIR.iterdir():
-        if file.is_file():
-            age_days = (now - file.stat().st_mtime) / 86400
-            if age_days > MAX_AGE_DAYS:
-                print(f"Suppression du cache trop vieux : {file}")
-                file.unlink()
+    cache = TranscriptCache(CACHE_DIR, max_bytes=CACHE_MAX_BYTES)
+    removed = cache.remove_older_than(MAX_AGE_DAYS * 86400)
+    evicted = cache.evict()
+    print(f"Suppression du cache trop vieux : {removed} entrée(s), {evicted} évincée(s) pour le budget disque")
+    print(f"Cache : {cache.stats()['entries']} entrée(s), {cache.stats()['bytes'] / (1024 * 1024):.1f}MB")
 
 if __name__ == "__main__":
     cleanup_cache()
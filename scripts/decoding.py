@@ -0,0 +1,47 @@
+"""Paramètres de décodage communs au serveur et à la transcription hors ligne (ils font partie de la clé de cache)
+
+Trois profils, du plus précis au plus rapide : le serveur descend d'un cran quand la file s'allonge.
+"""
+
+from typing import Any, Dict, NamedTuple
+
+DECODE_OPTIONS = {
+    "beam_size": 3,
+    "temperature": 0.0,
+    "vad_filter": True,
+    "vad_parameters": {"min_silence_duration_ms": 500, "speech_pad_ms": 200},
+    "chunk_length": 30,
+    "condition_on_previous_text": False
+}
+
+
+class DecodingProfile(NamedTuple):
+    name: str
+    options: Dict[str, Any]
+    fast_model: bool = False  # Modèle rapide (FAST_MODEL) quand la requête n'impose pas de modèle
+
+
+DECODING_PROFILES = {
+    # Même faisceau que le serveur historique
+    "accurate": DecodingProfile("accurate", {**DECODE_OPTIONS, "beam_size": 5}),
+    "balanced": DecodingProfile("balanced", DECODE_OPTIONS),
+    # Décodage glouton
+    "fast": DecodingProfile("fast", {**DECODE_OPTIONS, "beam_size": 1}, fast_model=True),
+}
+PROFILE_ORDER = ("accurate", "balanced", "fast")
+DEFAULT_PROFILE = "balanced"
+
+
+class UnknownProfile(ValueError):
+    """Profil de décodage absent de DECODING_PROFILES"""
+
+
+def get_profile(name: str) -> DecodingProfile:
+    if name not in DECODING_PROFILES:
+        raise UnknownProfile(f"Profil de décodage inconnu: {name} (choix: {', '.join(PROFILE_ORDER)})")
+    return DECODING_PROFILES[name]
+
+
+def at_least_as_accurate(name: str):
+    """Profils dont un résultat convient à une requête de ce profil, du plus précis au moins précis"""
+    return PROFILE_ORDER[:PROFILE_ORDER.index(name) + 1]
@@ -0,0 +1,518 @@
+"""File de jobs partagée entre le serveur (API) et les workers de transcription
+
+Le serveur dépose un job, un worker le prend sous bail (lease) et le prolonge par des
+battements de cœur qui remontent la progression et les segments produits. Un bail expiré
+(worker arrêté brutalement) remet le job en file : le worker suivant reprend après les
+segments déjà remontés. Le résultat est publié dans le cache partagé, la file n'en garde
+que la clé.
+
+JobQueue décrit le contrat ; SQLiteJobQueue l'implémente pour une seule machine (plusieurs
+processus autour d'un même fichier). Plusieurs machines passent par un courtier (Redis...)
+implémentant la même interface, déclaré dans QUEUE_BACKENDS. QueueLoad présente la charge de
+la file comme celle de l'ordonnanceur local, pour le contrôle d'admission et les ETA de l'API.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from scheduler import QueueFull
+
+DEFAULT_LEASE_SECONDS = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+WORKER_SEEN_SECONDS = 30.0  # Un worker sans nouvelles depuis plus longtemps n'est plus compté
+
+
+class QueuedJob(NamedTuple):
+    job_id: str
+    payload: Dict[str, Any]
+    attempts: int  # 1 au premier essai
+
+
+class LeaseLost(Exception):
+    """Le bail a expiré et le job a été repris (ou terminé) ailleurs : le worker abandonne"""
+
+
+class JobQueue:
+    """Contrat d'une file partagée ; toutes les méthodes peuvent être appelées depuis n'importe quel processus"""
+
+    def __init__(self, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    # --- Côté API ---
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any], max_pending: Optional[int] = None) -> bool:
+        """Dépose un job (payload["model_name"] sert au filtrage des workers) ; False s'il existe déjà,
+        QueueFull si max_pending jobs attendent déjà"""
+        raise NotImplementedError
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """status (queued, leased, completed, failed), progress, transcript_id, error, queue_position..."""
+        raise NotImplementedError
+
+    def segments(self, job_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        """Segments remontés par les workers, à partir du rang since"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def load(self) -> Dict[str, Any]:
+        """Jobs en attente et en cours par ordre d'arrivée (job_id, worker_id, started_at, payload)
+        et workers vus récemment (worker_id, models, rates)"""
+        raise NotImplementedError
+
+    # --- Côté worker ---
+
+    def claim(self, worker_id: str, models: Optional[List[str]] = None) -> Optional[QueuedJob]:
+        """Job le plus ancien en attente (ou au bail expiré) pour l'un de ces modèles, pris sous bail"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker_id: str, progress: Dict[str, Any], segments: List[Dict[str, Any]]):
+        """Prolonge le bail et ajoute les nouveaux segments ; LeaseLost si le job n'est plus à ce worker"""
+        raise NotImplementedError
+
+    def complete(self, job_id: str, worker_id: str, transcript_id: str):
+        raise NotImplementedError
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        raise NotImplementedError
+
+    def release(self, job_id: str, worker_id: str):
+        """Rend le job à la file sans compter d'essai (arrêt du worker)"""
+        raise NotImplementedError
+
+    def touch_worker(self, worker_id: str, info: Dict[str, Any]):
+        """info["models"] : modèles servis ; info["rates"][modèle][profil] : secondes de calcul par seconde d'audio"""
+        raise NotImplementedError
+
+    def remove_finished(self, max_age_seconds: float) -> int:
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(JobQueue):
+    """File dans un fichier SQLite (WAL) : les prises de job sont sérialisées par BEGIN IMMEDIATE"""
+
+    def __init__(self, path: Path, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        super().__init__(lease_seconds, max_attempts)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Transactions explicites ; timeout : attente des autres processus qui écrivent
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS queue_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                model TEXT,
+                payload TEXT NOT NULL,
+                worker_id TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                progress TEXT,
+                transcript_id TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS queue_jobs_status ON queue_jobs (status, created_at)")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS queue_segments (
+                job_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (job_id, position)
+            ) WITHOUT ROWID"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS queue_workers (
+                worker_id TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                last_seen REAL NOT NULL
+            )"""
+        )
+
+    def _transaction(self, sql_calls):
+        """Exécute sql_calls(db) dans une transaction d'écriture, sous le verrou du processus"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = sql_calls(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return value
+
+    def _check_lease(self, db: sqlite3.Connection, job_id: str, worker_id: str):
+        row = db.execute("SELECT status, worker_id FROM queue_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or row[0] != "leased" or row[1] != worker_id:
+            raise LeaseLost(f"Job {job_id} repris par un autre worker ou terminé")
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any], max_pending: Optional[int] = None) -> bool:
+        def put(db: sqlite3.Connection) -> bool:
+            # Compté dans la même transaction : plusieurs processus API ne dépassent pas la borne ensemble
+            if max_pending is not None and db.execute("SELECT COUNT(*) FROM queue_jobs WHERE status = 'queued'").fetchone()[0] >= max_pending:
+                raise QueueFull(f"File d'attente pleine ({max_pending} jobs)")
+            now = time.time()
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO queue_jobs (job_id, status, model, payload, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, payload.get("model_name"), json.dumps(payload, ensure_ascii=False), now, now),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(put)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, worker_id, attempts, progress, transcript_id, error, created_at, started_at, finished_at FROM queue_jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            status, worker_id, attempts, progress, transcript_id, error, created_at, started_at, finished_at = row
+            job = {"status": status, "attempts": attempts, "created_at": created_at, **json.loads(progress or "{}")}
+            if status == "queued":
+                job["queue_position"] = self._db.execute(
+                    "SELECT COUNT(*) FROM queue_jobs WHERE status = 'queued' AND created_at <= ?", (created_at,)
+                ).fetchone()[0]
+            else:
+                job["segments_done"] = self._db.execute("SELECT COUNT(*) FROM queue_segments WHERE job_id = ?", (job_id,)).fetchone()[0]
+        for key, value in (("worker_id", worker_id), ("transcript_id", transcript_id), ("error", error), ("started_at", started_at), ("finished_at", finished_at)):
+            if value is not None:
+                job[key] = value
+        return job
+
+    def segments(self, job_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT start, end, text FROM queue_segments WHERE job_id = ? AND position >= ? ORDER BY position", (job_id, since)
+            ).fetchall()
+        return [{"start": start, "end": end, "text": text} for start, end, text in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {"queued": 0, "leased": 0, "completed": 0, "failed": 0}
+        with self._lock:
+            for status, count in self._db.execute("SELECT status, COUNT(*) FROM queue_jobs GROUP BY status"):
+                counts[status] = count
+            workers = self._live_workers()
+        return {**counts, "workers": workers}
+
+    def load(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, status, worker_id, started_at, payload FROM queue_jobs WHERE status IN ('queued', 'leased') ORDER BY created_at"
+            ).fetchall()
+            workers = self._live_workers()
+        jobs: Dict[str, List[Dict[str, Any]]] = {"queued": [], "leased": []}
+        for job_id, status, worker_id, started_at, payload in rows:
+            jobs[status].append({"job_id": job_id, "worker_id": worker_id, "started_at": started_at, "payload": json.loads(payload)})
+        return {**jobs, "workers": workers}
+
+    def _live_workers(self) -> List[Dict[str, Any]]:
+        rows = self._db.execute(
+            "SELECT worker_id, info, last_seen FROM queue_workers WHERE last_seen >= ? ORDER BY worker_id",
+            (time.time() - WORKER_SEEN_SECONDS,),
+        ).fetchall()
+        return [{"worker_id": worker_id, **json.loads(info), "last_seen": last_seen} for worker_id, info, last_seen in rows]
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM queue_jobs WHERE status = 'queued'").fetchone()[0]
+
+    @property
+    def running_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM queue_jobs WHERE status = 'leased'").fetchone()[0]
+
+    def claim(self, worker_id: str, models: Optional[List[str]] = None) -> Optional[QueuedJob]:
+        def take(db: sqlite3.Connection) -> Optional[QueuedJob]:
+            now = time.time()
+            # Bail expiré trop souvent : le job fait tomber les workers, il n'est plus repris
+            db.execute(
+                "UPDATE queue_jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ?"
+                " WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (f"Abandonné après {self.max_attempts} essais (worker perdu)", now, now, now, self.max_attempts),
+            )
+            sql = "SELECT job_id, payload, attempts FROM queue_jobs WHERE (status = 'queued' OR (status = 'leased' AND lease_until < ?))"
+            params: List[Any] = [now]
+            if models:
+                sql += f" AND model IN ({', '.join('?' * len(models))})"
+                params += models
+            row = db.execute(sql + " ORDER BY created_at LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            job_id, payload, attempts = row
+            db.execute(
+                "UPDATE queue_jobs SET status = 'leased', worker_id = ?, lease_until = ?, attempts = attempts + 1,"
+                " started_at = COALESCE(started_at, ?), updated_at = ? WHERE job_id = ?",
+                (worker_id, now + self.lease_seconds, now, now, job_id),
+            )
+            return QueuedJob(job_id, json.loads(payload), attempts + 1)
+
+        return self._transaction(take)
+
+    def heartbeat(self, job_id: str, worker_id: str, progress: Dict[str, Any], segments: List[Dict[str, Any]]):
+        def beat(db: sqlite3.Connection):
+            self._check_lease(db, job_id, worker_id)
+            now = time.time()
+            db.execute(
+                "UPDATE queue_jobs SET lease_until = ?, progress = ?, updated_at = ? WHERE job_id = ?",
+                (now + self.lease_seconds, json.dumps(progress), now, job_id),
+            )
+            if segments:
+                first = db.execute("SELECT COUNT(*) FROM queue_segments WHERE job_id = ?", (job_id,)).fetchone()[0]
+                db.executemany(
+                    "INSERT INTO queue_segments (job_id, position, start, end, text) VALUES (?, ?, ?, ?, ?)",
+                    ((job_id, first + offset, segment["start"], segment["end"], segment["text"]) for offset, segment in enumerate(segments)),
+                )
+            db.execute("UPDATE queue_workers SET last_seen = ? WHERE worker_id = ?", (now, worker_id))
+
+        self._transaction(beat)
+
+    def _finish(self, job_id: str, worker_id: str, status: str, transcript_id: Optional[str], error: Optional[str]):
+        def finish(db: sqlite3.Connection):
+            self._check_lease(db, job_id, worker_id)
+            now = time.time()
+            db.execute(
+                "UPDATE queue_jobs SET status = ?, transcript_id = ?, error = ?, lease_until = NULL, updated_at = ?, finished_at = ? WHERE job_id = ?",
+                (status, transcript_id, error, now, now, job_id),
+            )
+            # Le résultat complet est dans le cache : les segments intermédiaires ne servent plus
+            db.execute("DELETE FROM queue_segments WHERE job_id = ?", (job_id,))
+
+        self._transaction(finish)
+
+    def complete(self, job_id: str, worker_id: str, transcript_id: str):
+        self._finish(job_id, worker_id, "completed", transcript_id, None)
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        self._finish(job_id, worker_id, "failed", None, error)
+
+    def release(self, job_id: str, worker_id: str):
+        def give_back(db: sqlite3.Connection):
+            self._check_lease(db, job_id, worker_id)
+            db.execute(
+                "UPDATE queue_jobs SET status = 'queued', worker_id = NULL, lease_until = NULL, attempts = attempts - 1, updated_at = ? WHERE job_id = ?",
+                (time.time(), job_id),
+            )
+
+        self._transaction(give_back)
+
+    def touch_worker(self, worker_id: str, info: Dict[str, Any]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO queue_workers (worker_id, info, last_seen) VALUES (?, ?, ?)",
+                (worker_id, json.dumps(info), time.time()),
+            )
+
+    def remove_finished(self, max_age_seconds: float) -> int:
+        limit = time.time() - max_age_seconds
+
+        def purge(db: sqlite3.Connection) -> int:
+            cursor = db.execute("DELETE FROM queue_jobs WHERE finished_at < ?", (limit,))
+            db.execute("DELETE FROM queue_workers WHERE last_seen < ?", (limit,))
+            return cursor.rowcount
+
+        return self._transaction(purge)
+
+
+class QueueLoad:
+    """Charge de la file partagée avec l'interface de TranscriptionScheduler (compteurs, snapshot,
+    estimate, position) : l'attente est simulée en FIFO sur les workers vivants, chacun avec la
+    vitesse qu'il a mesurée par modèle et profil
+
+    Les lectures servent un instantané en mémoire, rafraîchi par un thread toutes les refresh_interval
+    secondes : une écriture longue d'un worker (bail, battement de cœur) ne bloque pas l'API.
+    """
+
+    def __init__(self, queue: JobQueue, max_queue_size: int, default_duration: float = 300.0, default_rate: float = 0.5, refresh_interval: float = 1.0):
+        self.queue = queue
+        self.max_queue_size = max_queue_size
+        self.default_duration = default_duration
+        self.default_rate = default_rate  # Aucun worker n'a encore mesuré sa vitesse
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._load: Dict[str, Any] = {"queued": [], "leased": [], "workers": []}
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def start(self):
+        if self._thread is None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._refresh_loop, name="queue-load", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def refresh(self):
+        load = self.queue.load()
+        with self._lock:
+            self._load = load
+
+    def _refresh_loop(self):
+        while not self._stopping:
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"!!! Erreur lecture de la file partagée: {e} !!!")
+
+    def added(self, job_id: str, payload: Dict[str, Any]):
+        """Job déposé par ce processus, compté sans attendre le prochain rafraîchissement"""
+        with self._lock:
+            self._load = {**self._load, "queued": self._load["queued"] + [{"job_id": job_id, "worker_id": None, "started_at": None, "payload": payload}]}
+
+    def _current(self) -> Dict[str, Any]:
+        # L'instantané est remplacé, jamais modifié : une référence suffit
+        with self._lock:
+            return self._load
+
+    @property
+    def workers(self) -> int:
+        return max(1, len(self._current()["workers"]))
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._current()["queued"])
+
+    @property
+    def running_count(self) -> int:
+        return len(self._current()["leased"])
+
+    @property
+    def rates(self) -> Dict[Tuple[str, str], float]:
+        """Moyenne des workers, par modèle et profil"""
+        return self._rates(self._current()["workers"])
+
+    @property
+    def processing_rate(self) -> float:
+        return self._mean_rate(self.rates)
+
+    def snapshot(self) -> Dict[str, Any]:
+        load = self._current()
+        running, pending = self._plan(load, [])
+        return self._describe(load, running, pending)
+
+    def estimate(self, user_id: str, payload: Dict[str, Any], expected_duration: Optional[float] = None) -> Dict[str, Any]:
+        """Position et heures de démarrage et de fin qu'aurait un job déposé maintenant"""
+        load = self._current()
+        _, pending = self._plan(load, [{"job_id": "", "payload": {**payload, "expected_duration": expected_duration}}])
+        return pending[-1]
+
+    def position(self, job_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.snapshot()
+        for entry in snapshot["running"]:
+            if entry["job_id"] == job_id:
+                return {"position": 0, **entry}
+        for entry in snapshot["pending"]:
+            if entry["job_id"] == job_id:
+                return entry
+        return None
+
+    def _describe(self, load: Dict[str, Any], running: List[Dict[str, Any]], pending: List[Dict[str, Any]]) -> Dict[str, Any]:
+        rates = self._rates(load["workers"])
+        return {
+            # Les workers prennent les jobs par ordre d'arrivée
+            "policy": "fifo",
+            "workers": max(1, len(load["workers"])),
+            "max_queue_size": self.max_queue_size,
+            "processing_rate": self._mean_rate(rates),
+            "rates": {str(key): rate for key, rate in rates.items()},
+            "running": running,
+            "pending": pending,
+        }
+
+    def _rates(self, workers: List[Dict[str, Any]]) -> Dict[Tuple[str, str], float]:
+        samples: Dict[Tuple[str, str], List[float]] = {}
+        for worker in workers:
+            for model, profiles in worker.get("rates", {}).items():
+                for profile, rate in profiles.items():
+                    samples.setdefault((model, profile), []).append(rate)
+        return {key: sum(values) / len(values) for key, values in samples.items()}
+
+    def _mean_rate(self, rates: Dict[Any, float]) -> float:
+        return sum(rates.values()) / len(rates) if rates else self.default_rate
+
+    def _runtime(self, worker: Dict[str, Any], payload: Dict[str, Any]) -> float:
+        """Secondes de calcul prévues du job sur ce worker"""
+        rates = worker.get("rates", {})
+        rate = rates.get(payload.get("model_name"), {}).get(payload.get("profile"))
+        if rate is None:
+            # Pas encore de mesure pour ce modèle et ce profil : moyenne du worker
+            rate = self._mean_rate(self._rates([worker]))
+        duration = payload.get("expected_duration")
+        return (duration if duration is not None else self.default_duration) * rate
+
+    def _plan(self, load: Dict[str, Any], extra: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Simulation des workers : chaque job en attente part sur le premier worker libre qui sert son modèle"""
+        now = time.time()
+        # Sans worker vivant, un worker fictif à la vitesse par défaut
+        workers = load["workers"] or [{"worker_id": None}]
+        available = [now] * len(workers)
+        index = {worker["worker_id"]: i for i, worker in enumerate(workers)}
+        running = []
+        for job in load["leased"]:
+            i = index.get(job["worker_id"])
+            expected_end = (job["started_at"] or now) + self._runtime(workers[i] if i is not None else {}, job["payload"])
+            if i is not None:
+                available[i] = max(available[i], expected_end)
+            running.append({
+                "job_id": job["job_id"],
+                "worker_id": job["worker_id"],
+                "started_at": job["started_at"],
+                "expected_end": expected_end,
+            })
+        pending = []
+        for position, job in enumerate(load["queued"] + extra, start=1):
+            model = job["payload"].get("model_name")
+            eligible = [i for i, worker in enumerate(workers) if "models" not in worker or model in worker["models"]] or range(len(workers))
+            i = min(eligible, key=lambda i: available[i])
+            expected_start = available[i]
+            available[i] = expected_start + self._runtime(workers[i], job["payload"])
+            pending.append({
+                "job_id": job["job_id"],
+                "position": position,
+                "expected_start": expected_start,
+                "expected_end": available[i],
+                "expected_duration": job["payload"].get("expected_duration"),
+            })
+        return running, pending
+
+
+QUEUE_BACKENDS = {
+    "sqlite": SQLiteJobQueue,
+}
+
+
+def open_queue(url: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> JobQueue:
+    """File désignée par une URL : sqlite:///chemin/absolu.sqlite3, sqlite://chemin/relatif.sqlite3 ou un simple chemin"""
+    scheme, separator, location = url.partition("://")
+    if not separator:
+        scheme, location = "sqlite", url
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"File de jobs inconnue: {scheme} (choix: {', '.join(QUEUE_BACKENDS)})")
+    return QUEUE_BACKENDS[scheme](Path(location), lease_seconds=lease_seconds)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
@@ -0,0 +1,290 @@
+"""Suivi durable des jobs asynchrones : état léger en mémoire, index SQLite et résultats sur disque"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from transcript_cache import decode_result, encode_result
+
+INDEX_FILENAME = "jobs.sqlite3"
+RESULT_SUFFIX = ".rtx"
+CHECKPOINT_SUFFIX = ".ckpt"
+UNFINISHED_STATUSES = ("queued", "processing")
+REQUEST_FIELDS = ("user_id", "client_id", "filename", "language", "file_hash", "upload_path", "model", "batch_id", "profile")
+
+
+class JobStore:
+    """Seuls les jobs en attente ou en cours restent en mémoire
+
+    Les jobs terminés n'existent plus que dans l'index (statut, erreur, dates) et dans
+    un fichier résultat au format compact du cache ; ils sont supprimés après ttl secondes.
+    Les paramètres de la requête sont conservés pour reprendre les jobs après un redémarrage.
+    """
+
+    def __init__(self, jobs_dir: Path, ttl: float = 24 * 3600, eviction_interval: float = 600):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.eviction_interval = eviction_interval
+
+        # État vivant des jobs non terminés, modifié sur place par les workers
+        self.active: Dict[str, Dict[str, Any]] = {}
+        # Progression des requêtes synchrones rejointes par des jobs : en mémoire seulement, sans reprise
+        self.transient: Dict[str, Dict[str, Any]] = {}
+        # Job -> job identique en cours dont il partage la progression
+        self._leaders: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._db = sqlite3.connect(str(self.jobs_dir / INDEX_FILENAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                user_id TEXT,
+                client_id TEXT,
+                filename TEXT,
+                language TEXT,
+                file_hash TEXT,
+                upload_path TEXT,
+                model TEXT,
+                batch_id TEXT,
+                profile TEXT,
+                transcript_id TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            )"""
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column in ("model", "batch_id", "profile", "transcript_id"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_batch_id ON jobs (batch_id)")
+        self._db.commit()
+
+    def _result_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}{RESULT_SUFFIX}"
+
+    def _checkpoint_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}{CHECKPOINT_SUFFIX}"
+
+    def create(self, job_id: str, user_id: str, client_id: Optional[str], filename: str, language: str, file_hash: str, upload_path: Path, model: Optional[str] = None, batch_id: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+        now = time.time()
+        state = {"status": "queued", "progress": 0, "user_id": user_id, "updated_at": now}
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, user_id, client_id, filename, language, file_hash, upload_path, model, batch_id, profile, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, client_id, filename, language, file_hash, str(upload_path), model, batch_id, profile, now, now),
+            )
+            self._db.commit()
+            self.active[job_id] = state
+        return state
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping
+
+    def track(self, state_id: str, user_id: str) -> Dict[str, Any]:
+        """État de progression d'une transcription synchrone, que les jobs identiques peuvent suivre"""
+        state = {"status": "queued", "progress": 0, "user_id": user_id, "updated_at": time.time()}
+        self.transient[state_id] = state
+        return state
+
+    def untrack(self, state_id: str):
+        self.transient.pop(state_id, None)
+
+    def follow(self, job_id: str, leader_id: str):
+        """Le job attend le résultat d'un job identique : il en affiche la progression"""
+        self._leaders[job_id] = leader_id
+
+    def leader_of(self, job_id: str) -> str:
+        return self._leaders.get(job_id, job_id)
+
+    def live(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """État en mémoire d'un job non terminé (None une fois le job terminé)"""
+        leader_id = self.leader_of(job_id)
+        leader_state = self.active.get(leader_id) or self.transient.get(leader_id)
+        if leader_state is not None and job_id in self.active:
+            return leader_state
+        return self.active.get(job_id) or self.transient.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        own_state = self.active.get(job_id)
+        if own_state is not None:
+            return {**self.live(job_id), "user_id": own_state["user_id"]}
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, user_id, error, updated_at, finished_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, user_id, error, updated_at, finished_at = row
+        job = {"status": status, "progress": 100 if status == "completed" else 0, "user_id": user_id, "updated_at": updated_at}
+        if finished_at is not None:
+            job["finished_at"] = finished_at
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def complete(self, job_id: str, result: Dict[str, Any], transcript_id: Optional[str] = None):
+        """Résultat écrit sur disque, le job quitte la mémoire
+
+        transcript_id : transcription de l'index des segments qui porte ce résultat
+        """
+        path = self._result_path(job_id)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_result(result))
+        tmp_path.replace(path)
+        if transcript_id is not None:
+            with self._lock:
+                self._db.execute("UPDATE jobs SET transcript_id = ? WHERE job_id = ?", (transcript_id, job_id))
+        self._finish(job_id, "completed", None)
+
+    def transcript_of(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT transcript_id FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, "error", error)
+
+    # --- Points de reprise ---
+
+    def append_checkpoint(self, job_id: str, segments: List[Dict[str, Any]]):
+        """Ajoute les segments finalisés depuis le dernier point de reprise (une ligne JSON chacun)"""
+        if not segments or job_id in self.transient:
+            return
+        lines = "".join(json.dumps(segment, ensure_ascii=False) + "\n" for segment in segments)
+        with open(self._checkpoint_path(job_id), 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+
+    def load_checkpoint(self, job_id: str) -> List[Dict[str, Any]]:
+        """Segments déjà produits avant l'interruption ; une dernière ligne tronquée est retirée du fichier"""
+        path = self._checkpoint_path(job_id)
+        try:
+            content = path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return []
+        segments = []
+        complete = content.endswith("\n")
+        for line in content.splitlines():
+            try:
+                segments.append(json.loads(line))
+            except json.JSONDecodeError:
+                complete = False
+        if not complete:
+            # Les ajouts suivants ne doivent pas se coller à une ligne incomplète
+            path.unlink()
+            self.append_checkpoint(job_id, segments)
+        return segments
+
+    def _finish(self, job_id: str, status: str, error: Optional[str]):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? WHERE job_id = ?",
+                (status, error, now, now, job_id),
+            )
+            self._db.commit()
+            self.active.pop(job_id, None)
+            self._leaders.pop(job_id, None)
+        self._checkpoint_path(job_id).unlink(missing_ok=True)
+
+    def load_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._result_path(job_id), 'rb') as f:
+                return decode_result(f.read())
+        except FileNotFoundError:
+            return None
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Jobs en attente ou en cours lors de l'arrêt précédent, dans leur ordre d'arrivée"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT job_id, {', '.join(REQUEST_FIELDS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                UNFINISHED_STATUSES,
+            ).fetchall()
+        return [dict(zip(("job_id",) + REQUEST_FIELDS, row)) for row in rows]
+
+    def resume(self, job_id: str, user_id: str) -> Dict[str, Any]:
+        """Remet en mémoire un job repris après redémarrage"""
+        state = {"status": "queued", "progress": 0, "user_id": user_id, "updated_at": time.time()}
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE job_id = ?", (state["updated_at"], job_id))
+            self._db.commit()
+            self.active[job_id] = state
+        return state
+
+    def batch(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Jobs d'un envoi groupé, dans l'ordre des fichiers"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, filename, status, error, finished_at FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid",
+                (batch_id,),
+            ).fetchall()
+        files = []
+        for job_id, filename, status, error, finished_at in rows:
+            state = self.live(job_id)
+            entry = {"job_id": job_id, "filename": filename, "status": state["status"] if state else status}
+            entry["progress"] = state["progress"] if state else (100 if status == "completed" else 0)
+            if error is not None:
+                entry["error"] = error
+            if finished_at is not None:
+                entry["finished_at"] = finished_at
+            files.append(entry)
+        return files
+
+    def counts(self) -> Dict[str, int]:
+        counts = {"queued": 0, "processing": 0, "completed": 0, "error": 0}
+        for state in list(self.active.values()):
+            counts[state["status"]] = counts.get(state["status"], 0) + 1
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs WHERE finished_at IS NOT NULL GROUP BY status").fetchall()
+        for status, count in rows:
+            counts[status] = counts.get(status, 0) + count
+        return counts
+
+    # --- Éviction ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._eviction_loop, name="jobs-eviction", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def _eviction_loop(self):
+        while not self._stopping:
+            self._wakeup.wait(self.eviction_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                self.remove_expired()
+            except Exception as e:
+                print(f"!!! Erreur éviction jobs: {e} !!!")
+
+    def remove_expired(self) -> int:
+        """Oublie les jobs terminés depuis plus de ttl secondes"""
+        limit = time.time() - self.ttl
+        with self._lock:
+            rows = self._db.execute("SELECT job_id FROM jobs WHERE finished_at < ?", (limit,)).fetchall()
+            self._db.execute("DELETE FROM jobs WHERE finished_at < ?", (limit,))
+            self._db.commit()
+        for (job_id,) in rows:
+            self._result_path(job_id).unlink(missing_ok=True)
+        return len(rows)
@@ -0,0 +1,162 @@
+"""Métriques du serveur : compteurs et histogrammes par étape, thread-safe, exposés au format Prometheus"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# Bornes des histogrammes (secondes) : de la lecture d'un morceau d'upload à l'inférence d'un long fichier
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+GaugeValue = Union[float, Dict[Any, float]]
+GaugeLabel = Union[str, Tuple[str, ...]]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """Compteurs, histogrammes de durée par étape et jauges calculées à la lecture
+
+    Les durées d'une requête peuvent aussi être cumulées dans un dict `timings`
+    (en-tête Server-Timing de la réponse).
+    """
+
+    def __init__(self, namespace: str = "retexte", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._stages: Dict[str, _Histogram] = {}
+        # Niveaux instantanés (ex. requêtes en cours), exposés comme jauges
+        self._levels: Dict[str, float] = {}
+        # nom -> (aide, label(s), fonction) ; les labels servent quand la fonction renvoie un dict
+        # (clés tuples si plusieurs labels)
+        self._gauges: Dict[str, Tuple[str, Optional[GaugeLabel], Callable[[], GaugeValue]]] = {}
+
+    # --- Compteurs ---
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    @contextmanager
+    def in_flight(self, name: str) -> Iterator[None]:
+        with self._lock:
+            self._levels[name] = self._levels.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._levels[name] -= 1
+
+    def level(self, name: str) -> float:
+        with self._lock:
+            return self._levels.get(name, 0)
+
+    # --- Étapes ---
+
+    def observe(self, stage: str, seconds: float, timings: Optional[Dict[str, float]] = None):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = _Histogram(len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram.counts[index] += 1
+                    break
+            histogram.sum += seconds
+            histogram.count += 1
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time(self, stage: str, timings: Optional[Dict[str, float]] = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, timings)
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {"count": histogram.count, "total_seconds": histogram.sum, "avg_seconds": histogram.sum / histogram.count if histogram.count else 0.0}
+                for stage, histogram in self._stages.items()
+            }
+
+    # --- Jauges ---
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], GaugeValue], label: Optional[GaugeLabel] = None):
+        self._gauges[name] = (help_text, label, read)
+
+    # --- Export ---
+
+    def render(self) -> str:
+        """Format texte d'exposition Prometheus (version 0.0.4)"""
+        prefix = self.namespace
+        lines: List[str] = []
+        with self._lock:
+            counters = dict(self._counters)
+            levels = dict(self._levels)
+            stages = {stage: (list(h.counts), h.sum, h.count) for stage, h in self._stages.items()}
+
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {_number(value)}"]
+        for name, value in sorted(levels.items()):
+            lines += [f"# TYPE {prefix}_{name} gauge", f"{prefix}_{name} {_number(value)}"]
+
+        if stages:
+            name = f"{prefix}_stage_duration_seconds"
+            lines += [f"# HELP {name} Durée de chaque étape du traitement d'une requête", f"# TYPE {name} histogram"]
+            for stage, (counts, total, count) in sorted(stages.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{_number(bound)}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {_number(total)}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        for gauge_name, (help_text, label, read) in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                print(f"!!! Erreur lecture métrique {gauge_name}: {e} !!!")
+                continue
+            name = f"{prefix}_{gauge_name}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            if isinstance(value, dict):
+                lines += [f'{name}{{{_labels(label, key)}}} {_number(item)}' for key, item in sorted(value.items())]
+            else:
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Valeur de l'en-tête Server-Timing (durées en millisecondes)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def _labels(label: GaugeLabel, key: Any) -> str:
+    if isinstance(label, tuple):
+        return ",".join(f'{name}="{part}"' for name, part in zip(label, key))
+    return f'{label}="{key}"'
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,124 @@
+"""Micro-batching des clips courts : les appels generate() concurrents partent en un seul passage du modèle"""
+
+import copy
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import ctranslate2
+from faster_whisper import WhisperModel
+
+
+class _PendingFeatures:
+    """Spectrogramme mis de côté : l'encodage se fait dans le generate() groupé"""
+
+    __slots__ = ("features",)
+
+    def __init__(self, features: np.ndarray):
+        self.features = features
+
+
+class _GenerateCall:
+    __slots__ = ("features", "prompts", "kwargs", "result", "error", "done")
+
+    def __init__(self, features: np.ndarray, prompts: List[List[int]], kwargs: Dict[str, Any]):
+        self.features = features
+        self.prompts = prompts
+        self.kwargs = kwargs
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class BatchedGenerationGroup:
+    """Se substitue au modèle CTranslate2 pour un groupe de transcriptions menées en parallèle
+
+    Chaque transcription garde la logique de faster-whisper (VAD, fenêtres, découpage en
+    segments). Seuls les appels au modèle sont regroupés : dès que tous les participants
+    actifs attendent un generate(), les fenêtres sont décodées ensemble. Le décodage
+    (encodeur + beam search, mêmes paramètres) est celui du chemin non groupé.
+    """
+
+    def __init__(self, model: ctranslate2.models.Whisper, participants: int):
+        self.model = model
+        self.active = participants
+        self.batches = 0
+        self.batched_windows = 0
+        self._cond = threading.Condition()
+        self._calls: List[_GenerateCall] = []
+
+    def __getattr__(self, name: str):
+        # is_multilingual, device, device_index...
+        return getattr(self.model, name)
+
+    def bind(self, whisper_model: WhisperModel) -> WhisperModel:
+        """Copie légère du WhisperModel (tokenizer et extracteur partagés) qui passe par ce groupe"""
+        bound = copy.copy(whisper_model)
+        bound.model = self
+        return bound
+
+    def encode(self, features: ctranslate2.StorageView, to_cpu: bool = False) -> _PendingFeatures:
+        return _PendingFeatures(np.array(features))
+
+    def detect_language(self, features):
+        return self.model.detect_language(self._storage(features))
+
+    def align(self, features, *args, **kwargs):
+        return self.model.align(self._storage(features), *args, **kwargs)
+
+    def generate(self, features, prompts: List[List[int]], **kwargs):
+        if not isinstance(features, _PendingFeatures):
+            features = _PendingFeatures(np.array(features))
+        call = _GenerateCall(features.features, prompts, kwargs)
+        with self._cond:
+            self._calls.append(call)
+            self._dispatch_if_ready()
+            while not call.done:
+                self._cond.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def leave(self):
+        """Un participant a terminé : les autres n'attendent plus sa prochaine fenêtre"""
+        with self._cond:
+            self.active -= 1
+            self._dispatch_if_ready()
+
+    def _dispatch_if_ready(self):
+        if not self._calls or len(self._calls) < self.active:
+            return
+        calls, self._calls = self._calls, []
+        # Tous les participants actifs sont en attente : exécuter sous verrou ne bloque personne
+        groups: Dict[str, List[_GenerateCall]] = {}
+        for call in calls:
+            signature = json.dumps([len(prompt) for prompt in call.prompts] + [sorted(call.kwargs.items())], default=str)
+            groups.setdefault(signature, []).append(call)
+        for group in groups.values():
+            self._execute(group)
+        self._cond.notify_all()
+
+    def _execute(self, calls: List[_GenerateCall]):
+        try:
+            features = np.ascontiguousarray(np.concatenate([call.features for call in calls], axis=0))
+            prompts = [prompt for call in calls for prompt in call.prompts]
+            results = self.model.generate(ctranslate2.StorageView.from_array(features), prompts, **calls[0].kwargs)
+            offset = 0
+            for call in calls:
+                call.result = results[offset:offset + len(call.prompts)]
+                offset += len(call.prompts)
+            self.batches += 1
+            self.batched_windows += len(calls)
+        except BaseException as e:
+            for call in calls:
+                call.error = e
+        finally:
+            for call in calls:
+                call.done = True
+
+    @staticmethod
+    def _storage(features):
+        if isinstance(features, _PendingFeatures):
+            return ctranslate2.StorageView.from_array(np.ascontiguousarray(features.features))
+        return features
@@ -0,0 +1,211 @@
+"""Registre des modèles Whisper : plusieurs tailles sous un budget mémoire, éviction LRU et routage"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from faster_whisper import WhisperModel
+
+# Empreinte mémoire approximative en int8 (Mo) ; doublée en float16
+MODEL_MEMORY_MB = {
+    "tiny": 150,
+    "base": 250,
+    "small": 600,
+    "medium": 1500,
+    "large-v1": 3000,
+    "large-v2": 3000,
+    "large-v3": 3000,
+}
+DEFAULT_MEMORY_MB = 3000
+
+
+class UnknownModel(ValueError):
+    """Modèle absent de la liste servie par ce serveur"""
+
+
+class _ModelSlot:
+    def __init__(self, name: str, memory_mb: int, factory: Optional[Callable[[str], WhisperModel]] = None):
+        self.name = name
+        self.memory_mb = memory_mb
+        self.factory = factory  # Entrée à part (pool de réplicas) : chargée par sa propre fabrique
+        self.model: Optional[WhisperModel] = None
+        self.in_use = 0
+        self.last_used = 0.0
+        self.loading = False
+        self.stats = {
+            "loads": 0,
+            "evictions": 0,
+            "load_seconds": 0.0,
+            "transcriptions": 0,
+            "audio_seconds": 0.0,
+            "processing_seconds": 0.0,
+        }
+
+
+class ModelRegistry:
+    """Charge les modèles à la demande et décharge les moins récemment utilisés pour tenir le budget
+
+    Un modèle en cours d'utilisation n'est jamais déchargé : un chargement qui ne tient pas
+    dans le budget attend qu'un modèle se libère (sauf si aucun autre n'est chargé).
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], WhisperModel],
+        models: List[str],
+        default_model: str,
+        memory_budget_mb: int,
+        memory_factor: float = 1.0,
+        replicas: int = 1,
+        fast_model: Optional[str] = None,
+        short_clip_seconds: float = 60.0,
+        busy_queue_length: int = 4,
+    ):
+        if default_model not in models:
+            models = [default_model] + models
+        self.factory = factory
+        self.default_model = default_model
+        self.memory_budget_mb = memory_budget_mb
+        self.memory_factor = memory_factor
+        # Réplicas chargés par la fabrique (num_workers) : chacun occupe l'empreinte du modèle
+        self.replicas = max(1, replicas)
+        # Routage par latence : clips courts vers le modèle rapide quand la file s'allonge
+        self.fast_model = fast_model if fast_model in models else None
+        self.short_clip_seconds = short_clip_seconds
+        self.busy_queue_length = busy_queue_length
+
+        self._slots: Dict[str, _ModelSlot] = {
+            name: _ModelSlot(name, self._footprint(name, self.replicas))
+            for name in models
+        }
+        self._cond = threading.Condition()
+
+    @property
+    def models(self) -> List[str]:
+        return [name for name, slot in self._slots.items() if slot.factory is None]
+
+    def add_pool(self, name: str, model: str, replicas: int, factory: Callable[[str], WhisperModel]):
+        """Entrée hors routage pour des réplicas dédiés d'un modèle, comptée dans le budget comme les autres"""
+        with self._cond:
+            self._slots[name] = _ModelSlot(name, self._footprint(model, max(1, replicas)), factory)
+
+    def _footprint(self, model: str, replicas: int) -> int:
+        return int(MODEL_MEMORY_MB.get(model, DEFAULT_MEMORY_MB) * replicas * self.memory_factor)
+
+    def resolve(self, requested: Optional[str]) -> str:
+        if not requested:
+            return self.default_model
+        if requested not in self.models:
+            raise UnknownModel(f"Modèle inconnu: {requested} (choix: {', '.join(self.models)})")
+        return requested
+
+    def route(self, requested: Optional[str], duration: Optional[float], queue_length: int, prefer_fast: bool = False) -> str:
+        """Modèle demandé explicitement, sinon politique de latence (prefer_fast : profil de décodage rapide)"""
+        if requested:
+            return self.resolve(requested)
+        if self.fast_model and prefer_fast:
+            return self.fast_model
+        if (
+            self.fast_model
+            and duration is not None
+            and duration <= self.short_clip_seconds
+            and queue_length >= self.busy_queue_length
+        ):
+            return self.fast_model
+        return self.default_model
+
+    def is_loaded(self, name: Optional[str] = None) -> bool:
+        if name is None:
+            return any(slot.model is not None for slot in self._slots.values())
+        slot = self._slots.get(name)
+        return slot is not None and slot.model is not None
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[WhisperModel]:
+        """Modèle (ou pool) chargé et protégé de l'éviction pendant son utilisation"""
+        slot = self._slots.get(name)
+        if slot is None or slot.factory is None:
+            slot = self._slots[self.resolve(name)]
+        with self._cond:
+            slot.in_use += 1
+        try:
+            yield self._ensure_loaded(slot)
+        finally:
+            with self._cond:
+                slot.in_use -= 1
+                slot.last_used = time.time()
+                self._cond.notify_all()
+
+    def record(self, name: str, audio_seconds: float, processing_seconds: float):
+        with self._cond:
+            stats = self._slots[name].stats
+            stats["transcriptions"] += 1
+            stats["audio_seconds"] += audio_seconds
+            stats["processing_seconds"] += processing_seconds
+
+    def _ensure_loaded(self, slot: _ModelSlot) -> WhisperModel:
+        with self._cond:
+            while True:
+                if slot.model is not None:
+                    return slot.model
+                if not slot.loading and self._make_room(slot.memory_mb):
+                    slot.loading = True
+                    break
+                self._cond.wait()
+
+        print(f"Chargement du modèle {slot.name}...")
+        start_time = time.time()
+        try:
+            model = (slot.factory or self.factory)(slot.name)
+        except BaseException:
+            with self._cond:
+                slot.loading = False
+                self._cond.notify_all()
+            raise
+        load_time = time.time() - start_time
+        print(f"OK !!!! Modèle {slot.name} chargé en {load_time:.1f}s!")
+
+        with self._cond:
+            slot.model = model
+            slot.loading = False
+            slot.stats["loads"] += 1
+            slot.stats["load_seconds"] += load_time
+            self._cond.notify_all()
+        return model
+
+    def _used_mb(self) -> int:
+        return sum(slot.memory_mb for slot in self._slots.values() if slot.model is not None or slot.loading)
+
+    def _make_room(self, needed_mb: int) -> bool:
+        """Décharge les modèles inactifs les plus anciens ; False s'il faut attendre (sous verrou)"""
+        idle = sorted(
+            (slot for slot in self._slots.values() if slot.model is not None and slot.in_use == 0),
+            key=lambda slot: slot.last_used,
+        )
+        while self._used_mb() + needed_mb > self.memory_budget_mb and idle:
+            victim = idle.pop(0)
+            print(f"Déchargement du modèle {victim.name} (budget mémoire {self.memory_budget_mb}Mo)")
+            victim.model = None
+            victim.stats["evictions"] += 1
+        # Un modèle plus gros que le budget peut toujours être chargé seul
+        return self._used_mb() + needed_mb <= self.memory_budget_mb or self._used_mb() == 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "default_model": self.default_model,
+                "fast_model": self.fast_model,
+                "memory_budget_mb": self.memory_budget_mb,
+                "memory_used_mb": self._used_mb(),
+                "models": {
+                    name: {
+                        "loaded": slot.model is not None,
+                        "in_use": slot.in_use,
+                        "memory_mb": slot.memory_mb,
+                        "last_used": slot.last_used or None,
+                        **slot.stats,
+                    }
+                    for name, slot in self._slots.items()
+                },
+            }
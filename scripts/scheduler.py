@@ -0,0 +1,341 @@
+"""Ordonnanceur des transcriptions : file bornée, workers dédiés et politiques interchangeables"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class QueueFull(Exception):
+    """La file d'attente a atteint sa taille maximale"""
+
+
+class ScheduledJob:
+    """Travail en attente ou en cours dans l'ordonnanceur"""
+
+    def __init__(self, job_id: str, user_id: str, payload: Dict[str, Any], expected_duration: Optional[float], seq: int):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.payload = payload
+        self.expected_duration = expected_duration  # durée audio en secondes, si connue
+        self.seq = seq
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.queue_position = 0
+        self.future: Future = Future()
+
+
+class FifoPolicy:
+    """Premier arrivé, premier servi"""
+
+    name = "fifo"
+
+    def key(self, job: ScheduledJob, scheduler: "TranscriptionScheduler"):
+        return (job.seq,)
+
+    def on_start(self, job: ScheduledJob, scheduler: "TranscriptionScheduler"):
+        pass
+
+    def on_finish(self, job: ScheduledJob, scheduler: "TranscriptionScheduler", user_has_pending: bool):
+        pass
+
+
+class ShortestJobFirstPolicy(FifoPolicy):
+    """Durée audio la plus courte d'abord, avec vieillissement pour éviter la famine"""
+
+    name = "sjf"
+
+    def __init__(self, aging_factor: float = 0.1):
+        # Chaque seconde d'attente retire aging_factor seconde à la durée attendue
+        self.aging_factor = aging_factor
+
+    def key(self, job: ScheduledJob, scheduler: "TranscriptionScheduler"):
+        waited = time.time() - job.submitted_at
+        return (scheduler.expected_duration(job) - self.aging_factor * waited, job.seq)
+
+
+class FairSharePolicy(FifoPolicy):
+    """Équité par utilisateur : celui qui a consommé le moins d'audio passe en premier"""
+
+    name = "fair"
+
+    def __init__(self):
+        self.usage: Dict[str, float] = {}
+
+    def key(self, job: ScheduledJob, scheduler: "TranscriptionScheduler"):
+        return (self.usage.get(job.user_id, 0.0), job.seq)
+
+    def on_start(self, job: ScheduledJob, scheduler: "TranscriptionScheduler"):
+        self.usage[job.user_id] = self.usage.get(job.user_id, 0.0) + scheduler.expected_duration(job)
+
+    def on_finish(self, job: ScheduledJob, scheduler: "TranscriptionScheduler", user_has_pending: bool):
+        # Un utilisateur sans travail en attente repart de zéro
+        if not user_has_pending:
+            self.usage.pop(job.user_id, None)
+
+
+POLICIES = {
+    FifoPolicy.name: FifoPolicy,
+    ShortestJobFirstPolicy.name: ShortestJobFirstPolicy,
+    FairSharePolicy.name: FairSharePolicy,
+}
+
+
+def make_policy(name: str):
+    if name not in POLICIES:
+        raise ValueError(f"Politique d'ordonnancement inconnue: {name} (choix: {', '.join(POLICIES)})")
+    return POLICIES[name]()
+
+
+class TranscriptionScheduler:
+    """File d'attente bornée servie par des workers dédiés, réveillés par condition"""
+
+    def __init__(
+        self,
+        handler: Callable[[ScheduledJob], Any],
+        workers: int = 1,
+        policy=None,
+        max_queue_size: int = 100,
+        default_duration: float = 300.0,
+        on_worker_start: Optional[Callable[[], None]] = None,
+        batch_handler: Optional[Callable[[List[ScheduledJob]], List[Tuple[Any, Optional[BaseException]]]]] = None,
+        is_batchable: Optional[Callable[[ScheduledJob], bool]] = None,
+        batch_key: Optional[Callable[[ScheduledJob], Any]] = None,
+        max_batch: int = 1,
+        max_batch_wait: float = 0.0,
+        rate_key: Optional[Callable[[ScheduledJob], Any]] = None,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.policy = policy or FifoPolicy()
+        self.max_queue_size = max_queue_size
+        self.default_duration = default_duration
+        self.on_worker_start = on_worker_start
+        # Micro-batching : des jobs regroupables arrivés à moins de max_batch_wait s partent ensemble
+        self.batch_handler = batch_handler
+        self.is_batchable = is_batchable or (lambda job: False)
+        # Seuls les jobs de même clé (ex. même modèle) partagent un lot
+        self.batch_key = batch_key or (lambda job: None)
+        self.max_batch = max(1, max_batch)
+        self.max_batch_wait = max_batch_wait
+        # Secondes de calcul par seconde d'audio (moyenne glissante des jobs terminés), globale et par clé (ex. modèle)
+        self.processing_rate = 0.5
+        self.rate_key = rate_key or (lambda job: None)
+        self.rates: Dict[Any, float] = {}
+
+        self._cond = threading.Condition()
+        self._pending: List[ScheduledJob] = []
+        self._running: Dict[str, ScheduledJob] = {}
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"transcription-worker-{index}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def submit(self, job_id: str, user_id: str, payload: Dict[str, Any], expected_duration: Optional[float] = None) -> ScheduledJob:
+        with self._cond:
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFull(f"File d'attente pleine ({self.max_queue_size} jobs)")
+            job = ScheduledJob(job_id, user_id, payload, expected_duration, next(self._seq))
+            self._pending.append(job)
+            job.queue_position = self._rank(job)
+            # Réveille aussi un worker qui attend de compléter un lot
+            self._cond.notify_all()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        with self._cond:
+            for job in self._pending:
+                if job.job_id == job_id:
+                    self._pending.remove(job)
+                    job.future.cancel()
+                    return True
+        return False
+
+    def expected_duration(self, job: ScheduledJob) -> float:
+        return job.expected_duration if job.expected_duration is not None else self.default_duration
+
+    def rate_for(self, key: Any) -> float:
+        return self.rates.get(key, self.processing_rate)
+
+    def expected_runtime(self, job: ScheduledJob) -> float:
+        return self.expected_duration(job) * self.rate_for(self.rate_key(job))
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Positions réelles et heures de démarrage et de fin estimées de chaque job"""
+        with self._cond:
+            running, pending = self._plan(self._ordered_pending())
+            return {
+                "policy": self.policy.name,
+                "workers": self.workers,
+                "max_queue_size": self.max_queue_size,
+                "processing_rate": self.processing_rate,
+                "rates": {str(key): rate for key, rate in self.rates.items()},
+                "running": running,
+                "pending": pending,
+            }
+
+    def estimate(self, user_id: str, payload: Dict[str, Any], expected_duration: Optional[float] = None) -> Dict[str, Any]:
+        """Position et heures de démarrage et de fin qu'aurait un job soumis maintenant (sans le soumettre)"""
+        with self._cond:
+            candidate = ScheduledJob("", user_id, payload, expected_duration, next(self._seq))
+            ordered = sorted(self._pending + [candidate], key=lambda job: self.policy.key(job, self))
+            _, pending = self._plan(ordered)
+            return pending[ordered.index(candidate)]
+
+    def _plan(self, ordered: List[ScheduledJob]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Simulation des workers : chaque job en attente part sur le premier worker libre (sous verrou)"""
+        now = time.time()
+        # Disponibilité estimée de chaque worker
+        available = [now] * self.workers
+        running = []
+        for index, job in enumerate(self._running.values()):
+            expected_end = job.started_at + self.expected_runtime(job)
+            if index < self.workers:
+                available[index] = max(now, expected_end)
+            running.append({
+                "job_id": job.job_id,
+                "started_at": job.started_at,
+                "expected_end": expected_end,
+            })
+        pending = []
+        for position, job in enumerate(ordered, start=1):
+            worker = min(range(self.workers), key=lambda i: available[i])
+            expected_start = available[worker]
+            available[worker] = expected_start + self.expected_runtime(job)
+            pending.append({
+                "job_id": job.job_id,
+                "position": position,
+                "submitted_at": job.submitted_at,
+                "expected_start": expected_start,
+                "expected_end": available[worker],
+                "expected_duration": job.expected_duration,
+            })
+        return running, pending
+
+    def position(self, job_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.snapshot()
+        for entry in snapshot["running"]:
+            if entry["job_id"] == job_id:
+                return {"position": 0, **entry}
+        for entry in snapshot["pending"]:
+            if entry["job_id"] == job_id:
+                return entry
+        return None
+
+    def _ordered_pending(self) -> List[ScheduledJob]:
+        return sorted(self._pending, key=lambda job: self.policy.key(job, self))
+
+    def _rank(self, job: ScheduledJob) -> int:
+        return self._ordered_pending().index(job) + 1
+
+    def _worker_loop(self):
+        if self.on_worker_start:
+            try:
+                self.on_worker_start()
+            except Exception as e:
+                print(f"!!! Erreur initialisation worker: {e} !!!")
+
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = min(self._pending, key=lambda pending_job: self.policy.key(pending_job, self))
+                self._pending.remove(job)
+                batch = [job]
+                if self.batch_handler and self.max_batch > 1 and self.is_batchable(job):
+                    self._fill_batch(batch)
+
+                started = []
+                now = time.time()
+                for batch_job in batch:
+                    if not batch_job.future.set_running_or_notify_cancel():
+                        continue
+                    batch_job.started_at = now
+                    self._running[batch_job.job_id] = batch_job
+                    self.policy.on_start(batch_job, self)
+                    started.append(batch_job)
+
+            if not started:
+                continue
+            if len(started) == 1:
+                self._run_single(started[0])
+            else:
+                self._run_batch(started)
+
+    def _fill_batch(self, batch: List[ScheduledJob]):
+        """Complète le lot avec d'autres jobs regroupables (sous verrou)"""
+        deadline = batch[0].submitted_at + self.max_batch_wait
+        key = self.batch_key(batch[0])
+        while True:
+            for candidate in self._ordered_pending():
+                if len(batch) >= self.max_batch:
+                    break
+                if self.is_batchable(candidate) and self.batch_key(candidate) == key:
+                    self._pending.remove(candidate)
+                    batch.append(candidate)
+            remaining = deadline - time.time()
+            if len(batch) >= self.max_batch or remaining <= 0 or self._stopping:
+                return
+            self._cond.wait(remaining)
+
+    def _run_single(self, job: ScheduledJob):
+        try:
+            job.future.set_result(self.handler(job))
+        except BaseException as e:
+            job.future.set_exception(e)
+        finally:
+            self._finish([job], time.time() - job.started_at)
+
+    def _run_batch(self, jobs: List[ScheduledJob]):
+        try:
+            outcomes = self.batch_handler(jobs)
+        except BaseException as e:
+            outcomes = [(None, e)] * len(jobs)
+        try:
+            for job, (result, error) in zip(jobs, outcomes):
+                if error is not None:
+                    job.future.set_exception(error)
+                else:
+                    job.future.set_result(result)
+        finally:
+            self._finish(jobs, time.time() - jobs[0].started_at)
+
+    def _finish(self, jobs: List[ScheduledJob], elapsed: float):
+        with self._cond:
+            for job in jobs:
+                self._running.pop(job.job_id, None)
+            # Un lot compte comme un seul passage pour l'ensemble de ses durées
+            durations = [job.expected_duration for job in jobs if job.expected_duration]
+            if durations:
+                sample = elapsed / sum(durations)
+                # Les jobs d'un lot partagent la même clé ; une clé encore sans mesure part de la moyenne globale
+                key = self.rate_key(jobs[0])
+                self.rates[key] = 0.8 * self.rate_for(key) + 0.2 * sample
+                self.processing_rate = 0.8 * self.processing_rate + 0.2 * sample
+            for job in jobs:
+                user_has_pending = any(pending.user_id == job.user_id for pending in self._pending)
+                self.policy.on_finish(job, self, user_has_pending)
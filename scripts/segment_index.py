@@ -0,0 +1,230 @@
+"""Index des segments des transcriptions en cache : pages, plages de temps et recherche plein texte
+
+Une transcription y est identifiée par sa clé de cache. Les lectures ne touchent que les segments
+demandés (index sur le début de segment), la recherche passe par une table FTS5. Un autre encodage
+du même audio est un alias de la transcription déjà indexée : ses segments ne sont pas dupliqués.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+INDEX_FILENAME = "segments.sqlite3"
+
+
+class SegmentIndex:
+    def __init__(self, index_dir: Path):
+        Path(index_dir).mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(Path(index_dir) / INDEX_FILENAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS transcripts (
+                transcript_id TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                filename TEXT,
+                model TEXT,
+                profile TEXT,
+                language TEXT,
+                duration REAL,
+                segment_count INTEGER NOT NULL,
+                max_segment_seconds REAL NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                transcript_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL,
+                text TEXT NOT NULL
+            )"""
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS aliases (
+                alias_id TEXT PRIMARY KEY,
+                transcript_id TEXT NOT NULL,
+                file_hash TEXT NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS aliases_transcript ON aliases (transcript_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS segments_position ON segments (transcript_id, position)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS segments_start ON segments (transcript_id, start)")
+        # Table FTS adossée à segments (pas de copie du texte), tenue à jour par triggers
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5("
+            "text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        self._db.execute(
+            """CREATE TRIGGER IF NOT EXISTS segments_fts_insert AFTER INSERT ON segments BEGIN
+                INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+            END"""
+        )
+        self._db.execute(
+            """CREATE TRIGGER IF NOT EXISTS segments_fts_delete AFTER DELETE ON segments BEGIN
+                INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END"""
+        )
+        self._db.commit()
+
+    def add(self, transcript_id: str, file_hash: str, result: Dict[str, Any]):
+        """Indexe un résultat, à la place de la version précédente de cette transcription"""
+        segments = result.get("segments") or []
+        metadata, info = result.get("metadata", {}), result.get("info", {})
+        max_segment = max((segment["end"] - segment["start"] for segment in segments), default=0.0)
+        with self._lock:
+            self._db.execute("DELETE FROM aliases WHERE alias_id = ?", (transcript_id,))
+            self._db.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO transcripts (transcript_id, file_hash, filename, model, profile, language, duration, segment_count, max_segment_seconds, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (transcript_id, file_hash, metadata.get("filename"), metadata.get("model"), metadata.get("decoding_profile"),
+                 info.get("language"), info.get("duration"), len(segments), max(0.0, max_segment), time.time()),
+            )
+            self._db.executemany(
+                "INSERT INTO segments (transcript_id, position, start, end, text) VALUES (?, ?, ?, ?, ?)",
+                ((transcript_id, position, segment["start"], segment["end"], segment["text"]) for position, segment in enumerate(segments)),
+            )
+            self._db.commit()
+
+    def add_alias(self, alias_id: str, file_hash: str, transcript_id: str) -> bool:
+        """alias_id désigne la transcription transcript_id (même audio) ; False si celle-ci n'est pas indexée"""
+        with self._lock:
+            transcript_id = self._resolve(transcript_id)
+            if transcript_id is None:
+                return False
+            if alias_id != transcript_id:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO aliases (alias_id, transcript_id, file_hash) VALUES (?, ?, ?)",
+                    (alias_id, transcript_id, file_hash),
+                )
+                self._db.commit()
+        return True
+
+    def remove(self, transcript_id: str):
+        """Retire une transcription ; ses segments passent au premier de ses alias encore en cache"""
+        with self._lock:
+            self._db.execute("DELETE FROM aliases WHERE alias_id = ?", (transcript_id,))
+            heir = self._db.execute("SELECT alias_id, file_hash FROM aliases WHERE transcript_id = ? LIMIT 1", (transcript_id,)).fetchone()
+            if heir is None:
+                self._db.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+                self._db.execute("DELETE FROM transcripts WHERE transcript_id = ?", (transcript_id,))
+            else:
+                heir_id, heir_hash = heir
+                self._db.execute("DELETE FROM aliases WHERE alias_id = ?", (heir_id,))
+                self._db.execute("UPDATE transcripts SET transcript_id = ?, file_hash = ? WHERE transcript_id = ?", (heir_id, heir_hash, transcript_id))
+                self._db.execute("UPDATE segments SET transcript_id = ? WHERE transcript_id = ?", (heir_id, transcript_id))
+                self._db.execute("UPDATE aliases SET transcript_id = ? WHERE transcript_id = ?", (heir_id, transcript_id))
+            self._db.commit()
+
+    def _resolve(self, transcript_id: str) -> Optional[str]:
+        """Transcription indexée que désigne cet identifiant (sous verrou)"""
+        if self._db.execute("SELECT 1 FROM transcripts WHERE transcript_id = ?", (transcript_id,)).fetchone():
+            return transcript_id
+        row = self._db.execute("SELECT transcript_id FROM aliases WHERE alias_id = ?", (transcript_id,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, entries: Dict[str, str], load: Callable[[str], Optional[Dict[str, Any]]]) -> int:
+        """Aligne l'index sur le cache (clé -> hash) : entrées écrites sans le serveur, évictions manquées"""
+        with self._lock:
+            indexed = {row[0] for row in self._db.execute("SELECT transcript_id FROM transcripts UNION ALL SELECT alias_id FROM aliases")}
+        for transcript_id in indexed - entries.keys():
+            self.remove(transcript_id)
+        added = 0
+        for transcript_id in entries.keys() - indexed:
+            result = load(transcript_id)
+            if result is not None:
+                self.add(transcript_id, entries[transcript_id], result)
+                added += 1
+        return added
+
+    def segments(self, transcript_id: str, start: Optional[float] = None, end: Optional[float] = None, offset: int = 0, limit: int = 100) -> Optional[Dict[str, Any]]:
+        """Page de segments, limitée aux segments qui recoupent [start, end] ; None si la transcription n'est pas indexée"""
+        with self._lock:
+            indexed_id = self._resolve(transcript_id)
+            if indexed_id is None:
+                return None
+            filename, model, profile, language, duration, segment_count, max_segment = self._db.execute(
+                "SELECT filename, model, profile, language, duration, segment_count, max_segment_seconds FROM transcripts WHERE transcript_id = ?",
+                (indexed_id,),
+            ).fetchone()
+            if start is None and end is None:
+                total = segment_count
+                rows = self._db.execute(
+                    "SELECT position, start, end, text FROM segments WHERE transcript_id = ? AND position >= ? ORDER BY position LIMIT ?",
+                    (indexed_id, offset, limit),
+                ).fetchall()
+            else:
+                # Un segment qui recoupe la plage commence au plus max_segment secondes avant elle
+                low = (start if start is not None else 0.0) - max_segment
+                high = end if end is not None else float("inf")
+                where = "transcript_id = ? AND start >= ? AND start <= ? AND end >= ?"
+                params = (indexed_id, low, high, start if start is not None else float("-inf"))
+                total = self._db.execute(f"SELECT COUNT(*) FROM segments WHERE {where}", params).fetchone()[0]
+                rows = self._db.execute(
+                    f"SELECT position, start, end, text FROM segments WHERE {where} ORDER BY start LIMIT ? OFFSET ?",
+                    params + (limit, offset),
+                ).fetchall()
+        return {
+            "transcript_id": transcript_id,
+            "filename": filename,
+            "model": model,
+            "decoding_profile": profile,
+            "language": language,
+            "duration": duration,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "segments": [{"index": position, "start": seg_start, "end": seg_end, "text": text} for position, seg_start, seg_end, text in rows],
+        }
+
+    def search(self, query: str, language: Optional[str] = None, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """Segments contenant tous les mots de la requête, les plus pertinents d'abord"""
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT s.transcript_id, t.filename, t.language, s.position, s.start, s.end, s.text,"
+            " highlight(segments_fts, 0, '<mark>', '</mark>')"
+            " FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid JOIN transcripts t ON t.transcript_id = s.transcript_id"
+            " WHERE segments_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if language:
+            sql += " AND t.language = ?"
+            params.append(language)
+        sql += " ORDER BY rank LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [
+            {"transcript_id": transcript_id, "filename": filename, "language": segment_language, "index": position,
+             "start": start, "end": end, "text": text, "highlight": highlight}
+            for transcript_id, filename, segment_language, position, start, end, text, highlight in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            transcripts, segments = self._db.execute("SELECT COUNT(*), COALESCE(SUM(segment_count), 0) FROM transcripts").fetchone()
+            aliases = self._db.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+        return {"transcripts": transcripts, "aliases": aliases, "segments": segments}
+
+
+def fts_query(query: str) -> str:
+    """Requête FTS5 où chaque mot est littéral (guillemets, opérateurs et * de l'utilisateur sans effet)"""
+    words = [word.replace('"', '""') for word in query.split()]
+    return " ".join(f'"{word}"' for word in words if word.strip('"'))
+
+
+def page_segments(segments: Iterable[Dict[str, Any]], start: Optional[float] = None, end: Optional[float] = None, offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    """Même découpage que SegmentIndex.segments, sur une liste déjà en mémoire"""
+    selected = [
+        {"index": position, **segment}
+        for position, segment in enumerate(segments)
+        if (start is None or segment["end"] >= start) and (end is None or segment["start"] <= end)
+    ]
+    return {"total": len(selected), "offset": offset, "limit": limit, "segments": selected[offset:offset + limit]}
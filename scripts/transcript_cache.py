@@ -0,0 +1,525 @@
+"""Cache des transcriptions : index SQLite, LRU en mémoire et budget disque avec éviction en arrière-plan"""
+
+import gzip
+import hashlib
+import json
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from audio_fingerprint import is_audio_prefix, is_same_audio
+
+INDEX_FILENAME = "index.sqlite3"
+ENTRY_SUFFIX = ".rtx"
+# Écart de durée toléré entre deux encodages d'un même audio (délai et remplissage des codecs)
+FINGERPRINT_DURATION_TOLERANCE = 0.5
+FINGERPRINT_ORPHAN_TTL = 24 * 3600  # Empreinte sans transcription en cache (job échoué...)
+# Versions précédentes d'un enregistrement : début comparé avant l'empreinte entière, candidats bornés
+PREFIX_HEAD_FRAMES = 2400  # 60 s
+PREFIX_MAX_CANDIDATES = 20
+HIT_FLUSH_ENTRIES = 256  # Clés consultées gardées en mémoire avant écriture dans l'index
+
+# Format compact : MAGIC + version, puis bloc zlib
+#   en-tête <III : nb segments, taille JSON des métadonnées, taille du bloc texte
+#   métadonnées JSON (résultat sans les segments)
+#   débuts float64, fins float64, longueurs uint32, textes UTF-8 concaténés
+FORMAT_MAGIC = b"RTXC"
+FORMAT_VERSION = 1
+SEGMENT_KEYS = {"start", "end", "text"}
+
+
+def encode_result(result: Dict[str, Any]) -> bytes:
+    """Sérialise un résultat avec les segments rangés par colonnes"""
+    segments: List[Dict[str, Any]] = result.get("segments") or []
+    columnar = all(set(segment) == SEGMENT_KEYS for segment in segments)
+    meta = {key: value for key, value in result.items() if key != "segments"}
+    if not columnar:
+        meta["segments"] = segments
+        segments = []
+
+    texts = [segment["text"].encode("utf-8") for segment in segments]
+    # Le texte complet est reconstruit à la lecture quand il suit les segments
+    if columnar and meta.get("text") == " ".join(segment["text"] for segment in segments).strip():
+        meta.pop("text")
+        meta["_text_from_segments"] = True
+    meta_json = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    text_blob = b"".join(texts)
+
+    count = len(segments)
+    payload = b"".join([
+        struct.pack("<III", count, len(meta_json), len(text_blob)),
+        meta_json,
+        struct.pack(f"<{count}d", *(segment["start"] for segment in segments)),
+        struct.pack(f"<{count}d", *(segment["end"] for segment in segments)),
+        struct.pack(f"<{count}I", *(len(text) for text in texts)),
+        text_blob,
+    ])
+    return FORMAT_MAGIC + bytes([FORMAT_VERSION]) + zlib.compress(payload, 6)
+
+
+def decode_result(data: bytes) -> Dict[str, Any]:
+    """Lit le format compact, ou un ancien fichier JSON"""
+    if not data.startswith(FORMAT_MAGIC):
+        return json.loads(data.decode("utf-8"))
+    version = data[len(FORMAT_MAGIC)]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Version de format de cache inconnue: {version}")
+
+    payload = zlib.decompress(data[len(FORMAT_MAGIC) + 1:])
+    count, meta_len, text_len = struct.unpack_from("<III", payload, 0)
+    offset = 12
+    meta = json.loads(payload[offset:offset + meta_len].decode("utf-8"))
+    offset += meta_len
+    starts = struct.unpack_from(f"<{count}d", payload, offset)
+    offset += 8 * count
+    ends = struct.unpack_from(f"<{count}d", payload, offset)
+    offset += 8 * count
+    lengths = struct.unpack_from(f"<{count}I", payload, offset)
+    offset += 4 * count
+    text_blob = payload[offset:offset + text_len]
+
+    segments = []
+    position = 0
+    for start, end, length in zip(starts, ends, lengths):
+        segments.append({"start": start, "end": end, "text": text_blob[position:position + length].decode("utf-8")})
+        position += length
+
+    result = {}
+    for key, value in meta.items():
+        if key == "_text_from_segments":
+            result["text"] = " ".join(segment["text"] for segment in segments).strip()
+        else:
+            result[key] = value
+    if "segments" not in result:
+        result["segments"] = segments
+    return result
+
+
+def encode_response_body(result: Dict[str, Any]) -> bytes:
+    """Corps JSON compressé en gzip, identique à celui de JSONResponse"""
+    body = json.dumps(result, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+    return gzip.compress(body, compresslevel=6)
+
+
+def make_cache_key(file_hash: str, model: str, language: str, params: Dict[str, Any]) -> str:
+    """Clé de cache : contenu + modèle + langue + paramètres de décodage"""
+    material = json.dumps(
+        {"file_hash": file_hash, "model": model, "language": language, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    """Résultats de transcription indexés sur disque, servis en O(1)"""
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_bytes: int,
+        hot_entries: int = 64,
+        eviction_policy: str = "lru",
+        eviction_interval: float = 60.0,
+        legacy_params: Optional[Dict[str, Any]] = None,
+        on_remove: Optional[Callable[[str], None]] = None,
+    ):
+        if eviction_policy not in ("lru", "lfu"):
+            raise ValueError(f"Politique d'éviction inconnue: {eviction_policy}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hot_entries = hot_entries
+        self.eviction_policy = eviction_policy
+        self.eviction_interval = eviction_interval
+        self.on_remove = on_remove  # Appelé avec la clé de chaque entrée supprimée (éviction comprise)
+
+        self._lock = threading.Lock()
+        self._hot: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._hot_bodies: Dict[str, bytes] = {}
+        # Consultations pas encore écrites dans l'index : clé -> (dernier hit, nombre de hits)
+        self._pending_hits: Dict[str, Tuple[float, int]] = {}
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.counters = {"hits": 0, "hot_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "evicted_bytes": 0, "fingerprint_hits": 0, "fingerprint_misses": 0, "prefix_hits": 0}
+
+        self._db = sqlite3.connect(str(self.cache_dir / INDEX_FILENAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                model TEXT,
+                language TEXT,
+                params TEXT,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_hit_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_hit ON entries(last_hit_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_file_hash ON entries(file_hash)")
+        # Empreintes acoustiques des fichiers reçus, par hash : un ré-encodage retrouve la transcription
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS fingerprints (
+                file_hash TEXT PRIMARY KEY,
+                duration REAL NOT NULL,
+                fingerprint BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fingerprints_duration ON fingerprints(duration)")
+        self._db.commit()
+        if legacy_params is not None:
+            self._migrate_legacy_entries(legacy_params)
+
+    # --- Lecture / écriture ---
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        result, hot = self._load(key)
+        with self._lock:
+            if result is None:
+                self.counters["misses"] += 1
+            else:
+                self.counters["hits"] += 1
+                if hot:
+                    self.counters["hot_hits"] += 1
+        return result
+
+    def _load(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Résultat et provenance (mémoire ou disque), sans compter de hit ni de miss"""
+        with self._lock:
+            result = self._hot.get(key)
+            if result is not None:
+                self._hot.move_to_end(key)
+                self._touch(key)
+                return result, True
+            row = self._db.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            return None, False
+
+        try:
+            result = self._read_entry(self.cache_dir / row[0])
+            if not row[0].endswith(ENTRY_SUFFIX):
+                self._upgrade_entry(key, row[0], result)
+        except Exception as e:
+            print(f"!!! Erreur lecture cache: {e} !!!")
+            self.remove(key)
+            return None, False
+
+        with self._lock:
+            self._touch(key)
+            self._remember(key, result)
+        return result, False
+
+    def get_gzip_body(self, key: str) -> Optional[bytes]:
+        """Réponse pré-encodée et pré-compressée, gardée avec le résultat en mémoire"""
+        result = self.get(key)
+        if result is None:
+            return None
+        with self._lock:
+            body = self._hot_bodies.get(key)
+        if body is None:
+            body = encode_response_body(result)
+            with self._lock:
+                if key in self._hot:
+                    self._hot_bodies[key] = body
+        return body
+
+    def put(self, key: str, result: Dict[str, Any], file_hash: str, model: str, language: str, params: Dict[str, Any]):
+        filename = f"{key}{ENTRY_SUFFIX}"
+        size = self._write_entry(self.cache_dir / filename, result)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, file_hash, model, language, params, path, size, created_at, last_hit_at, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, file_hash, model, language, json.dumps(params, sort_keys=True), filename, size, now, now),
+            )
+            self._db.commit()
+            self._pending_hits.pop(key, None)
+            self.counters["writes"] += 1
+            self._remember(key, result)
+        if self.total_bytes() > self.max_bytes:
+            self._wakeup.set()
+
+    def remove(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT path, file_hash FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if row:
+                # L'empreinte part avec la dernière transcription de ce fichier
+                self._db.execute(
+                    "DELETE FROM fingerprints WHERE file_hash = ? AND NOT EXISTS (SELECT 1 FROM entries WHERE file_hash = ?)",
+                    (row[1], row[1]),
+                )
+            self._db.commit()
+            self._pending_hits.pop(key, None)
+            self._hot.pop(key, None)
+            self._hot_bodies.pop(key, None)
+        if row:
+            (self.cache_dir / row[0]).unlink(missing_ok=True)
+            if self.on_remove is not None:
+                self.on_remove(key)
+
+    def keys(self) -> Dict[str, str]:
+        """Clé -> hash du fichier de chaque entrée"""
+        with self._lock:
+            return dict(self._db.execute("SELECT key, file_hash FROM entries").fetchall())
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Lecture sans effet sur les statistiques, l'ordre d'éviction ni la mémoire"""
+        with self._lock:
+            result = self._hot.get(key)
+            row = self._db.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+        if result is not None or row is None:
+            return result
+        try:
+            return self._read_entry(self.cache_dir / row[0])
+        except Exception:
+            return None
+
+    # --- Empreintes acoustiques ---
+
+    def put_fingerprint(self, file_hash: str, fingerprint: bytes, duration: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO fingerprints (file_hash, duration, fingerprint, created_at) VALUES (?, ?, ?, ?)",
+                (file_hash, duration, fingerprint, time.time()),
+            )
+            self._db.commit()
+
+    def get_by_fingerprint(self, fingerprint: bytes, duration: float, file_hash: str, language: str, conditions: List[Tuple[str, Dict[str, Any]]]) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+        """Transcription d'un autre fichier au même contenu audio, dans la première des conditions
+        (modèle, paramètres) qui en a une ; renvoie l'indice de la condition, la clé et le résultat"""
+        tolerance = FINGERPRINT_DURATION_TOLERANCE + duration * 0.001
+        for index, (model, params) in enumerate(conditions):
+            # Seuls les fichiers de durée voisine déjà transcrits dans ces conditions sont comparés
+            with self._lock:
+                candidates = self._db.execute(
+                    "SELECT e.key, f.fingerprint FROM fingerprints f JOIN entries e ON e.file_hash = f.file_hash"
+                    " WHERE f.duration BETWEEN ? AND ? AND f.file_hash != ? AND e.model = ? AND e.language = ? AND e.params = ?",
+                    (duration - tolerance, duration + tolerance, file_hash, model, language, json.dumps(params, sort_keys=True)),
+                ).fetchall()
+
+            for key, candidate in candidates:
+                if not is_same_audio(fingerprint, candidate):
+                    continue
+                result, _ = self._load(key)
+                if result is not None:
+                    with self._lock:
+                        self.counters["fingerprint_hits"] += 1
+                    return index, key, result
+        with self._lock:
+            self.counters["fingerprint_misses"] += 1
+        return None
+
+    def get_by_prefix(self, fingerprint: bytes, duration: float, file_hash: str, language: str, conditions: List[Tuple[str, Dict[str, Any]]], min_duration: float) -> Optional[Tuple[int, str, float, Dict[str, Any]]]:
+        """Transcription d'une version plus courte du même enregistrement (même début d'audio), la plus
+        longue d'abord ; renvoie l'indice de la condition, le hash et la durée de cette version, le résultat"""
+        tolerance = FINGERPRINT_DURATION_TOLERANCE + duration * 0.001
+        for index, (model, params) in enumerate(conditions):
+            with self._lock:
+                candidates = self._db.execute(
+                    "SELECT e.key, f.file_hash, f.duration, substr(f.fingerprint, 1, ?) FROM fingerprints f JOIN entries e ON e.file_hash = f.file_hash"
+                    " WHERE f.duration BETWEEN ? AND ? AND f.file_hash != ? AND e.model = ? AND e.language = ? AND e.params = ?"
+                    " ORDER BY f.duration DESC LIMIT ?",
+                    (PREFIX_HEAD_FRAMES * 2, min_duration, duration - tolerance, file_hash, model, language, json.dumps(params, sort_keys=True), PREFIX_MAX_CANDIDATES),
+                ).fetchall()
+
+            for key, candidate_hash, candidate_duration, head in candidates:
+                # L'empreinte entière n'est lue que pour les candidats dont la première minute correspond
+                if not is_audio_prefix(head, fingerprint):
+                    continue
+                with self._lock:
+                    row = self._db.execute("SELECT fingerprint FROM fingerprints WHERE file_hash = ?", (candidate_hash,)).fetchone()
+                if row is None or not is_audio_prefix(row[0], fingerprint):
+                    continue
+                result, _ = self._load(key)
+                if result is not None:
+                    with self._lock:
+                        self.counters["prefix_hits"] += 1
+                    return index, candidate_hash, candidate_duration, result
+        return None
+
+    def remove_orphan_fingerprints(self) -> int:
+        """Empreintes restées sans transcription en cache"""
+        limit = time.time() - FINGERPRINT_ORPHAN_TTL
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM fingerprints WHERE created_at < ? AND NOT EXISTS (SELECT 1 FROM entries WHERE entries.file_hash = fingerprints.file_hash)",
+                (limit,),
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    def _read_entry(self, path: Path) -> Dict[str, Any]:
+        with open(path, 'rb') as f:
+            return decode_result(f.read())
+
+    def _write_entry(self, path: Path, result: Dict[str, Any]) -> int:
+        """Écriture atomique au format compact, retourne la taille sur disque"""
+        data = encode_result(result)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        tmp_path.replace(path)
+        return len(data)
+
+    def _upgrade_entry(self, key: str, old_filename: str, result: Dict[str, Any]):
+        """Réécrit une entrée JSON au format compact lors de sa première lecture"""
+        filename = f"{key}{ENTRY_SUFFIX}"
+        size = self._write_entry(self.cache_dir / filename, result)
+        with self._lock:
+            self._db.execute("UPDATE entries SET path = ?, size = ? WHERE key = ?", (filename, size, key))
+            self._db.commit()
+        (self.cache_dir / old_filename).unlink(missing_ok=True)
+
+    def _touch(self, key: str):
+        """Consultation notée en mémoire (sous verrou) : un hit n'écrit pas dans l'index"""
+        _, hits = self._pending_hits.get(key, (0.0, 0))
+        self._pending_hits[key] = (time.time(), hits + 1)
+        if len(self._pending_hits) >= HIT_FLUSH_ENTRIES:
+            self._write_hits()
+
+    def flush_hits(self):
+        """Écrit les consultations en attente dans l'index (avant éviction, à l'arrêt)"""
+        with self._lock:
+            self._write_hits()
+
+    def _write_hits(self):
+        if not self._pending_hits:
+            return
+        self._db.executemany(
+            "UPDATE entries SET last_hit_at = MAX(last_hit_at, ?), hits = hits + ? WHERE key = ?",
+            ((last_hit_at, hits, key) for key, (last_hit_at, hits) in self._pending_hits.items()),
+        )
+        self._db.commit()
+        self._pending_hits.clear()
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        self._hot[key] = result
+        self._hot.move_to_end(key)
+        self._hot_bodies.pop(key, None)
+        while len(self._hot) > self.hot_entries:
+            evicted_key, _ = self._hot.popitem(last=False)
+            self._hot_bodies.pop(evicted_key, None)
+
+    # --- Éviction ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._eviction_loop, name="cache-eviction", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        self.flush_hits()
+
+    def _eviction_loop(self):
+        while not self._stopping:
+            self._wakeup.wait(self.eviction_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                self.flush_hits()
+                self.evict()
+                self.remove_orphan_fingerprints()
+            except Exception as e:
+                print(f"!!! Erreur éviction cache: {e} !!!")
+
+    def evict(self, target_bytes: Optional[int] = None) -> int:
+        """Supprime les entrées les moins utiles jusqu'à repasser sous 90 % du budget"""
+        total = self.total_bytes()
+        if target_bytes is None:
+            if total <= self.max_bytes:
+                return 0
+            target_bytes = int(self.max_bytes * 0.9)
+
+        order = "last_hit_at ASC" if self.eviction_policy == "lru" else "hits ASC, last_hit_at ASC"
+        with self._lock:
+            # L'ordre d'éviction tient compte des consultations encore en mémoire
+            self._write_hits()
+            rows = self._db.execute(f"SELECT key, size FROM entries ORDER BY {order}").fetchall()
+
+        evicted = 0
+        for key, size in rows:
+            if total <= target_bytes:
+                break
+            self.remove(key)
+            total -= size
+            evicted += 1
+            with self._lock:
+                self.counters["evictions"] += 1
+                self.counters["evicted_bytes"] += size
+        return evicted
+
+    def remove_older_than(self, max_age_seconds: float) -> int:
+        """Supprime les entrées non consultées depuis max_age_seconds"""
+        limit = time.time() - max_age_seconds
+        with self._lock:
+            self._write_hits()
+            rows = self._db.execute("SELECT key FROM entries WHERE last_hit_at < ?", (limit,)).fetchall()
+        for (key,) in rows:
+            self.remove(key)
+        return len(rows)
+
+    # --- Statistiques ---
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            fingerprints = self._db.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+            counters = dict(self.counters)
+            hot = len(self._hot)
+        lookups = counters["hits"] + counters["misses"]
+        # Recherches par empreinte : seulement après un miss sur le hash des octets
+        fingerprint_lookups = counters["fingerprint_hits"] + counters["fingerprint_misses"]
+        return {
+            **counters,
+            "hit_ratio": counters["hits"] / lookups if lookups else 0.0,
+            "fingerprint_hit_ratio": counters["fingerprint_hits"] / fingerprint_lookups if fingerprint_lookups else 0.0,
+            "fingerprints": fingerprints,
+            "entries": entries,
+            "hot_entries": hot,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "eviction_policy": self.eviction_policy,
+        }
+
+    # --- Migration ---
+
+    def _migrate_legacy_entries(self, legacy_params: Dict[str, Any]):
+        """Indexe les anciens fichiers <sha256>.json (clé = hash du fichier seul) avec les paramètres fournis"""
+        with self._lock:
+            known = {row[0] for row in self._db.execute("SELECT path FROM entries")}
+        migrated = 0
+        for path in list(self.cache_dir.glob("*.json")):
+            if path.name in known:
+                continue
+            try:
+                result = self._read_entry(path)
+            except Exception:
+                continue
+            file_hash = path.stem
+            model = result.get("metadata", {}).get("model", "unknown")
+            language = result.get("info", {}).get("language", "auto")
+            self.put(make_cache_key(file_hash, model, language, legacy_params), result, file_hash, model, language, legacy_params)
+            path.unlink(missing_ok=True)
+            migrated += 1
+        if migrated:
+            print(f"Cache: {migrated} ancienne(s) entrée(s) migrée(s)")
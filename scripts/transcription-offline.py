@@ -0,0 +1,219 @@
+"""Transcription hors ligne d'un dossier ou d'une archive, sans passer par le serveur
+
+    python scripts/transcription-offline.py corpus/ -o transcriptions/ --language fr --workers 4
+
+Un process par worker, chacun avec son modèle. Les résultats partagent le cache du serveur
+(même clé, mêmes profils de décodage) et un fichier déjà transcrit dans le dossier de sortie
+est ignoré : relancer la commande après une interruption reprend là où elle s'était arrêtée.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import ctranslate2
+from faster_whisper import WhisperModel, decode_audio
+
+from audio_preprocessing import SAMPLING_RATE
+from decoding import DECODING_PROFILES, DEFAULT_PROFILE, PROFILE_ORDER, at_least_as_accurate
+from transcript_cache import TranscriptCache, make_cache_key
+from transcription_result import build_result, format_segment
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+CACHE_DIR = PROJECT_DIR / "cache"
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "medium")
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".flac", ".webm", ".mp4", ".mkv", ".wma"}
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Modèle du process worker (chargé une fois par process)
+_model: Optional[WhisperModel] = None
+_model_name = DEFAULT_MODEL
+_device = "cpu"
+
+
+def _init_worker(model_name: str, device: str, compute_type: str, cpu_threads: int):
+    global _model, _model_name, _device
+    _model_name, _device = model_name, device
+    _model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _transcribe(path: str, filename: str, language: str, profile: str) -> Dict[str, Any]:
+    """Transcription d'un fichier dans un worker ; même forme de résultat que le serveur"""
+    file_size = os.path.getsize(path)
+    audio = decode_audio(path, sampling_rate=SAMPLING_RATE)
+    start_time = time.time()
+    segments_gen, info = _model.transcribe(
+        audio,
+        language=language if language != "auto" else None,
+        **DECODING_PROFILES[profile].options
+    )
+    segments = [format_segment(segment) for segment in segments_gen]
+    processing_time = time.time() - start_time
+    return build_result(segments, info, len(audio) / SAMPLING_RATE, processing_time, file_size, {
+        "filename": filename,
+        "model": _model_name,
+        "decoding_profile": profile,
+        "device": _device,
+        "processing_mode": "offline",
+        "long_file_mode": False,
+        "batch_size": 1,
+        "resumed_from": 0.0,
+        "user_id": "offline",
+        "queue_position": 0
+    })
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def discover(source: Path, extract_dir: Path) -> Iterator[Tuple[str, Path]]:
+    """(chemin relatif, fichier) de chaque audio du dossier ou de l'archive, dans un ordre stable"""
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and path.suffix.lower() in AUDIO_EXTENSIONS and not path.name.startswith("."):
+                yield path.relative_to(source).as_posix(), path
+        return
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            archive.extractall(extract_dir, [info for info in archive.infolist() if not info.is_dir()])
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            archive.extractall(extract_dir, filter="data")
+    else:
+        yield source.name, source
+        return
+    for name, path in discover(extract_dir, extract_dir):
+        if "__MACOSX" not in Path(name).parts:
+            yield name, path
+
+
+def write_json(path: Path, data: Dict[str, Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcription hors ligne d'un dossier ou d'une archive (zip, tar)")
+    parser.add_argument("source", type=Path, help="Dossier, archive ou fichier audio")
+    parser.add_argument("-o", "--output", type=Path, default=Path("transcriptions"), help="Dossier des résultats JSON")
+    parser.add_argument("--language", default="fr", help="Code langue ou 'auto'")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=PROFILE_ORDER, help="Profil de décodage")
+    parser.add_argument("--workers", type=int, default=None, help="Process de transcription (défaut : 1 sur GPU, cœurs / 4 sur CPU)")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="Ne pas lire ni alimenter le cache du serveur")
+    args = parser.parse_args()
+
+    cuda_devices = ctranslate2.get_cuda_device_count()
+    device = "cuda" if cuda_devices > 0 else "cpu"
+    compute_type = "float16" if cuda_devices > 0 else "int8"
+    workers = args.workers or (1 if device == "cuda" else max(1, (os.cpu_count() or 1) // 4))
+    cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    cache = None if args.no_cache else TranscriptCache(args.cache_dir, max_bytes=CACHE_MAX_BYTES)
+    args.output.mkdir(parents=True, exist_ok=True)
+    index_file = open(args.output / "index.jsonl", "a", encoding="utf-8")
+    counts = {"done": 0, "cached": 0, "skipped": 0, "error": 0}
+
+    def record(name: str, status: str, **fields):
+        counts[status] += 1
+        index_file.write(json.dumps({"file": name, "status": status, "at": time.time(), **fields}, ensure_ascii=False) + "\n")
+        index_file.flush()
+
+    def output_path(name: str) -> Path:
+        return args.output / f"{name}.json"
+
+    print(f"Transcription hors ligne de {args.source} -> {args.output} (modèle {args.model}, profil {args.profile}, {workers} worker(s) {device})")
+    start_time = time.time()
+    with tempfile.TemporaryDirectory(prefix="retexte-offline-") as extract_dir:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(args.model, device, compute_type, cpu_threads)
+        )
+        # Future -> (clé de cache, hash, fichiers qui attendent ce résultat)
+        pending: Dict[Future, Tuple[str, str, List[str]]] = {}
+        by_key: Dict[str, Future] = {}
+
+        def collect(done):
+            for future in done:
+                key, audio_hash, names = pending.pop(future)
+                by_key.pop(key, None)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    for name in names:
+                        print(f"!!! {name}: {e} !!!")
+                        record(name, "error", error=str(e))
+                    continue
+                if cache is not None:
+                    cache.put(key, result, audio_hash, args.model, args.language, DECODING_PROFILES[args.profile].options)
+                for name in names:
+                    write_json(output_path(name), {**result, "metadata": {**result["metadata"], "filename": name}})
+                    record(name, "done", duration=result["info"]["duration"], processing_time=result["info"]["processing_time"])
+                    print(f"OK {name} ({result['info']['duration']:.0f}s d'audio en {result['info']['processing_time']:.1f}s)")
+
+        try:
+            for name, path in discover(args.source, Path(extract_dir)):
+                if output_path(name).exists():
+                    counts["skipped"] += 1
+                    continue
+                audio_hash = file_hash(path)
+                key = make_cache_key(audio_hash, args.model, args.language, DECODING_PROFILES[args.profile].options)
+                # Un résultat d'un profil plus précis convient aussi
+                cached = None
+                for profile in at_least_as_accurate(args.profile) if cache is not None else ():
+                    cached = cache.get(make_cache_key(audio_hash, args.model, args.language, DECODING_PROFILES[profile].options))
+                    if cached is not None:
+                        break
+                if cached is not None:
+                    write_json(output_path(name), {**cached, "metadata": {**cached["metadata"], "filename": name}})
+                    record(name, "cached")
+                    continue
+                # Même contenu déjà soumis dans ce lot : un seul passage du modèle
+                if key in by_key:
+                    pending[by_key[key]][2].append(name)
+                    continue
+                # File bornée : l'extraction et le hachage n'avancent pas trop loin devant les workers
+                while len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                future = executor.submit(_transcribe, str(path), name, args.language, args.profile)
+                pending[future] = (key, audio_hash, [name])
+                by_key[key] = future
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        except KeyboardInterrupt:
+            print("Interruption : les fichiers terminés sont conservés, relancez la commande pour reprendre")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise SystemExit(130)
+        finally:
+            executor.shutdown(wait=True)
+            index_file.close()
+            if cache is not None:
+                cache.flush_hits()
+
+    elapsed = time.time() - start_time
+    print(f"Terminé en {elapsed:.0f}s : {counts['done']} transcrit(s), {counts['cached']} depuis le cache, "
+          f"{counts['skipped']} déjà présent(s), {counts['error']} erreur(s)")
+
+
+if __name__ == "__main__":
+    main()
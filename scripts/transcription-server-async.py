@@ -1,54 +1,158 @@
+import time
+PROCESS_START = time.time()  # Référence du rapport de démarrage
+
 import os
 import asyncio
-import tempfile
 import hashlib
+import itertools
 import json
-import time
+import math
+import tarfile
 import uuid
+import zipfile
+from contextlib import ExitStack, asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
-import threading
-from queue import Queue
+from typing import Awaitable, Callable, Dict, Any, Iterator, IO, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import ctranslate2
+import numpy as np
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from faster_whisper import WhisperModel
-import torch
-print("CUDA disponible :", torch.cuda.is_available())
-if torch.cuda.is_available():
-    print("Nom du GPU :", torch.cuda.get_device_name(0))
+from admission import AdmissionController, Overloaded, ProfileController
+from audio_preprocessing import SAMPLING_RATE, AudioPreprocessor, PreparedAudio, load_pcm, pcm_path_for, probe_duration
+from chunked_transcription import ChunkedTranscriber
+from decoding import DECODE_OPTIONS, DECODING_PROFILES, PROFILE_ORDER, UnknownProfile, at_least_as_accurate
+from job_queue import QueueLoad, open_queue
+from job_store import JobStore
+from metrics import Metrics, server_timing
+from micro_batching import BatchedGenerationGroup
+from model_registry import ModelRegistry, UnknownModel
+from scheduler import QueueFull, ScheduledJob, TranscriptionScheduler, make_policy
+from segment_index import SegmentIndex, page_segments
+from transcript_cache import TranscriptCache, make_cache_key
+from transcription_result import build_result, format_segment, resume_after, segment_progress
+IMPORTS_DONE = time.time()
+
+# Détection du GPU par CTranslate2 (moteur d'inférence de faster-whisper), sans importer torch
+CUDA_DEVICES = ctranslate2.get_cuda_device_count()
+if CUDA_DEVICES > 0:
+    print(f"CUDA disponible : {CUDA_DEVICES} GPU")
 else:
     print("GPU non détecté, utilisation CPU")
-print("Version CUDA utilisée par torch :", torch.version.cuda)
 
 
 # Configuration optimisée
-MODEL_SIZE = "medium"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-COMPUTE_TYPE = "float16" if torch.cuda.is_available() else "int8"
+MODEL_SIZE = os.getenv("DEFAULT_MODEL", "medium")  # Modèle utilisé quand la requête n'en précise pas
+# Modèles servis par ce processus, chargés à la demande sous un budget mémoire (RAM ou VRAM)
+AVAILABLE_MODELS = [name.strip() for name in os.getenv("MODELS", "small,medium,large-v3").split(",") if name.strip()]
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", 6144))
+# Routage par latence : clips courts vers FAST_MODEL quand la file d'attente s'allonge
+FAST_MODEL = os.getenv("FAST_MODEL", "small")
+FAST_MODEL_MAX_DURATION = float(os.getenv("FAST_MODEL_MAX_DURATION", 60))
+FAST_MODEL_QUEUE_LENGTH = int(os.getenv("FAST_MODEL_QUEUE_LENGTH", 4))
+DEVICE = "cuda" if CUDA_DEVICES > 0 else "cpu"
+COMPUTE_TYPE = "float16" if CUDA_DEVICES > 0 else "int8"
 CACHE_DIR = Path("./cache")
 JOBS_DIR = Path("./jobs")
+UPLOAD_DIR = Path("./uploads")
 MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
 LARGE_FILE_THRESHOLD = 50 * 1024 * 1024  # 50MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB lus à la fois lors de la réception
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024))  # 5GB
+CACHE_HOT_ENTRIES = int(os.getenv("CACHE_HOT_ENTRIES", 64))  # Résultats gardés en mémoire
+CACHE_EVICTION_POLICY = os.getenv("CACHE_EVICTION_POLICY", "lru")  # lru ou lfu
+FINGERPRINT_CACHE = os.getenv("FINGERPRINT_CACHE", "1") == "1"  # Ré-encodages d'un audio déjà transcrit servis par le cache
+# Enregistrement envoyé à nouveau après s'être prolongé : seule la suite est transcrite (requiert FINGERPRINT_CACHE)
+APPEND_MODE = os.getenv("APPEND_MODE", "1") == "1"
+APPEND_OVERLAP_SECONDS = float(os.getenv("APPEND_OVERLAP_SECONDS", 30))  # Fin de la version précédente transcrite à nouveau
+APPEND_MIN_SECONDS = float(os.getenv("APPEND_MIN_SECONDS", 60))  # Versions précédentes plus courtes ignorées
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"  # Modèle chargé et préchauffé avant le premier utilisateur
+JOB_TTL_HOURS = float(os.getenv("JOB_TTL_HOURS", 24))  # Durée de conservation des jobs terminés
+CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_INTERVAL_SECONDS", 15))  # Sauvegarde des segments des jobs async
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"  # Durées par étape dans l'en-tête Server-Timing des réponses
 
 
-MAX_CONCURRENT_TRANSCRIPTIONS = 1  # Une seule transcription à la fois
-transcription_queue = Queue()
-active_transcriptions = 0
-transcription_lock = threading.Lock()
+MAX_CONCURRENT_TRANSCRIPTIONS = max(1, int(os.getenv("MAX_CONCURRENT_TRANSCRIPTIONS", 1)))  # 1 = une seule transcription à la fois
+# Mode long fichier : découpe aux silences et décodage parallèle des morceaux
+LONG_FILE_CUTOVER_SECONDS = float(os.getenv("LONG_FILE_CUTOVER_SECONDS", 20 * 60))
+LONG_FILE_WORKERS = int(os.getenv("LONG_FILE_WORKERS", max(1, (os.cpu_count() or 4) // 4)))
+LONG_FILE_CHUNK_SECONDS = float(os.getenv("LONG_FILE_CHUNK_SECONDS", 180))
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", 1))  # Décodages audio menés en parallèle de l'inférence
+SCHEDULING_POLICY = os.getenv("SCHEDULING_POLICY", "fifo")  # fifo, sjf ou fair
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", 100))
+# Admission : refus (429 + Retry-After) quand l'attente prévue dépasse le SLA, d'après la vitesse mesurée
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 30 * 60))  # 0 = jamais de refus
+SYNC_MAX_WAIT_SECONDS = float(os.getenv("SYNC_MAX_WAIT_SECONDS", 8 * 60))  # Au-delà, requête synchrone passée en asynchrone
+# Profils de décodage (accurate, balanced, fast) : un cran plus rapide au-delà de cette attente prévue, le plus rapide à 4 fois
+DECODING_PROFILE = os.getenv("DECODING_PROFILE", "balanced")  # Profil quand le serveur n'est pas chargé
+PROFILE_DEGRADE_WAIT_SECONDS = float(os.getenv("PROFILE_DEGRADE_WAIT_SECONDS", 5 * 60))  # 0 = jamais de dégradation
+PROFILE_DEGRADE_QUEUE = int(os.getenv("PROFILE_DEGRADE_QUEUE", 20))  # Jobs en attente à partir desquels le profil le plus rapide est utilisé
+SEGMENT_PAGE_SIZE = int(os.getenv("SEGMENT_PAGE_SIZE", 100))  # Segments par page quand offset/limit sont demandés
+SEGMENT_PAGE_MAX = int(os.getenv("SEGMENT_PAGE_MAX", 1000))
+# File partagée (sqlite://jobs/queue.sqlite3) : transcriptions confiées aux workers (transcription-worker.py), ce processus ne fait que l'API
+JOB_QUEUE = os.getenv("JOB_QUEUE", "")
+QUEUE_POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", 1))
+# Micro-batching des clips courts arrivés presque en même temps
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))  # 1 = désactivé
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 50))
+BATCH_MAX_DURATION = float(os.getenv("BATCH_MAX_DURATION", 60))  # Clips plus longs traités seuls
+# Envois groupés (/transcribe/batch) : fichiers d'un même envoi en cours de traitement en même temps
+BULK_PARALLEL_JOBS = int(os.getenv("BULK_PARALLEL_JOBS", 4))
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", 20 * 1024 * 1024 * 1024))  # Contenu décompressé d'une archive
 
 print(f"ReTexte - Mode Réseau Local")
-print(f" Modèle: {MODEL_SIZE}")
+print(f" Modèle: {MODEL_SIZE} (disponibles: {', '.join(AVAILABLE_MODELS)}, budget {MODEL_MEMORY_BUDGET_MB}Mo)")
 print(f" Device: {DEVICE}")
 print(f" Utilisateurs simultanés:  (interface)")
-print(f" Transcriptions simultanées: {MAX_CONCURRENT_TRANSCRIPTIONS}")
+if JOB_QUEUE:
+    print(f" Transcriptions: workers de la file {JOB_QUEUE}")
+else:
+    print(f" Transcriptions simultanées: {MAX_CONCURRENT_TRANSCRIPTIONS}")
+print(f" Ordonnancement: {SCHEDULING_POLICY} (file max {MAX_QUEUE_SIZE})")
+if ADMISSION_MAX_WAIT_SECONDS > 0:
+    print(f" Admission: refus au-delà de {ADMISSION_MAX_WAIT_SECONDS / 60:.0f}min d'attente prévue")
+print(f" Décodage: profil {DECODING_PROFILE}" + (f", plus rapide au-delà de {PROFILE_DEGRADE_WAIT_SECONDS / 60:.0f}min d'attente prévue" if PROFILE_DEGRADE_WAIT_SECONDS > 0 else ""))
+if LONG_FILE_WORKERS > 1:
+    print(f" Fichiers longs (> {LONG_FILE_CUTOVER_SECONDS / 60:.0f}min): {LONG_FILE_WORKERS} décodeurs en parallèle")
+if BATCH_MAX_SIZE > 1:
+    print(f" Micro-batching: jusqu'à {BATCH_MAX_SIZE} clips de moins de {BATCH_MAX_DURATION:.0f}s (attente max {BATCH_MAX_WAIT_MS:.0f}ms)")
+
+# Durées du démarrage, exposées par /ready
+startup_report: Dict[str, Any] = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler.start()
+    if job_queue is not None:
+        await run_in_threadpool(workload.start)
+    transcript_cache.start()
+    job_store.start()
+    resume_interrupted_jobs()
+    asyncio.ensure_future(run_in_threadpool(sync_segment_index))
+    startup_report["imports_seconds"] = round(IMPORTS_DONE - PROCESS_START, 2)
+    # /health répond pendant le préchauffage, /ready seulement une fois le modèle prêt
+    # (avec une file partagée, les modèles sont chargés par les workers)
+    if WARMUP_ON_STARTUP and job_queue is None:
+        asyncio.ensure_future(run_in_threadpool(warm_up_model))
+    else:
+        mark_ready()
+    yield
+    scheduler.stop()
+    if job_queue is not None:
+        workload.stop()
+    transcript_cache.stop()
+    job_store.stop()
 
 app = FastAPI(
     title="ReTexte", 
     version="2.2.0",
-    description="Serveur multi-utilisateurs avec file d'attente"
+    description="Serveur multi-utilisateurs avec file d'attente",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -60,86 +164,340 @@ app.add_middleware(
 )
 
 # Variables globales
-whisper_model = None
-jobs_status = {}
-stats = {
-    "total_transcriptions": 0, 
-    "cache_hits": 0,
-    "sync_jobs": 0,
-    "async_jobs": 0,
-    "concurrent_users": 0,
-    "queue_length": 0,
-    "avg_processing_speed": 0
-}
+# Compteurs et durées par étape (upload, hash, cache, file d'attente, décodage, inférence...), thread-safe
+metrics = Metrics()
+STAT_COUNTERS = ("total_transcriptions", "cache_hits", "fingerprint_hits", "coalesced_requests", "sync_jobs", "async_jobs", "batches", "batched_clips", "rejected_requests", "deferred_requests", "degraded_jobs", "appended_transcriptions")
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Requêtes de transcription en cours et, si activé, durées par étape dans Server-Timing"""
+    request.state.timings = {}
+    if request.method != "POST" or not request.url.path.startswith("/transcribe"):
+        return await call_next(request)
+    # Le client compte jusqu'à la fin du corps : une réponse SSE est envoyée pendant toute la transcription
+    counted = ExitStack()
+    counted.enter_context(metrics.in_flight("concurrent_users"))
+    try:
+        response = await call_next(request)
+    except BaseException:
+        counted.close()
+        raise
+    body = response.body_iterator
+
+    async def counted_body():
+        with counted:
+            async for chunk in body:
+                yield chunk
+
+    response.body_iterator = counted_body()
+    if TIMING_HEADER and request.state.timings:
+        response.headers["Server-Timing"] = server_timing(request.state.timings)
+    return response
 
 # Créer les dossiers
 CACHE_DIR.mkdir(exist_ok=True)
 JOBS_DIR.mkdir(exist_ok=True)
+UPLOAD_DIR.mkdir(exist_ok=True)
 
-def load_model():
-    """Charge le modèle pré-téléchargé (thread-safe)"""
-    global whisper_model
-    if whisper_model is None:
-        with transcription_lock:
-            if whisper_model is None:  # Double-check
-                print(f"Chargement du modèle {MODEL_SIZE}...")
-                start_time = time.time()
-                
-                whisper_model = WhisperModel(
-                    MODEL_SIZE, 
-                    device=DEVICE, 
-                    compute_type=COMPUTE_TYPE,
-                    cpu_threads=min(8, os.cpu_count() or 4),
-                    num_workers=1
-                )
-                load_time = time.time() - start_time
-                print(f"OK !!!! Modèle {MODEL_SIZE} chargé en {load_time:.1f}s!")
-
-def get_cache_path(file_hash: str) -> Path:
-    return CACHE_DIR / f"{file_hash}.json"
-
-def save_cache(file_hash: str, result: Dict[str, Any]):
+job_store = JobStore(JOBS_DIR, ttl=JOB_TTL_HOURS * 3600)
+job_queue = open_queue(JOB_QUEUE) if JOB_QUEUE else None
+# Jobs interrompus par l'arrêt précédent, remis en file au démarrage
+interrupted_jobs = job_store.unfinished()
+
+# Les autres fichiers restés dans UPLOAD_DIR appartiennent à une exécution précédente
+# (avec une file partagée, ils peuvent être ceux d'un autre processus API ou en cours chez un worker)
+kept_uploads = {Path(job["upload_path"]).name for job in interrupted_jobs}
+for stale_upload in UPLOAD_DIR.iterdir() if job_queue is None else ():
+    if stale_upload.name in kept_uploads:
+        continue
+    try:
+        stale_upload.unlink()
+    except OSError:
+        pass
+
+def create_model(name: str) -> WhisperModel:
+    """Modèle pré-téléchargé, un réplica par worker pour que les transcriptions tournent vraiment en parallèle"""
+    return WhisperModel(
+        name,
+        device=DEVICE,
+        compute_type=COMPUTE_TYPE,
+        cpu_threads=max(1, min(8, (os.cpu_count() or 4) // MAX_CONCURRENT_TRANSCRIPTIONS)),
+        num_workers=MAX_CONCURRENT_TRANSCRIPTIONS
+    )
+
+model_registry = ModelRegistry(
+    create_model,
+    AVAILABLE_MODELS,
+    default_model=MODEL_SIZE,
+    memory_budget_mb=MODEL_MEMORY_BUDGET_MB,
+    memory_factor=2.0 if COMPUTE_TYPE == "float16" else 1.0,
+    replicas=MAX_CONCURRENT_TRANSCRIPTIONS,
+    fast_model=FAST_MODEL,
+    short_clip_seconds=FAST_MODEL_MAX_DURATION,
+    busy_queue_length=FAST_MODEL_QUEUE_LENGTH,
+)
+
+def warm_up_model():
+    """Chargement du modèle par défaut et première inférence au démarrage, hors du chemin des utilisateurs"""
+    try:
+        start_time = time.time()
+        with model_registry.acquire(MODEL_SIZE) as model:
+            startup_report["model_load_seconds"] = round(time.time() - start_time, 2)
+            start_time = time.time()
+            # Sans VAD : une seconde de silence passe quand même par l'encodeur et le décodeur
+            segments, _ = model.transcribe(
+                np.zeros(SAMPLING_RATE, dtype=np.float32),
+                language="fr",
+                **{**DECODE_OPTIONS, "vad_filter": False}
+            )
+            for _ in segments:
+                pass
+        startup_report["warmup_seconds"] = round(time.time() - start_time, 2)
+    except Exception as e:
+        startup_report["error"] = str(e)
+        print(f"!!! Erreur préchauffage du modèle: {e} !!!")
+        return
+    mark_ready()
+
+def mark_ready():
+    startup_report["total_seconds"] = round(time.time() - PROCESS_START, 2)
+    startup_report["ready_at"] = datetime.now().isoformat()
+    print(
+        f"OK !!! Serveur prêt en {startup_report['total_seconds']:.1f}s "
+        f"(imports {startup_report.get('imports_seconds', 0):.1f}s, "
+        f"modèle {startup_report.get('model_load_seconds', 0):.1f}s, "
+        f"préchauffage {startup_report.get('warmup_seconds', 0):.1f}s)"
+    )
+
+# Segments des transcriptions en cache : pages, plages de temps, recherche ; une entrée évincée en sort
+segment_index = SegmentIndex(CACHE_DIR)
+
+# Les anciennes entrées (clé = hash seul) ont été produites avec les paramètres actuels
+transcript_cache = TranscriptCache(
+    CACHE_DIR,
+    max_bytes=CACHE_MAX_BYTES,
+    hot_entries=CACHE_HOT_ENTRIES,
+    eviction_policy=CACHE_EVICTION_POLICY,
+    legacy_params=DECODE_OPTIONS,
+    on_remove=segment_index.remove
+)
+
+def sync_segment_index():
+    """Indexe les entrées du cache écrites sans le serveur (transcription hors ligne, versions précédentes)"""
     try:
-        with open(get_cache_path(file_hash), 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        added = segment_index.sync(transcript_cache.keys(), transcript_cache.peek)
+        if added:
+            print(f"Index des segments: {added} transcription(s) ajoutée(s)")
+    except Exception as e:
+        print(f"!!! Erreur index des segments: {e} !!!")
+
+# Entrée du registre pour le mode long fichier : chargée à la demande, évincée comme les autres modèles
+LONG_FILE_POOL = f"{MODEL_SIZE}-long"
+
+def create_long_file_model(name: str) -> WhisperModel:
+    """Modèle par défaut à plusieurs réplicas, réservé au mode long fichier"""
+    return WhisperModel(
+        MODEL_SIZE,
+        device=DEVICE,
+        compute_type=COMPUTE_TYPE,
+        cpu_threads=max(1, (os.cpu_count() or 4) // LONG_FILE_WORKERS),
+        num_workers=LONG_FILE_WORKERS
+    )
+
+chunked_transcriber = ChunkedTranscriber(LONG_FILE_WORKERS, LONG_FILE_CHUNK_SECONDS) if LONG_FILE_WORKERS > 1 else None
+if chunked_transcriber:
+    model_registry.add_pool(LONG_FILE_POOL, MODEL_SIZE, LONG_FILE_WORKERS, create_long_file_model)
+
+def is_long_file(model_name: str, duration: Optional[float]) -> bool:
+    """Le pool du mode long fichier est construit sur le modèle par défaut"""
+    return bool(chunked_transcriber and model_name == MODEL_SIZE and duration and duration >= LONG_FILE_CUTOVER_SECONDS)
+
+def get_cache_key(file_hash: str, language: str, model_name: str = MODEL_SIZE, profile: str = DECODING_PROFILE) -> str:
+    return make_cache_key(file_hash, model_name, language, DECODING_PROFILES[profile].options)
+
+def cache_candidates(model: Optional[str], profile: str) -> List[Tuple[str, str]]:
+    """(modèle, profil) dont un résultat en cache convient : profil au moins aussi précis que celui demandé"""
+    model_name = model_registry.resolve(model)
+    candidates = [(model_name, name) for name in at_least_as_accurate(profile)]
+    # Sans modèle imposé, le profil rapide a pu tourner sur le modèle rapide
+    if not model and model_registry.fast_model and DECODING_PROFILES[profile].fast_model:
+        candidates.append((model_registry.fast_model, profile))
+    return candidates
+
+def transcript_id_for(file_hash: str, language: str, result: Dict[str, Any]) -> str:
+    """Clé de cache du résultat, qui l'identifie aussi dans l'index des segments"""
+    return get_cache_key(file_hash, language, result["metadata"]["model"], result["metadata"].get("decoding_profile", DECODING_PROFILE))
+
+def save_cache(file_hash: str, language: str, result: Dict[str, Any], timings: Optional[Dict[str, float]] = None):
+    model_name = result["metadata"]["model"]
+    profile = result["metadata"].get("decoding_profile", DECODING_PROFILE)
+    key = transcript_id_for(file_hash, language, result)
+    try:
+        with metrics.time("cache_store", timings):
+            transcript_cache.put(key, result, file_hash, model_name, language, DECODING_PROFILES[profile].options)
+            segment_index.add(key, file_hash, result)
     except Exception as e:
         print(f"!!! Erreur sauvegarde cache: {e} !!!")
 
-def load_cache(file_hash: str) -> Optional[Dict[str, Any]]:
-    cache_path = get_cache_path(file_hash)
-    if cache_path.exists():
-        try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                stats["cache_hits"] += 1
-                return json.load(f)
-        except Exception as e:
-            print(f"!!! Erreur lecture cache: {e} !!!")
+def load_cache(file_hash: str, language: str, model: Optional[str] = None, profile: str = DECODING_PROFILE) -> Optional[Dict[str, Any]]:
+    for model_name, candidate in cache_candidates(model, profile):
+        result = transcript_cache.get(get_cache_key(file_hash, language, model_name, candidate))
+        if result is not None:
+            metrics.inc("cache_hits")
+            return result
     return None
 
-def transcribe_file_safe(file_path: str, language: str, filename: str, user_id: str = "unknown", job_id: Optional[str] = None) -> Dict[str, Any]:
-    """Transcription thread-safe avec file d'attente et mise à jour de la progression"""
-    global active_transcriptions
+def load_cached_response(file_hash: str, language: str, accept_encoding: str, model: Optional[str] = None, profile: str = DECODING_PROFILE) -> Optional[Response]:
+    """Réponse d'un hit de cache, servie pré-compressée si le client accepte gzip"""
+    if "gzip" not in accept_encoding:
+        result = load_cache(file_hash, language, model, profile)
+        return JSONResponse(content=result) if result is not None else None
 
-    try:
-        # Attendre son tour dans la file
-        with transcription_lock:
-            active_transcriptions += 1
-            queue_position = active_transcriptions
+    for model_name, candidate in cache_candidates(model, profile):
+        body = transcript_cache.get_gzip_body(get_cache_key(file_hash, language, model_name, candidate))
+        if body is not None:
+            metrics.inc("cache_hits")
+            return Response(content=body, media_type="application/json", headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return None
 
-        if queue_position > 1:
-            print(f" Utilisateur {user_id}: En attente (position {queue_position} dans la file)")
+def load_cache_by_fingerprint(prepared: PreparedAudio, file_hash: str, language: str, model: Optional[str], profile: str) -> Optional[Dict[str, Any]]:
+    """Même audio sous d'autres octets (autre conteneur, autre codec) : transcription déjà en cache"""
+    transcript_cache.put_fingerprint(file_hash, prepared.fingerprint, prepared.duration)
+    candidates = cache_candidates(model, profile)
+    conditions = [(model_name, DECODING_PROFILES[candidate].options) for model_name, candidate in candidates]
+    match = transcript_cache.get_by_fingerprint(prepared.fingerprint, prepared.duration, file_hash, language, conditions)
+    if match is None:
+        return None
+    index, original_key, result = match
+    (model_name, candidate), (_, options) = candidates[index], conditions[index]
+    metrics.inc("fingerprint_hits")
+    # Les envois suivants de ces octets-là sont servis par le cache ordinaire
+    key = get_cache_key(file_hash, language, model_name, candidate)
+    transcript_cache.put(key, result, file_hash, model_name, language, options)
+    # Même audio : la nouvelle clé désigne les segments déjà indexés (pas de doublons dans la recherche)
+    if not segment_index.add_alias(key, file_hash, original_key):
+        segment_index.add(key, file_hash, result)
+    return {**result, "metadata": {**result["metadata"], "cache_match": "fingerprint"}}
 
-        # Attendre que ce soit notre tour
+def load_previous_version(prepared: PreparedAudio, file_hash: str, language: str, model: Optional[str], profile: str) -> Optional[Dict[str, Any]]:
+    """Version plus courte du même enregistrement déjà transcrite : ses segments repris jusqu'à une frontière sûre"""
+    conditions = [(model_name, DECODING_PROFILES[candidate].options) for model_name, candidate in cache_candidates(model, profile)]
+    match = transcript_cache.get_by_prefix(prepared.fingerprint, prepared.duration, file_hash, language, conditions, APPEND_MIN_SECONDS)
+    if match is None:
+        return None
+    _, previous_hash, previous_duration, result = match
+    # La fin de l'ancienne version a été décodée sans la suite de sa dernière phrase
+    boundary = previous_duration - APPEND_OVERLAP_SECONDS
+    segments = list(itertools.takewhile(lambda segment: segment["end"] <= boundary, result["segments"]))
+    if not segments:
+        return None
+    metrics.inc("appended_transcriptions")
+    return {"file_hash": previous_hash, "duration": previous_duration, "language": result["info"]["language"], "segments": segments}
+
+class UploadTooLarge(Exception):
+    pass
+
+def _spool_upload(source, spool_path: Path, timings: Optional[Dict[str, float]] = None) -> Tuple[str, int]:
+    """Copie l'upload par morceaux sur disque en calculant le SHA-256 au fil de l'eau"""
+    hasher = hashlib.sha256()
+    file_size = 0
+    # Lecture, hachage et écriture sont entrelacés : chaque part est cumulée puis enregistrée une fois
+    read_seconds = hash_seconds = write_seconds = 0.0
+    with open(spool_path, 'wb') as spool:
         while True:
-            with transcription_lock:
-                if active_transcriptions == 1:  # C'est notre tour
-                    break
-            time.sleep(1)  # Attendre 1 seconde
+            start = time.perf_counter()
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            read_seconds += time.perf_counter() - start
+            if not chunk:
+                break
+            file_size += len(chunk)
+            if file_size > MAX_FILE_SIZE:
+                raise UploadTooLarge()
+            start = time.perf_counter()
+            hasher.update(chunk)
+            hash_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            spool.write(chunk)
+            write_seconds += time.perf_counter() - start
+    metrics.observe("upload", read_seconds, timings)
+    metrics.observe("hash", hash_seconds, timings)
+    metrics.observe("spool_write", write_seconds, timings)
+    metrics.inc("upload_bytes", file_size)
+    return hasher.hexdigest(), file_size
+
+async def receive_upload(file: UploadFile, timings: Optional[Dict[str, float]] = None) -> Tuple[Path, str, int]:
+    """Réception en streaming : la mémoire utilisée reste de l'ordre de UPLOAD_CHUNK_SIZE"""
+    spool_path = UPLOAD_DIR / f"{uuid.uuid4().hex}{Path(file.filename).suffix}"
+    try:
+        file_hash, file_size = await run_in_threadpool(_spool_upload, file.file, spool_path, timings)
+    except UploadTooLarge:
+        remove_upload(spool_path)
+        raise HTTPException(status_code=400, detail=f"Fichier trop volumineux")
+    except BaseException:
+        remove_upload(spool_path)
+        raise
+    return spool_path, file_hash, file_size
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+def _archive_members(archive_path: Path) -> Iterator[Tuple[str, IO[bytes]]]:
+    """Fichiers réguliers d'une archive zip ou tar (fichiers cachés et métadonnées macOS ignorés)"""
+    def wanted(name: str) -> bool:
+        return not any(part.startswith(".") or part == "__MACOSX" for part in Path(name).parts)
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and wanted(info.filename):
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    else:
+        with tarfile.open(archive_path, mode="r:*") as archive:
+            for info in archive:
+                if info.isfile() and wanted(info.name):
+                    yield info.name, archive.extractfile(info)
+
+def extract_archive(archive_path: Path) -> List[Tuple[str, Path, str]]:
+    """Chaque membre copié dans UPLOAD_DIR comme un upload (nom, chemin, hash)"""
+    entries = []
+    total_size = 0
+    try:
+        for name, member in _archive_members(archive_path):
+            spool_path = UPLOAD_DIR / f"{uuid.uuid4().hex}{Path(name).suffix}"
+            try:
+                file_hash, file_size = _spool_upload(member, spool_path)
+            except BaseException:
+                remove_upload(spool_path)
+                raise
+            entries.append((name, spool_path, file_hash))
+            total_size += file_size
+            if total_size > BULK_MAX_BYTES:
+                raise UploadTooLarge()
+    except BaseException:
+        for _, spool_path, _ in entries:
+            remove_upload(spool_path)
+        raise
+    return entries
 
-        print(f"Utilisateur {user_id}: Début transcription de {filename}")
+def remove_upload(spool_path: Path):
+    """Supprime l'upload et son PCM décodé"""
+    for path in (spool_path, pcm_path_for(spool_path)):
+        try:
+            if path.exists():
+                path.unlink()
+        except Exception as cleanup_error:
+            print(f"!!! Erreur nettoyage: {cleanup_error} !!!")
+
+preprocessor = AudioPreprocessor(PREPROCESS_WORKERS, fingerprint=FINGERPRINT_CACHE)
 
-        # Chargement du modèle
-        load_model()
+def run_transcription(file_path: str, pcm_path: Path, language: str, filename: str, user_id: str = "unknown", job_id: Optional[str] = None, queue_position: int = 0, on_segment: Optional[Callable[[Dict[str, Any]], None]] = None, audio_duration: Optional[float] = None, model: Optional[WhisperModel] = None, model_name: str = MODEL_SIZE, profile: str = DECODING_PROFILE, batch_size: int = 1, timings: Optional[Dict[str, float]] = None, previous_version: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Transcription exécutée par un worker de l'ordonnanceur avec le modèle qu'il a réservé"""
+    try:
+        print(f"Utilisateur {user_id}: Début transcription de {filename} (modèle {model_name}, profil {profile})")
+        decode_options = DECODING_PROFILES[profile].options
 
         # Vérification du fichier
         if not os.path.exists(file_path):
@@ -148,69 +506,113 @@ def transcribe_file_safe(file_path: str, language: str, filename: str, user_id:
         file_size = os.path.getsize(file_path)
         print(f"Utilisateur {user_id}: Fichier {file_size} bytes")
 
+        # Le PCM a été décodé en amont : le modèle ne fait que de l'inférence
+        with metrics.time("pcm_load", timings):
+            audio = load_pcm(pcm_path)
+        total_duration = len(audio) / SAMPLING_RATE
+
+        # Reprise après interruption : seul l'audio après le dernier segment sauvegardé est décodé
+        checkpoint_segments = job_store.load_checkpoint(job_id) if job_id else []
+        checkpointed = len(checkpoint_segments)
+        # Version prolongée d'un enregistrement déjà transcrit : ses segments tiennent lieu de point de reprise
+        # (écrits avec le premier point de reprise du job, qui les retrouve ensuite après un redémarrage)
+        appended_to = None
+        if previous_version and not checkpoint_segments:
+            checkpoint_segments = previous_version["segments"]
+            appended_to = previous_version["file_hash"]
+            # La langue détectée sur la version précédente vaut pour la suite
+            if language == "auto":
+                language = previous_version["language"]
+            print(f"Utilisateur {user_id}: Suite d'un enregistrement déjà transcrit ({previous_version['duration']:.0f}s)")
+            if on_segment:
+                for segment_data in checkpoint_segments:
+                    on_segment(segment_data)
+        audio, resume_offset = resume_after(audio, checkpoint_segments)
+        if resume_offset > 0:
+            print(f"Utilisateur {user_id}: Reprise à {resume_offset:.0f}s ({len(checkpoint_segments)} segments déjà produits)")
+            if audio_duration:
+                audio_duration = len(audio) / SAMPLING_RATE
+
         # Transcription
         start_time = time.time()
 
-        segments_gen, info = whisper_model.transcribe(
-            file_path,
-            language=language if language != "auto" else None,
-            beam_size=3,
-            temperature=0.0,
-            vad_filter=True,
-            vad_parameters=dict(
-                min_silence_duration_ms=500,
-                speech_pad_ms=200
-            ),
-            chunk_length=30,
-            condition_on_previous_text=False
-        )
-
-        # Construction du résultat
-        segments = list(segments_gen)
-        segments_list = []
-        full_text = ""
-        total_segments = len(segments)
-
-        for idx, segment in enumerate(segments):
-            segment_data = {
-                "start": segment.start,
-                "end": segment.end,
-                "text": segment.text.strip()
-            }
+        long_file_mode = is_long_file(model_name, audio_duration)
+        # transcribe() fait le VAD et l'extraction des caractéristiques ; les segments sont décodés à l'itération
+        vad_start = time.perf_counter()
+        if long_file_mode:
+            print(f"Utilisateur {user_id}: Mode long fichier ({audio_duration / 60:.0f}min, {LONG_FILE_WORKERS} décodeurs)")
+            segments_gen, info = chunked_transcriber.transcribe(
+                model,
+                audio,
+                language if language != "auto" else None,
+                decode_options
+            )
+        else:
+            segments_gen, info = model.transcribe(
+                audio,
+                language=language if language != "auto" else None,
+                **decode_options
+            )
+        metrics.observe("vad", time.perf_counter() - vad_start, timings)
+
+        # Construction du résultat au fil du décodage (le générateur produit les segments un à un)
+        segments_list = list(checkpoint_segments)
+        last_checkpoint = time.time()
+
+        # Les segments déjà produits sont visibles via /transcribe/result pendant le traitement
+        job_state = job_store.live(job_id) if job_id else None
+        if job_state is not None:
+            job_state.update({
+                "status": "processing",
+                "progress": 20,
+                "segments": segments_list,
+                "duration": total_duration,
+                "processed_until": resume_offset,
+                "updated_at": time.time()
+            })
+
+        inference_start = time.perf_counter()
+        for segment in segments_gen:
+            segment_data = format_segment(segment, resume_offset)
             segments_list.append(segment_data)
-            full_text += segment.text.strip() + " "
 
-            # Mise à jour de la progression (tous les 10 %)
-            if job_id and total_segments > 10 and idx % max(1, (total_segments // 10)) == 0:
-                progress_value = 20 + int((idx / total_segments) * 70)
-                jobs_status[job_id]["progress"] = progress_value
+            if on_segment:
+                on_segment(segment_data)
+
+            # Mise à jour de la progression selon la position dans l'audio
+            if job_state is not None:
+                job_state["progress"] = segment_progress(segment_data["end"], total_duration)
+                job_state["processed_until"] = segment_data["end"]
+                job_state["updated_at"] = time.time()
 
+            # Point de reprise : les segments finalisés sont ajoutés au fichier du job
+            if job_id and time.time() - last_checkpoint >= CHECKPOINT_INTERVAL_SECONDS:
+                job_store.append_checkpoint(job_id, segments_list[checkpointed:])
+                checkpointed = len(segments_list)
+                last_checkpoint = time.time()
+        metrics.observe("inference", time.perf_counter() - inference_start, timings)
+
+        assembly_start = time.perf_counter()
         processing_time = time.time() - start_time
-        file_size_mb = file_size / (1024 * 1024)
-        speed_mb_per_min = (file_size_mb / processing_time) * 60 if processing_time > 0 else 0
-
-        result = {
-            "text": full_text.strip(),
-            "segments": segments_list,
-            "info": {
-                "language": info.language,
-                "duration": info.duration,
-                "processing_time": processing_time,
-                "speed_ratio": info.duration / processing_time if processing_time > 0 else 0,
-                "total_segments": len(segments_list),
-                "processing_speed_mb_per_min": speed_mb_per_min
-            },
-            "metadata": {
-                "filename": filename,
-                "model": MODEL_SIZE,
-                "device": DEVICE,
-                "processing_mode": "network",
-                "file_size_mb": file_size_mb,
-                "user_id": user_id,
-                "queue_position": queue_position
-            }
-        }
+        result = build_result(segments_list, info, total_duration, processing_time, file_size, {
+            "filename": filename,
+            "model": model_name,
+            "decoding_profile": profile,
+            "device": DEVICE,
+            "processing_mode": "network",
+            "long_file_mode": long_file_mode,
+            "batch_size": batch_size,
+            "resumed_from": resume_offset,
+            "user_id": user_id,
+            "queue_position": queue_position
+        })
+        if appended_to:
+            result["metadata"]["appended_to"] = appended_to
 
+        metrics.observe("assembly", time.perf_counter() - assembly_start, timings)
+        metrics.inc("audio_seconds", info.duration)
+        metrics.inc("processing_seconds", processing_time)
+        model_registry.record(model_name, info.duration, processing_time)
         print(f"OK !!! Utilisateur {user_id}: Transcription terminée en {processing_time:.1f}s")
         return result
 
@@ -218,55 +620,410 @@ def transcribe_file_safe(file_path: str, language: str, filename: str, user_id:
         print(f"!!! Utilisateur {user_id}: Erreur transcription: {str(e)} !!!")
         raise e
 
+def observe_queue_wait(job: ScheduledJob):
+    metrics.observe("queue_wait", job.started_at - job.submitted_at, job.payload["timings"])
+
+def run_scheduled_job(job: ScheduledJob) -> Dict[str, Any]:
+    observe_queue_wait(job)
+    # Le modèle réservé ne peut pas être déchargé pendant la transcription ; fichier long : réplicas du pool
+    name = LONG_FILE_POOL if is_long_file(job.payload["model_name"], job.expected_duration) else job.payload["model_name"]
+    with model_registry.acquire(name) as model:
+        return run_transcription(queue_position=job.queue_position, audio_duration=job.expected_duration, model=model, **job.payload)
+
+def is_batchable(job: ScheduledJob) -> bool:
+    duration = job.expected_duration
+    return duration is not None and duration <= BATCH_MAX_DURATION and not is_long_file(MODEL_SIZE, duration)
+
+def run_scheduled_batch(jobs: List[ScheduledJob]) -> List[Tuple[Optional[Dict[str, Any]], Optional[BaseException]]]:
+    """Clips courts transcrits ensemble : un seul passage du modèle par fenêtre de 30s pour tout le lot"""
+    for job in jobs:
+        observe_queue_wait(job)
+    model_name = jobs[0].payload["model_name"]
+    with model_registry.acquire(model_name) as model:
+        return run_batch_members(jobs, model)
+
+def run_batch_members(jobs: List[ScheduledJob], model: WhisperModel) -> List[Tuple[Optional[Dict[str, Any]], Optional[BaseException]]]:
+    group = BatchedGenerationGroup(model.model, len(jobs))
+    batch_model = group.bind(model)
+    print(f"Micro-batch de {len(jobs)} clips")
+
+    def run_one(job: ScheduledJob):
+        try:
+            return run_transcription(
+                queue_position=job.queue_position,
+                audio_duration=job.expected_duration,
+                model=batch_model,
+                batch_size=len(jobs),
+                **job.payload
+            ), None
+        except Exception as e:
+            return None, e
+        finally:
+            group.leave()
+
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="batch-member") as executor:
+        outcomes = list(executor.map(run_one, jobs))
+    metrics.inc("batches")
+    metrics.inc("batched_clips", len(jobs))
+    return outcomes
+
+scheduler = TranscriptionScheduler(
+    run_scheduled_job,
+    workers=MAX_CONCURRENT_TRANSCRIPTIONS,
+    policy=make_policy(SCHEDULING_POLICY),
+    max_queue_size=MAX_QUEUE_SIZE,
+    batch_handler=run_scheduled_batch,
+    is_batchable=is_batchable,
+    batch_key=lambda job: (job.payload["model_name"], job.payload["profile"]),
+    max_batch=BATCH_MAX_SIZE,
+    max_batch_wait=BATCH_MAX_WAIT_MS / 1000,
+    rate_key=lambda job: (job.payload["model_name"], job.payload["profile"]),
+)
+# Charge vue par l'admission, le choix du profil et les ETA : l'ordonnanceur local, ou la file partagée
+# quand des workers séparés font les transcriptions (l'ordonnanceur local reste alors vide)
+workload = QueueLoad(job_queue, MAX_QUEUE_SIZE, refresh_interval=QUEUE_POLL_SECONDS) if job_queue is not None else scheduler
+admission = AdmissionController(workload, ADMISSION_MAX_WAIT_SECONDS)
+profiles = ProfileController(admission, DECODING_PROFILE, PROFILE_DEGRADE_WAIT_SECONDS, PROFILE_DEGRADE_QUEUE)
+
+def overloaded(retry_after: int, detail: str) -> HTTPException:
+    metrics.inc("rejected_requests")
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+def queue_full() -> HTTPException:
+    return overloaded(admission.retry_after(), "File d'attente pleine, réessayez plus tard")
+
+def route_model(model: Optional[str], profile: str, duration: Optional[float]) -> str:
+    return model_registry.route(model, duration, workload.pending_count, prefer_fast=DECODING_PROFILES[profile].fast_model)
+
+def select_profile(client_id: str, model: Optional[str], requested: Optional[str]) -> str:
+    """Profil demandé (400 s'il n'existe pas) ou choisi selon l'attente prévue"""
+    try:
+        profile = profiles.select(client_id, route_model(model, DECODING_PROFILE, None), requested)
+    except UnknownProfile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not requested and profile != DECODING_PROFILE:
+        metrics.inc("degraded_jobs")
+    return profile
+
+def admit_upload(upload_path: Path, client_id: str, model: Optional[str], profile: str, duration: Optional[float]) -> Dict[str, Any]:
+    """Place réservée pour l'upload jusqu'à sa soumission à l'ordonnanceur (HTTPException 429 sinon)"""
+    model_name = route_model(model, profile, duration)
+    try:
+        return admission.admit(str(upload_path), client_id, {"model_name": model_name, "profile": profile}, duration)
+    except Overloaded as e:
+        remove_upload(upload_path)
+        raise overloaded(e.retry_after, str(e))
+
+@app.middleware("http")
+async def shed_load(request: Request, call_next):
+    """Refus avant la lecture de l'upload quand même un clip très court attendrait au-delà du SLA"""
+    if request.method == "POST" and request.url.path in ("/transcribe", "/transcribe/stream"):
+        model = request.query_params.get("model")
+        payload = {"model_name": model if model in model_registry.models else MODEL_SIZE, "profile": PROFILE_ORDER[-1]}
+        try:
+            admission.check(get_client_id(request), payload, 0.0)
+        except Overloaded as e:
+            metrics.inc("rejected_requests")
+            return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
+    return await call_next(request)
+
+def submit_transcription(file_path: str, prepared: PreparedAudio, language: str, filename: str, user_id: str = "unknown", job_id: Optional[str] = None, client_id: Optional[str] = None, on_segment: Optional[Callable[[Dict[str, Any]], None]] = None, model: Optional[str] = None, profile: str = DECODING_PROFILE, timings: Optional[Dict[str, float]] = None, previous_version: Optional[Dict[str, Any]] = None) -> ScheduledJob:
+    """Place une transcription (audio déjà décodé) dans la file de l'ordonnanceur"""
+    # Suite d'un enregistrement déjà transcrit : seul l'audio après les segments repris compte
+    duration = prepared.duration - previous_version["segments"][-1]["end"] if previous_version else prepared.duration
+    model_name = route_model(model, profile, duration)
+    job = scheduler.submit(
+        job_id or str(uuid.uuid4()),
+        client_id or user_id,
+        {"file_path": file_path, "pcm_path": prepared.pcm_path, "language": language, "filename": filename, "user_id": user_id, "job_id": job_id, "on_segment": on_segment, "model_name": model_name, "profile": profile, "timings": timings, "previous_version": previous_version},
+        expected_duration=duration,
+    )
+    if job.queue_position > 1 or scheduler.running_count > 0:
+        print(f" Utilisateur {user_id}: En attente (position {job.queue_position} dans la file)")
+    return job
+
+async def prepare_upload(file_path: str, timings: Optional[Dict[str, float]] = None) -> PreparedAudio:
+    """Décodage audio (étage de pré-traitement) et empreinte acoustique"""
+    with metrics.time("decode", timings):
+        return await asyncio.wrap_future(preprocessor.submit(Path(file_path)))
+
+async def find_reencoded_copy(prepared: PreparedAudio, file_hash: str, language: str, model: Optional[str], profile: str, timings: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    if prepared.fingerprint is None:
+        return None
+    with metrics.time("fingerprint_lookup", timings):
+        return await run_in_threadpool(load_cache_by_fingerprint, prepared, file_hash, language, model, profile)
+
+async def find_previous_version(prepared: PreparedAudio, file_hash: str, language: str, model: Optional[str], profile: str, timings: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    if not APPEND_MODE or prepared.fingerprint is None:
+        return None
+    with metrics.time("fingerprint_lookup", timings):
+        return await run_in_threadpool(load_previous_version, prepared, file_hash, language, model, profile)
+
+async def transcribe_file_safe(file_path: str, file_hash: str, language: str, filename: str, user_id: str = "unknown", job_id: Optional[str] = None, client_id: Optional[str] = None, model: Optional[str] = None, profile: str = DECODING_PROFILE, timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Transcription via l'ordonnanceur : l'inférence tourne dans un worker, la boucle d'événements reste libre"""
+    if job_queue is not None:
+        return await transcribe_remote(file_path, file_hash, language, filename, user_id, job_id, model, profile)
+    try:
+        prepared = await prepare_upload(file_path, timings)
+        cached_result = await find_reencoded_copy(prepared, file_hash, language, model, profile, timings)
+        if cached_result is not None:
+            print(f"Utilisateur {user_id}: Ré-encodage d'un audio déjà transcrit ({filename})")
+            return cached_result
+        previous_version = await find_previous_version(prepared, file_hash, language, model, profile, timings)
+        job = submit_transcription(file_path, prepared, language, filename, user_id, job_id, client_id, model=model, profile=profile, timings=timings, previous_version=previous_version)
     finally:
-        # Libérer la file d'attente
-        with transcription_lock:
-            active_transcriptions -= 1
-            stats["queue_length"] = active_transcriptions
+        # Le job est maintenant compté par l'ordonnanceur
+        admission.release(file_path)
+    return await asyncio.wrap_future(job.future)
+
+def enqueue_remote(file_path: str, file_hash: str, language: str, filename: str, user_id: str, job_id: Optional[str], model: Optional[str], profile: str) -> str:
+    """Dépose la transcription dans la file partagée (le fichier doit être lisible par les workers) ; QueueFull si elle est pleine"""
+    remote_id = job_id or str(uuid.uuid4())
+    # Durée lue dans l'en-tête : estimations d'attente des autres envois (admission, profil, ETA)
+    duration = probe_duration(Path(file_path))
+    payload = {
+        "file_path": str(Path(file_path).resolve()),
+        "file_hash": file_hash,
+        "language": language,
+        "filename": filename,
+        "user_id": user_id,
+        "model_name": route_model(model, profile, duration),
+        "profile": profile,
+        "expected_duration": duration
+    }
+    if job_queue.enqueue(remote_id, payload, max_pending=MAX_QUEUE_SIZE):
+        workload.added(remote_id, payload)
+    return remote_id
 
+async def await_remote(remote_id: str, job_id: Optional[str] = None, on_segment: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Résultat d'un worker, lu dans le cache partagé ; progression et segments reportés sur le job en attendant"""
+    received = 0
+    while True:
+        status = await run_in_threadpool(job_queue.status, remote_id)
+        if status is None:
+            raise Exception("Job absent de la file partagée")
+        if status["status"] == "completed":
+            result = await run_in_threadpool(transcript_cache.peek, status["transcript_id"])
+            if result is None:
+                raise Exception("Résultat du worker absent du cache")
+            if on_segment:
+                for segment_data in result["segments"][received:]:
+                    on_segment(segment_data)
+            # Copie : le mode de traitement est ajouté au résultat renvoyé, pas à celui du cache
+            return {**result, "metadata": dict(result["metadata"])}
+        if status["status"] == "failed":
+            raise Exception(status.get("error") or "Échec du worker")
 
-async def process_transcription_async(job_id: str, file_content: bytes, filename: str, language: str, user_id: str):
-    """Traitement asynchrone avec file d'attente"""
+        new_segments = []
+        if status.get("segments_done", 0) > received:
+            new_segments = await run_in_threadpool(job_queue.segments, remote_id, received)
+            received += len(new_segments)
+        if on_segment:
+            for segment_data in new_segments:
+                on_segment(segment_data)
+        job_state = job_store.live(job_id) if job_id else None
+        if job_state is not None and status["status"] == "leased":
+            job_state.setdefault("segments", []).extend(new_segments)
+            job_state.update({
+                "status": "processing",
+                "progress": status.get("progress", 20),
+                "processed_until": status.get("processed_until", 0.0),
+                "duration": status.get("duration"),
+                "updated_at": time.time()
+            })
+        await asyncio.sleep(QUEUE_POLL_SECONDS)
+
+async def transcribe_remote(file_path: str, file_hash: str, language: str, filename: str, user_id: str = "unknown", job_id: Optional[str] = None, model: Optional[str] = None, profile: str = DECODING_PROFILE) -> Dict[str, Any]:
+    """Transcription confiée aux workers de la file partagée (décodage audio compris)"""
     try:
-        jobs_status[job_id] = {"status": "queued", "progress": 0, "user_id": user_id}
-        
-        # Vérifier le cache
-        file_hash = hashlib.sha256(file_content).hexdigest()
-        cached_result = load_cache(file_hash)
-        if cached_result:
-            print(f"Utilisateur {user_id}: Cache hit pour {filename}")
-            jobs_status[job_id] = {"status": "completed", "result": cached_result, "progress": 100}
-            return
+        remote_id = await run_in_threadpool(enqueue_remote, file_path, file_hash, language, filename, user_id, job_id, model, profile)
+    finally:
+        admission.release(file_path)
+    return await await_remote(remote_id, job_id)
 
-        jobs_status[job_id]["status"] = "processing"
-        jobs_status[job_id]["progress"] = 10
-        
-        # Traitement avec file d'attente
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as tmp_file:
-            tmp_file.write(file_content)
-            tmp_file_path = tmp_file.name
 
+class InFlightTranscription:
+    """Transcription en cours qu'un envoi identique peut rejoindre
+
+    Elle tourne dans sa propre tâche : le départ du meneur (client déconnecté) ne l'interrompt pas
+    tant qu'un suivant attend le résultat.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id  # Job async ou état de progression d'une requête synchrone, partagé avec les suivants
+        self.future: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        self.task: Optional["asyncio.Future[None]"] = None
+        self.waiters = 0  # Requêtes qui attendent le résultat, meneur compris
+
+    async def wait(self) -> Dict[str, Any]:
+        self.waiters += 1
         try:
-            jobs_status[job_id]["progress"] = 20
-            result = transcribe_file_safe(tmp_file_path, language, filename, user_id)
-            result["metadata"]["processing_mode"] = "async"
-            
-            jobs_status[job_id]["progress"] = 90
-            save_cache(file_hash, result)
-            stats["total_transcriptions"] += 1
-            stats["async_jobs"] += 1
-            
-            jobs_status[job_id] = {"status": "completed", "result": result, "progress": 100}
-            
+            return await asyncio.shield(self.future)
         finally:
+            self.waiters -= 1
+            if self.waiters == 0 and not self.future.done():
+                # Plus personne n'attend : le job est retiré de la file
+                self.task.cancel()
+
+# Transcriptions en cours par contenu et paramètres de la requête (modifié depuis la boucle d'événements uniquement)
+in_flight: Dict[Tuple[str, str, Optional[str], str], InFlightTranscription] = {}
+# Uploads dont le meneur est parti : supprimés par la transcription partagée quand elle se termine
+detached_uploads: Set[str] = set()
+
+async def transcribe_once(file_path: str, file_hash: str, language: str, filename: str, mode: str, user_id: str = "unknown", job_id: Optional[str] = None, client_id: Optional[str] = None, model: Optional[str] = None, profile: str = DECODING_PROFILE, timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Une seule transcription par contenu : les envois identiques arrivés entre-temps en partagent le résultat
+
+    Une place dans la file et une écriture en cache par contenu, quel que soit le nombre d'envois.
+    """
+    key = (file_hash, language, model, profile)
+    running = in_flight.get(key)
+    if running is not None:
+        admission.release(file_path)
+        metrics.inc("coalesced_requests")
+        print(f"Utilisateur {user_id}: Transcription identique déjà en cours, résultat partagé")
+        if job_id:
+            job_store.follow(job_id, running.job_id)
+        result = await running.wait()
+        return {**result, "metadata": {**result["metadata"], "processing_mode": mode, "coalesced": True}}
+
+    # Requête synchrone : état de progression en mémoire, sous l'identifiant de sa place dans la file
+    progress_id = job_id or str(uuid.uuid4())
+    if job_id is None:
+        job_store.track(progress_id, user_id)
+    running = in_flight[key] = InFlightTranscription(progress_id)
+    running.task = asyncio.ensure_future(run_shared_transcription(key, running, file_path, file_hash, language, filename, mode, user_id, client_id, model, profile, timings))
+    try:
+        return await running.wait()
+    finally:
+        if not running.future.done() and running.waiters:
+            # Meneur parti, suivants encore là : la transcription continue sur son upload
+            detached_uploads.add(file_path)
+
+async def run_shared_transcription(key: Tuple[str, str, Optional[str], str], running: InFlightTranscription, file_path: str, file_hash: str, language: str, filename: str, mode: str, user_id: str, client_id: Optional[str], model: Optional[str], profile: str, timings: Optional[Dict[str, float]]):
+    """Transcription d'une entrée de in_flight, mise en cache puis publiée à tous ceux qui l'attendent"""
+    try:
+        result = await transcribe_file_safe(file_path, file_hash, language, filename, user_id, running.job_id, client_id, model, profile, timings)
+        result["metadata"]["processing_mode"] = mode
+        # Mise en cache avant de libérer la clé : un envoi ultérieur trouve le cache
+        if "cache_match" not in result["metadata"]:
+            # Un worker de la file partagée a déjà écrit son résultat dans le cache
+            if "worker" not in result["metadata"]:
+                await run_in_threadpool(save_cache, file_hash, language, result, timings)
+            metrics.inc("total_transcriptions")
+            metrics.inc(f"{mode}_jobs")
+        running.future.set_result(result)
+    except asyncio.CancelledError:
+        running.future.cancel()
+        raise
+    except Exception as e:
+        running.future.set_exception(e)
+    finally:
+        del in_flight[key]
+        job_store.untrack(running.job_id)
+        if file_path in detached_uploads:
+            detached_uploads.discard(file_path)
+            remove_upload(Path(file_path))
+
+def release_upload(upload_path: Path):
+    """Fin d'une requête : réservation d'admission libérée, upload supprimé sauf s'il sert encore à une transcription partagée"""
+    admission.release(str(upload_path))
+    if str(upload_path) not in detached_uploads:
+        remove_upload(upload_path)
+
+async def process_transcription_async(job_id: str, upload_path: Path, file_hash: str, filename: str, language: str, user_id: str, client_id: Optional[str] = None, model: Optional[str] = None, profile: Optional[str] = None, hold_when_full: bool = False):
+    """Traitement asynchrone avec file d'attente (job déjà enregistré dans job_store)
+
+    Sans profil fixé à l'envoi (envoi groupé), le profil est choisi selon la charge au moment du traitement.
+    hold_when_full : file pleine, le job attend qu'elle se vide au lieu d'échouer (envoi groupé).
+    """
+    try:
+        profile = profile or select_profile(client_id or user_id, model, None)
+        # Vérifier le cache (un job identique a pu se terminer entre-temps)
+        cached_result = await run_in_threadpool(load_cache, file_hash, language, model, profile)
+        if cached_result:
+            print(f"Utilisateur {user_id}: Cache hit pour {filename}")
+            await run_in_threadpool(job_store.complete, job_id, cached_result, transcript_id_for(file_hash, language, cached_result))
+            return
+
+        # Traitement avec file d'attente (le worker passe le job en "processing")
+        while True:
+            if hold_when_full:
+                await wait_for_queue_room()
             try:
-                os.unlink(tmp_file_path)
-            except:
-                pass
+                result = await transcribe_once(str(upload_path), file_hash, language, filename, "async", user_id, job_id=job_id, client_id=client_id, model=model, profile=profile)
+                break
+            except QueueFull:
+                if not hold_when_full:
+                    raise
+                # Place prise entre-temps par une autre requête (ou un autre processus API)
+                await asyncio.sleep(QUEUE_POLL_SECONDS)
+        
+        await run_in_threadpool(job_store.complete, job_id, result, transcript_id_for(file_hash, language, result))
                 
     except Exception as e:
         print(f"!!! Utilisateur {user_id}: Erreur async: {e} !!!")
-        jobs_status[job_id] = {"status": "error", "error": str(e)}
+        job_store.fail(job_id, str(e))
+
+    except asyncio.CancelledError:
+        # À l'arrêt du serveur le job reste inachevé : il est repris au redémarrage
+        if not job_store.stopping:
+            job_store.fail(job_id, "Transcription interrompue")
+        raise
+
+    finally:
+        release_upload(upload_path)
+
+# Les fichiers d'envois groupés attendent ici plutôt que dans la file de l'ordonnanceur
+bulk_slots = asyncio.Semaphore(max(1, BULK_PARALLEL_JOBS))
+
+async def wait_for_queue_room():
+    while workload.pending_count >= workload.max_queue_size:
+        await asyncio.sleep(QUEUE_POLL_SECONDS)
+
+async def run_bulk_job(job_id: str, upload_path: Path, file_hash: str, filename: str, language: str, user_id: str, client_id: Optional[str] = None, model: Optional[str] = None, profile: Optional[str] = None):
+    async with bulk_slots:
+        await process_transcription_async(job_id, upload_path, file_hash, filename, language, user_id, client_id, model, profile, hold_when_full=True)
+
+def resume_interrupted_jobs():
+    """Remet en file les jobs en attente ou en cours lors de l'arrêt précédent"""
+    for job in interrupted_jobs:
+        upload_path = Path(job["upload_path"])
+        if not upload_path.exists():
+            job_store.fail(job["job_id"], "Fichier perdu lors du redémarrage du serveur")
+            continue
+        print(f"Utilisateur {job['user_id']}: Reprise du job {job['job_id']} après redémarrage")
+        job_store.resume(job["job_id"], job["user_id"])
+        run = run_bulk_job if job["batch_id"] else process_transcription_async
+        asyncio.ensure_future(run(
+            job["job_id"], upload_path, job["file_hash"], job["filename"], job["language"], job["user_id"], job["client_id"], job["model"], job["profile"]
+        ))
+    interrupted_jobs.clear()
+
+def current_stats() -> Dict[str, Any]:
+    """Compteurs servis par /health"""
+    counters = metrics.counters()
+    processing_seconds = counters.get("processing_seconds", 0)
+    return {
+        **{name: counters.get(name, 0) for name in STAT_COUNTERS},
+        "concurrent_users": metrics.level("concurrent_users"),
+        "queue_length": workload.pending_count,
+        # Secondes d'audio transcrites par seconde de calcul
+        "avg_processing_speed": counters.get("audio_seconds", 0) / processing_seconds if processing_seconds else 0
+    }
+
+def per_model(read: Callable[[Dict[str, Any]], float]) -> Callable[[], Dict[str, float]]:
+    return lambda: {name: read(model) for name, model in model_registry.stats()["models"].items()}
+
+metrics.gauge("queue_depth", "Jobs en attente dans l'ordonnanceur", lambda: workload.pending_count)
+metrics.gauge("running_transcriptions", "Transcriptions en cours", lambda: workload.running_count)
+metrics.gauge("preprocessing", "Décodages audio en cours", lambda: preprocessor.in_progress)
+metrics.gauge("processing_rate", "Secondes de calcul par seconde d'audio (moyenne glissante)", lambda: workload.processing_rate)
+metrics.gauge("model_processing_rate", "Secondes de calcul par seconde d'audio, par modèle et profil de décodage", lambda: dict(workload.rates), label=("model", "profile"))
+metrics.gauge("predicted_wait_seconds", "Attente prévue d'un nouveau clip court", lambda: admission.estimate("", {"model_name": MODEL_SIZE, "profile": DECODING_PROFILE}, 0.0)["wait_seconds"])
+metrics.gauge("cache_hit_ratio", "Part des recherches dans le cache qui aboutissent", lambda: transcript_cache.stats()["hit_ratio"])
+metrics.gauge("fingerprint_hit_ratio", "Part des recherches par empreinte acoustique qui aboutissent", lambda: transcript_cache.stats()["fingerprint_hit_ratio"])
+metrics.gauge("model_loaded", "Modèle présent en mémoire", per_model(lambda model: int(model["loaded"])), label="model")
+metrics.gauge("model_load_seconds", "Durée moyenne de chargement du modèle", per_model(lambda model: model["load_seconds"] / model["loads"] if model["loads"] else 0.0), label="model")
 
 @app.get("/")
 async def root():
@@ -275,82 +1032,133 @@ async def root():
         "status": "ok",
         "version": "2.2.0",
         "model": MODEL_SIZE,
+        "models": model_registry.models,
         "device": DEVICE,
-        "model_loaded": whisper_model is not None,
+        "model_loaded": model_registry.is_loaded(MODEL_SIZE),
         "concurrent_support": True,
         "max_concurrent_transcriptions": MAX_CONCURRENT_TRANSCRIPTIONS,
-        "current_queue_length": active_transcriptions
+        "current_queue_length": workload.pending_count
     }
 
+@app.get("/ready")
+async def ready():
+    """Sonde de disponibilité : 503 tant que le modèle n'est pas chargé et préchauffé"""
+    if "ready_at" not in startup_report:
+        return JSONResponse(status_code=503, content={"status": "error" if "error" in startup_report else "starting", "startup": startup_report})
+    return {"status": "ready", "model_loaded": model_registry.is_loaded(MODEL_SIZE), "startup": startup_report}
+
 @app.get("/health")
 async def health():
     return {
         "status": "ok",
         "model": MODEL_SIZE,
         "device": DEVICE,
-        "stats": stats,
-        "active_jobs": len([j for j in jobs_status.values() if j["status"] == "processing"]),
-        "model_loaded": whisper_model is not None,
-        "queue_length": active_transcriptions,
-        "concurrent_users": stats.get("concurrent_users", 0)
+        "stats": current_stats(),
+        "stages": metrics.stage_summary(),
+        "cache": transcript_cache.stats(),
+        "segment_index": segment_index.stats(),
+        "active_jobs": len([j for j in list(job_store.active.values()) if j["status"] == "processing"]),
+        "model_loaded": model_registry.is_loaded(MODEL_SIZE),
+        "models": model_registry.stats(),
+        "ready": "ready_at" in startup_report,
+        "queue_length": workload.pending_count,
+        "concurrent_users": metrics.level("concurrent_users"),
+        **({"job_queue": await run_in_threadpool(job_queue.stats)} if job_queue is not None else {})
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Compteurs, histogrammes par étape et jauges au format Prometheus"""
+    text = await run_in_threadpool(metrics.render)
+    return Response(content=text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def resolve_requested_model(model: Optional[str]) -> str:
+    """Modèle demandé par le client (ou par défaut), refusé s'il n'est pas servi ici"""
+    try:
+        return model_registry.resolve(model)
+    except UnknownModel as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def get_client_id(request: Request) -> str:
+    """Identité utilisée pour l'équité entre utilisateurs (IP transmise par nginx)"""
+    forwarded = request.headers.get("x-real-ip")
+    if forwarded:
+        return forwarded
+    return request.client.host if request.client else "unknown"
+
 @app.post("/transcribe")
 async def transcribe_unified(
+    request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
-    language: str = "fr"
+    language: str = "fr",
+    model: Optional[str] = None,
+    profile: Optional[str] = None
 ):
-    """Transcription multi-utilisateurs avec file d'attente"""
+    """Transcription multi-utilisateurs avec file d'attente (model absent : routage automatique,
+    profile absent : profil de décodage choisi selon la charge)"""
     
     if not file.filename:
         raise HTTPException(status_code=400, detail="Nom de fichier manquant")
+    resolve_requested_model(model)
     
     # Générer un ID utilisateur unique
     user_id = str(uuid.uuid4())[:8]
+    client_id = get_client_id(request)
+    profile = select_profile(client_id, model, profile)
     
-    file_content = await file.read()
-    file_size = len(file_content)
+    timings = request.state.timings
+    upload_path, file_hash, file_size = await receive_upload(file, timings)
     file_size_mb = file_size / (1024 * 1024)
     
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"Fichier trop volumineux")
-    
     print(f"Utilisateur {user_id}: Fichier reçu {file.filename} ({file_size_mb:.1f}MB)")
     
     # Vérifier le cache
-    file_hash = hashlib.sha256(file_content).hexdigest()
-    cached_result = load_cache(file_hash)
-    if cached_result:
+    with metrics.time("cache_lookup", timings):
+        cached_response = await run_in_threadpool(load_cached_response, file_hash, language, request.headers.get("accept-encoding", ""), model, profile)
+    if cached_response:
         print(f"Utilisateur {user_id}: Résultat en cache")
-        return JSONResponse(content=cached_result)
+        remove_upload(upload_path)
+        return cached_response
     
     # Informer sur la file d'attente
-    current_queue = active_transcriptions
+    if workload.pending_count >= workload.max_queue_size:
+        remove_upload(upload_path)
+        raise queue_full()
+
+    current_queue = workload.pending_count + workload.running_count
     if current_queue > 0:
         print(f"Utilisateur {user_id}: {current_queue} transcription(s) en cours")
+
+    # Admission : attente prévue d'après la durée audio (lue dans l'en-tête) et la vitesse mesurée
+    duration = await run_in_threadpool(probe_duration, upload_path)
+    estimate = admit_upload(upload_path, client_id, model, profile, duration)
     
-    # Décision du mode
+    # Décision du mode : une requête synchrone qui dépasserait le délai du client passe en asynchrone
     is_large_file = file_size > LARGE_FILE_THRESHOLD
+    deferred = not is_large_file and estimate["completion_seconds"] > SYNC_MAX_WAIT_SECONDS
     
-    if is_large_file:
+    if is_large_file or deferred:
         # Mode asynchrone avec file d'attente
         job_id = str(uuid.uuid4())
-        estimated_minutes = max(1, int(file_size_mb / 8))
-        
-        # Ajouter le temps d'attente si file d'attente
-        if current_queue > 0:
-            estimated_minutes += current_queue * 2  # +2min par job en attente
+        estimated_seconds = math.ceil(estimate["completion_seconds"])
+        if deferred:
+            metrics.inc("deferred_requests")
+            print(f"Utilisateur {user_id}: Fin prévue dans {estimated_seconds / 60:.0f}min, passage en asynchrone")
         
         print(f"Utilisateur {user_id}: Job asynchrone {job_id}")
         
-        background_tasks.add_task(process_transcription_async, job_id, file_content, file.filename, language, user_id)
+        # Enregistré avant la réponse : le job survit à un redémarrage et /status le trouve immédiatement
+        await run_in_threadpool(job_store.create, job_id, user_id, client_id, file.filename, language, file_hash, upload_path, model, None, profile)
+        background_tasks.add_task(process_transcription_async, job_id, upload_path, file_hash, file.filename, language, user_id, client_id, model, profile)
         
         return {
             "job_id": job_id, 
             "status": "queued", 
-            "estimated_time_minutes": estimated_minutes,
-            "queue_position": current_queue + 1,
+            "estimated_time_minutes": max(1, math.ceil(estimated_seconds / 60)),
+            "estimated_time_seconds": estimated_seconds,
+            "queue_position": estimate["queue_position"],
+            "decoding_profile": profile,
             "mode": "async",
             "user_id": user_id
         }
@@ -358,62 +1166,361 @@ async def transcribe_unified(
     else:
         # Mode synchrone avec file d'attente
         print(f"Utilisateur {user_id}: Traitement synchrone")
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-            tmp_file.write(file_content)
-            tmp_file_path = tmp_file.name
     
         try:
-            result = transcribe_file_safe(tmp_file_path, language, file.filename, user_id)
-            result["metadata"]["processing_mode"] = "sync"
+            result = await transcribe_once(str(upload_path), file_hash, language, file.filename, "sync", user_id, client_id=client_id, model=model, profile=profile, timings=timings)
         
-            save_cache(file_hash, result)
-            stats["total_transcriptions"] += 1
-            stats["sync_jobs"] += 1
-        
-            return JSONResponse(content=result)
+            with metrics.time("serialize", timings):
+                return JSONResponse(content=result)
         
+        except QueueFull:
+            raise queue_full()
+
         except Exception as e:
             error_msg = f"Erreur transcription: {str(e)}"
             print(f"!!! Utilisateur {user_id}: {error_msg} !!!")
             raise HTTPException(status_code=500, detail=error_msg)
     
         finally:
+            release_upload(upload_path)
+
+@app.post("/transcribe/batch")
+async def transcribe_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    language: str = "fr",
+    model: Optional[str] = None,
+    profile: Optional[str] = None
+):
+    """Envoi groupé : plusieurs fichiers et/ou archives zip/tar, un job asynchrone par fichier audio"""
+    resolve_requested_model(model)
+    user_id = str(uuid.uuid4())[:8]
+    client_id = get_client_id(request)
+    # Sans profil imposé, chaque fichier prend celui de la charge au moment de son traitement
+    if profile:
+        profile = select_profile(client_id, model, profile)
+    batch_id = str(uuid.uuid4())
+
+    entries: List[Tuple[str, Path, str]] = []
+    try:
+        for file in files:
+            if not file.filename:
+                raise HTTPException(status_code=400, detail="Nom de fichier manquant")
+            upload_path, file_hash, _ = await receive_upload(file)
+            if not is_archive(file.filename):
+                entries.append((file.filename, upload_path, file_hash))
+                continue
             try:
-                if os.path.exists(tmp_file_path):
-                    os.unlink(tmp_file_path)
-            except Exception as cleanup_error:
-                print(f"!!! Erreur nettoyage: {cleanup_error} !!!")
+                entries += await run_in_threadpool(extract_archive, upload_path)
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                raise HTTPException(status_code=400, detail=f"Archive illisible {file.filename}: {e}")
+            except UploadTooLarge:
+                raise HTTPException(status_code=400, detail=f"Archive trop volumineuse {file.filename}")
+            finally:
+                remove_upload(upload_path)
+    except BaseException:
+        for _, upload_path, _ in entries:
+            remove_upload(upload_path)
+        raise
+    if not entries:
+        raise HTTPException(status_code=400, detail="Aucun fichier dans l'envoi")
+
+    job_ids = [str(uuid.uuid4()) for _ in entries]
+
+    def create_jobs():
+        for job_id, (filename, upload_path, file_hash) in zip(job_ids, entries):
+            job_store.create(job_id, user_id, client_id, filename, language, file_hash, upload_path, model, batch_id, profile)
+
+    await run_in_threadpool(create_jobs)
+    for job_id, (filename, upload_path, file_hash) in zip(job_ids, entries):
+        asyncio.ensure_future(run_bulk_job(job_id, upload_path, file_hash, filename, language, user_id, client_id, model, profile))
+
+    print(f"Utilisateur {user_id}: Envoi groupé {batch_id} ({len(entries)} fichiers)")
+    return {
+        "batch_id": batch_id,
+        "status": "queued",
+        "mode": "batch",
+        "total_files": len(entries),
+        "files": [{"job_id": job_id, "filename": filename} for job_id, (filename, _, _) in zip(job_ids, entries)],
+        "user_id": user_id
+    }
+
+@app.get("/transcribe/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Statut de chaque fichier d'un envoi groupé (résultats via /transcribe/result/{job_id})"""
+    files = await run_in_threadpool(job_store.batch, batch_id)
+    if not files:
+        raise HTTPException(status_code=404, detail="Envoi groupé non trouvé")
+    counts: Dict[str, int] = {}
+    for entry in files:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    finished = counts.get("completed", 0) + counts.get("error", 0)
+    return {
+        "batch_id": batch_id,
+        "status": "completed" if finished == len(files) else ("queued" if counts.get("queued", 0) == len(files) else "processing"),
+        "total_files": len(files),
+        "counts": counts,
+        "progress": sum(entry["progress"] for entry in files) // len(files),
+        "files": files
+    }
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def stream_cached_result(result: Dict[str, Any]):
+    for segment_data in result["segments"]:
+        yield sse_event("segment", segment_data)
+    yield sse_event("done", {"info": result["info"], "metadata": result["metadata"], "cached": True})
+
+async def stream_job_events(job_id: str, queue_position: int, result_future: Awaitable[Dict[str, Any]], events: asyncio.Queue):
+    yield sse_event("queued", {"job_id": job_id, "queue_position": queue_position})
+    while True:
+        event, data = await events.get()
+        if event != "segment":
+            break
+        yield sse_event("segment", data)
+    try:
+        result = await result_future
+        yield sse_event("done", {"info": result["info"], "metadata": {**result["metadata"], "processing_mode": "stream"}})
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Erreur transcription: {str(e)}"})
+
+async def finalize_stream_job(job: ScheduledJob, file_hash: str, language: str, upload_path: Path):
+    """Mise en cache du résultat, même si le client s'est déconnecté en cours de route"""
+    try:
+        result = await asyncio.wrap_future(job.future)
+        result["metadata"]["processing_mode"] = "stream"
+        await run_in_threadpool(save_cache, file_hash, language, result)
+        metrics.inc("total_transcriptions")
+    except Exception:
+        pass  # Erreur déjà journalisée par run_transcription et envoyée au client
+    finally:
+        remove_upload(upload_path)
+
+async def finalize_remote_stream(remote_id: str, upload_path: Path, events: asyncio.Queue) -> Dict[str, Any]:
+    """Job confié à un worker : suivi jusqu'au bout même si le client s'est déconnecté"""
+    try:
+        result = await await_remote(remote_id, on_segment=lambda segment_data: events.put_nowait(("segment", segment_data)))
+        metrics.inc("total_transcriptions")
+        return result
+    finally:
+        events.put_nowait(("done", None))
+        remove_upload(upload_path)
+
+@app.post("/transcribe/stream")
+async def transcribe_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    language: str = "fr",
+    model: Optional[str] = None,
+    profile: Optional[str] = None
+):
+    """Transcription en direct (Server-Sent Events) : chaque segment est envoyé dès que le décodeur le produit"""
+
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="Nom de fichier manquant")
+    resolve_requested_model(model)
+
+    user_id = str(uuid.uuid4())[:8]
+    client_id = get_client_id(request)
+    profile = select_profile(client_id, model, profile)
+
+    timings = request.state.timings
+    upload_path, file_hash, file_size = await receive_upload(file, timings)
+    print(f"Utilisateur {user_id}: Fichier reçu {file.filename} ({file_size / (1024 * 1024):.1f}MB), mode streaming")
+
+    with metrics.time("cache_lookup", timings):
+        cached_result = await run_in_threadpool(load_cache, file_hash, language, model, profile)
+    if cached_result:
+        remove_upload(upload_path)
+        return StreamingResponse(stream_cached_result(cached_result), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    duration = await run_in_threadpool(probe_duration, upload_path)
+    admit_upload(upload_path, client_id, model, profile, duration)
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    if job_queue is not None:
+        try:
+            remote_id = await run_in_threadpool(enqueue_remote, str(upload_path), file_hash, language, file.filename, user_id, None, model, profile)
+            remote_status = await run_in_threadpool(job_queue.status, remote_id)
+        except QueueFull:
+            remove_upload(upload_path)
+            raise queue_full()
+        finally:
+            admission.release(str(upload_path))
+        remote_task = asyncio.ensure_future(finalize_remote_stream(remote_id, upload_path, events))
+        return StreamingResponse(stream_job_events(remote_id, remote_status.get("queue_position", 0), asyncio.shield(remote_task), events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    def on_segment(segment_data: Dict[str, Any]):
+        loop.call_soon_threadsafe(events.put_nowait, ("segment", segment_data))
+
+    try:
+        try:
+            prepared = await prepare_upload(str(upload_path), timings)
+        except Exception as e:
+            remove_upload(upload_path)
+            raise HTTPException(status_code=400, detail=f"Fichier audio illisible: {str(e)}")
+
+        cached_result = await find_reencoded_copy(prepared, file_hash, language, model, profile, timings)
+        if cached_result:
+            remove_upload(upload_path)
+            return StreamingResponse(stream_cached_result(cached_result), media_type="text/event-stream", headers=SSE_HEADERS)
+
+        previous_version = await find_previous_version(prepared, file_hash, language, model, profile, timings)
+        try:
+            job = submit_transcription(str(upload_path), prepared, language, file.filename, user_id, None, client_id, on_segment, model, profile, timings, previous_version)
+        except QueueFull:
+            remove_upload(upload_path)
+            raise queue_full()
+    finally:
+        admission.release(str(upload_path))
+
+    # Les segments sont publiés avant la fin du future : "done" arrive toujours en dernier
+    job.future.add_done_callback(lambda _: loop.call_soon_threadsafe(events.put_nowait, ("done", None)))
+    asyncio.ensure_future(finalize_stream_job(job, file_hash, language, upload_path))
+
+    return StreamingResponse(stream_job_events(job.job_id, job.queue_position, asyncio.wrap_future(job.future), events), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @app.get("/transcribe/status/{job_id}")
 async def get_job_status(job_id: str):
-    if job_id not in jobs_status:
+    status = await run_in_threadpool(job_store.get, job_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Job non trouvé")
     
-    status = jobs_status[job_id].copy()
-    status["current_queue_length"] = active_transcriptions
+    # Les segments partiels sont servis par /transcribe/result
+    segments = status.pop("segments", None)
+    if segments is not None:
+        status["segments_done"] = len(segments)
+    status["current_queue_length"] = workload.pending_count
+    # Un job qui attend un envoi identique occupe la place de celui-ci
+    position = await run_in_threadpool(workload.position, job_store.leader_of(job_id))
+    if position:
+        status["queue_position"] = position["position"]
+        status["expected_start"] = position.get("expected_start")
+        status["expected_end"] = position["expected_end"]
+        processed, duration = status.get("processed_until"), status.get("duration")
+        if position["position"] == 0 and processed and duration:
+            # En cours : extrapolation de la vitesse observée sur ce job
+            elapsed = time.time() - position["started_at"]
+            status["expected_end"] = time.time() + elapsed * max(0.0, duration - processed) / processed
+        status["estimated_time_seconds"] = max(0, math.ceil(status["expected_end"] - time.time()))
+    if job_queue is not None and status["status"] in ("queued", "processing"):
+        remote = await run_in_threadpool(job_queue.status, job_store.leader_of(job_id))
+        if remote is not None:
+            if "worker_id" in remote:
+                status["worker"] = remote["worker_id"]
+            # Job suivi par un autre processus API : la progression n'est que dans la file
+            if job_id not in job_store.active and remote["status"] == "leased":
+                status["status"] = "processing"
+                status.update({key: remote[key] for key in ("progress", "processed_until", "duration", "segments_done") if key in remote})
     return status
 
+def load_result_page(job_id: str, start: Optional[float], end: Optional[float], offset: int, limit: int) -> Optional[Dict[str, Any]]:
+    """Page du résultat d'un job terminé, lue dans l'index des segments ; à défaut (entrée évincée
+    du cache, job antérieur à l'index) découpée dans le résultat complet"""
+    transcript_id = job_store.transcript_of(job_id)
+    page = segment_index.segments(transcript_id, start, end, offset, limit) if transcript_id else None
+    if page is not None:
+        return page
+    result = job_store.load_result(job_id)
+    if result is None:
+        return None
+    return {
+        "transcript_id": transcript_id,
+        "filename": result["metadata"].get("filename"),
+        "model": result["metadata"].get("model"),
+        "decoding_profile": result["metadata"].get("decoding_profile"),
+        "language": result["info"].get("language"),
+        "duration": result["info"].get("duration"),
+        **page_segments(result["segments"], start, end, offset, limit)
+    }
+
 @app.get("/transcribe/result/{job_id}")
-async def get_job_result(job_id: str):
-    if job_id not in jobs_status:
+async def get_job_result(
+    job_id: str,
+    start: Optional[float] = Query(None, alias="from", ge=0),
+    end: Optional[float] = Query(None, alias="to", ge=0),
+    offset: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=SEGMENT_PAGE_MAX)
+):
+    """Résultat complet, ou seulement les segments demandés avec ?from=&to= (secondes) et/ou ?offset=&limit="""
+    job = job_store.live(job_id) or await run_in_threadpool(job_store.get, job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job non trouvé")
+    paged = start is not None or end is not None or offset is not None or limit is not None
+    offset, limit = offset or 0, limit or SEGMENT_PAGE_SIZE
     
-    job = jobs_status[job_id]
-    if job["status"] != "completed":
-        raise HTTPException(status_code=400, detail=f"Job pas encore terminé")
-    
-    return job["result"]
+    if job["status"] == "completed":
+        if paged:
+            page = await run_in_threadpool(load_result_page, job_id, start, end, offset, limit)
+            if page is None:
+                raise HTTPException(status_code=404, detail="Résultat expiré")
+            return {"job_id": job_id, "partial": False, **page}
+        result = await run_in_threadpool(job_store.load_result, job_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Résultat expiré")
+        return {**result, "partial": False}
+
+    if job["status"] == "processing" and "segments" in job:
+        segments = list(job["segments"])
+        progress = {
+            "progress": job["progress"],
+            "processed_until": job.get("processed_until", 0.0),
+            "duration": job.get("duration")
+        }
+        if paged:
+            return {"job_id": job_id, "partial": True, **page_segments(segments, start, end, offset, limit), **progress}
+        return {
+            "partial": True,
+            "text": " ".join(segment["text"] for segment in segments),
+            "segments": segments,
+            **progress
+        }
+
+    raise HTTPException(status_code=400, detail=f"Job pas encore terminé")
+
+@app.get("/transcripts/search")
+async def search_transcripts(
+    q: str = Query(..., min_length=1),
+    language: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Segments de toutes les transcriptions en cache qui contiennent tous les mots de q"""
+    results = await run_in_threadpool(segment_index.search, q, language, offset, limit)
+    return {"query": q, "offset": offset, "limit": limit, "results": results}
+
+@app.get("/transcripts/{transcript_id}")
+async def get_transcript_segments(
+    transcript_id: str,
+    start: Optional[float] = Query(None, alias="from", ge=0),
+    end: Optional[float] = Query(None, alias="to", ge=0),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(SEGMENT_PAGE_SIZE, ge=1, le=SEGMENT_PAGE_MAX)
+):
+    """Segments d'une transcription trouvée par la recherche, page par page"""
+    page = await run_in_threadpool(segment_index.segments, transcript_id, start, end, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Transcription non trouvée")
+    return page
 
 @app.get("/queue/status")
 async def get_queue_status():
     """Statut de la file d'attente pour tous les utilisateurs"""
+    counts = await run_in_threadpool(job_store.counts)
     return {
-        "active_transcriptions": active_transcriptions,
-        "total_jobs": len(jobs_status),
-        "processing_jobs": len([j for j in jobs_status.values() if j["status"] == "processing"]),
-        "queued_jobs": len([j for j in jobs_status.values() if j["status"] == "queued"]),
-        "model_loaded": whisper_model is not None
+        "active_transcriptions": workload.running_count,
+        "total_jobs": sum(counts.values()),
+        "processing_jobs": counts["processing"],
+        "queued_jobs": counts["queued"],
+        "model_loaded": model_registry.is_loaded(MODEL_SIZE),
+        "preprocessing": preprocessor.in_progress,
+        "scheduler": await run_in_threadpool(workload.snapshot),
+        **({"job_queue": await run_in_threadpool(job_queue.stats)} if job_queue is not None else {})
     }
 
 if __name__ == "__main__":
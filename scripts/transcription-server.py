@@ -12,14 +12,14 @@ from typing import Dict, Any
 import uvicorn
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from faster_whisper import WhisperModel
-import torch
+import ctranslate2
 
 # Configuration
 MODEL_SIZE = "large-v3"  # Meilleure qualité
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-COMPUTE_TYPE = "float16" if torch.cuda.is_available() else "int8"
+DEVICE = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "int8"
 CACHE_DIR = Path("./cache")
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
 
@@ -174,6 +174,108 @@ async def transcribe(file: UploadFile = File(...), language: str = Form("fr")):
             pass
 
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formate un évènement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def stream_cached_result(result: Dict[str, Any]):
+    for segment_data in result["segments"]:
+        yield sse_event("segment", segment_data)
+    yield sse_event("done", {"info": result["info"], "metadata": result["metadata"], "cached": True})
+
+def stream_transcription(tmp_file_path: str, file_hash: str, filename: str, language: str):
+    """Générateur SSE : chaque segment part dès que le décodeur le produit"""
+    try:
+        print(f"🎵 Transcription (streaming) de {filename}...")
+        start_time = time.time()
+
+        segments, info = whisper_model.transcribe(
+            tmp_file_path,
+            language=language if language != "auto" else None,
+            beam_size=5,
+            temperature=0.0,
+            vad_filter=True
+        )
+
+        segments_list = []
+        full_text = ""
+
+        for segment in segments:
+            segment_data = {
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text.strip()
+            }
+            segments_list.append(segment_data)
+            full_text += segment.text.strip() + " "
+            yield sse_event("segment", segment_data)
+
+        processing_time = time.time() - start_time
+
+        result = {
+            "text": full_text.strip(),
+            "segments": segments_list,
+            "info": {
+                "language": info.language,
+                "duration": info.duration,
+                "processing_time": processing_time,
+                "speed_ratio": info.duration / processing_time if processing_time > 0 else 0
+            },
+            "metadata": {
+                "filename": filename,
+                "model": MODEL_SIZE,
+                "device": DEVICE
+            }
+        }
+
+        save_cache(file_hash, result)
+        stats["total_transcriptions"] += 1
+
+        print(f"✅ Transcription terminée en {processing_time:.2f}s")
+        yield sse_event("done", {"info": result["info"], "metadata": result["metadata"]})
+
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Erreur: {str(e)}"})
+
+    finally:
+        try:
+            os.unlink(tmp_file_path)
+        except:
+            pass
+
+@app.post("/transcribe/stream")
+async def transcribe_stream(file: UploadFile = File(...), language: str = Form("fr")):
+    """Transcrit un fichier audio en envoyant les segments au fil de l'eau (SSE)"""
+
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="Nom de fichier manquant")
+
+    file_content = await file.read()
+    if len(file_content) > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="Fichier trop volumineux (max 500MB)")
+
+    file_hash = hashlib.sha256(file_content).hexdigest()
+    cached_result = load_cache(file_hash)
+    if cached_result:
+        print(f"📋 Cache hit pour {file.filename}")
+        return StreamingResponse(stream_cached_result(cached_result), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    load_model()
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
+        tmp_file.write(file_content)
+        tmp_file_path = tmp_file.name
+
+    # Le générateur synchrone est consommé dans le threadpool par Starlette
+    return StreamingResponse(
+        stream_transcription(tmp_file_path, file_hash, file.filename, language),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
 if __name__ == "__main__":
     print("🚀 Démarrage du serveur de transcription...")
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info", timeout_keep_alive=600)
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""Worker de transcription : prend les jobs de la file partagée et publie les résultats dans le cache
+
+    JOB_QUEUE=sqlite:///srv/retexte/jobs/queue.sqlite3 python scripts/transcription-worker.py --device-index 1
+
+Le serveur lancé avec la même JOB_QUEUE ne fait plus que l'API (réception, cache, suivi des jobs).
+Plusieurs workers par machine (un par GPU ou par nœud NUMA, voir start-production.sh) et plusieurs
+machines se partagent la file ; les envois (uploads/) et le cache doivent être visibles de tous.
+Un job est pris sous bail, prolongé par des battements de cœur qui remontent progression et
+segments ; un worker arrêté rend son job, un worker perdu le laisse expirer, et le suivant reprend
+après les segments déjà remontés.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import ctranslate2
+from faster_whisper import WhisperModel, decode_audio
+
+from audio_preprocessing import SAMPLING_RATE
+from decoding import DECODING_PROFILES
+from job_queue import LeaseLost, QueuedJob, default_worker_id, open_queue
+from model_registry import ModelRegistry
+from segment_index import SegmentIndex
+from transcript_cache import TranscriptCache, make_cache_key
+from transcription_result import build_result, format_segment, resume_after, segment_progress
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+CACHE_DIR = PROJECT_DIR / "cache"
+JOB_QUEUE = os.getenv("JOB_QUEUE", f"sqlite://{PROJECT_DIR / 'jobs' / 'queue.sqlite3'}")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "medium")
+AVAILABLE_MODELS = os.getenv("MODELS", "small,medium,large-v3")
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", 6144))
+FINISHED_JOBS_TTL = float(os.getenv("JOB_TTL_HOURS", 24)) * 3600
+
+
+class Heartbeat:
+    """Prolonge le bail en arrière-plan (le décodage d'un segment peut durer) et remonte les segments"""
+
+    def __init__(self, queue, job_id: str, worker_id: str, interval: float):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lost = threading.Event()
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._progress: Dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def update(self, progress: Dict[str, Any], segment: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._progress = progress
+            if segment is not None:
+                self._pending.append(segment)
+
+    def flush(self):
+        with self._lock:
+            segments, self._pending = self._pending, []
+            progress = dict(self._progress)
+        try:
+            self.queue.heartbeat(self.job_id, self.worker_id, progress, segments)
+        except LeaseLost:
+            self.lost.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"!!! Erreur battement de cœur {self.job_id}: {e} !!!")
+
+
+def transcribe(job: QueuedJob, model: WhisperModel, heartbeat: Heartbeat, previous: List[Dict[str, Any]], stop: threading.Event, worker_id: str, device: str) -> Optional[Dict[str, Any]]:
+    """Résultat au format du serveur, ou None si le job est abandonné (bail perdu, arrêt du worker)"""
+    payload = job.payload
+    profile = payload["profile"]
+    language = payload["language"]
+    file_size = os.path.getsize(payload["file_path"])
+    audio = decode_audio(payload["file_path"], sampling_rate=SAMPLING_RATE)
+    total_duration = len(audio) / SAMPLING_RATE
+
+    # Reprise d'un job dont le worker précédent a disparu : seul l'audio après ses segments est décodé
+    audio, resume_offset = resume_after(audio, previous)
+    if resume_offset > 0:
+        print(f"Job {job.job_id}: reprise à {resume_offset:.0f}s ({len(previous)} segments déjà produits)")
+
+    start_time = time.time()
+    segments_gen, info = model.transcribe(
+        audio,
+        language=language if language != "auto" else None,
+        **DECODING_PROFILES[profile].options
+    )
+    segments = list(previous)
+    heartbeat.update({"progress": 20, "processed_until": resume_offset, "duration": total_duration})
+    for segment in segments_gen:
+        segment_data = format_segment(segment, resume_offset)
+        segments.append(segment_data)
+        heartbeat.update({"progress": segment_progress(segment_data["end"], total_duration), "processed_until": segment_data["end"], "duration": total_duration}, segment_data)
+        if heartbeat.lost.is_set() or stop.is_set():
+            return None
+
+    processing_time = time.time() - start_time
+    return build_result(segments, info, total_duration, processing_time, file_size, {
+        "filename": payload["filename"],
+        "model": payload["model_name"],
+        "decoding_profile": profile,
+        "device": device,
+        "worker": worker_id,
+        "processing_mode": "network",
+        "long_file_mode": False,
+        "batch_size": 1,
+        "resumed_from": resume_offset,
+        "user_id": payload["user_id"],
+        "queue_position": 0
+    })
+
+
+def record_rate(rates: Dict[str, Dict[str, float]], payload: Dict[str, Any], result: Dict[str, Any]):
+    """Vitesse mesurée sur l'audio réellement décodé par ce worker (après reprise éventuelle)"""
+    decoded = result["info"]["duration"] - result["metadata"]["resumed_from"]
+    if decoded <= 0:
+        return
+    sample = result["info"]["processing_time"] / decoded
+    profiles = rates.setdefault(payload["model_name"], {})
+    profiles[payload["profile"]] = 0.8 * profiles.get(payload["profile"], sample) + 0.2 * sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de transcription de la file partagée")
+    parser.add_argument("--queue", default=JOB_QUEUE, help="File de jobs (sqlite:///chemin/queue.sqlite3)")
+    parser.add_argument("--models", default=AVAILABLE_MODELS, help="Modèles servis par ce worker, séparés par des virgules")
+    parser.add_argument("--device-index", type=int, default=0, help="GPU utilisé par ce worker")
+    parser.add_argument("--cpu-threads", type=int, default=max(1, min(8, os.cpu_count() or 4)))
+    parser.add_argument("--memory-budget-mb", type=int, default=MODEL_MEMORY_BUDGET_MB)
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--worker-id", default=default_worker_id())
+    parser.add_argument("--lease-seconds", type=float, default=60.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Attente entre deux recherches quand la file est vide")
+    args = parser.parse_args()
+
+    cuda_devices = ctranslate2.get_cuda_device_count()
+    device = "cuda" if cuda_devices > 0 else "cpu"
+    compute_type = "float16" if cuda_devices > 0 else "int8"
+    models = [name.strip() for name in args.models.split(",") if name.strip()]
+    default_model = DEFAULT_MODEL if DEFAULT_MODEL in models else models[0]
+
+    def create_model(name: str) -> WhisperModel:
+        return WhisperModel(name, device=device, device_index=args.device_index, compute_type=compute_type, cpu_threads=args.cpu_threads)
+
+    registry = ModelRegistry(
+        create_model,
+        models,
+        default_model=default_model,
+        memory_budget_mb=args.memory_budget_mb,
+        memory_factor=2.0 if compute_type == "float16" else 1.0,
+    )
+    queue = open_queue(args.queue, lease_seconds=args.lease_seconds)
+    # Pas d'éviction ici : le budget du cache est tenu par le serveur
+    cache = TranscriptCache(args.cache_dir, max_bytes=CACHE_MAX_BYTES)
+    index = SegmentIndex(args.cache_dir)
+    # rates[modèle][profil] : secondes de calcul par seconde d'audio (moyenne glissante), lues par le contrôle d'admission de l'API
+    info = {"host": socket.gethostname(), "pid": os.getpid(), "device": f"{device}:{args.device_index}" if device == "cuda" else device, "models": models, "rates": {}}
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    print(f"Worker {args.worker_id} ({info['device']}, modèles {', '.join(models)}) sur {args.queue}")
+    last_cleanup = 0.0
+    while not stop.is_set():
+        queue.touch_worker(args.worker_id, info)
+        job = queue.claim(args.worker_id, models)
+        if job is None:
+            if time.time() - last_cleanup > 600:
+                queue.remove_finished(FINISHED_JOBS_TTL)
+                last_cleanup = time.time()
+            stop.wait(args.poll_interval)
+            continue
+
+        payload = job.payload
+        print(f"Job {job.job_id}: {payload['filename']} (modèle {payload['model_name']}, profil {payload['profile']}, essai {job.attempts})")
+        try:
+            with Heartbeat(queue, job.job_id, args.worker_id, args.lease_seconds / 3) as heartbeat:
+                with registry.acquire(payload["model_name"]) as model:
+                    result = transcribe(job, model, heartbeat, queue.segments(job.job_id), stop, args.worker_id, info["device"])
+                if result is None:
+                    if heartbeat.lost.is_set():
+                        print(f"!!! Job {job.job_id}: bail perdu, abandonné !!!")
+                    else:
+                        # Arrêt demandé : les segments produits sont remontés, un autre worker reprend après eux
+                        heartbeat.flush()
+                        queue.release(job.job_id, args.worker_id)
+                        print(f"Job {job.job_id}: rendu à la file")
+                    continue
+            options = DECODING_PROFILES[payload["profile"]].options
+            key = make_cache_key(payload["file_hash"], payload["model_name"], payload["language"], options)
+            cache.put(key, result, payload["file_hash"], payload["model_name"], payload["language"], options)
+            index.add(key, payload["file_hash"], result)
+            queue.complete(job.job_id, args.worker_id, key)
+            record_rate(info["rates"], payload, result)
+            print(f"OK Job {job.job_id}: {result['info']['duration']:.0f}s d'audio en {result['info']['processing_time']:.1f}s")
+        except LeaseLost:
+            print(f"!!! Job {job.job_id}: bail perdu, abandonné !!!")
+        except Exception as e:
+            print(f"!!! Job {job.job_id}: {e} !!!")
+            try:
+                queue.fail(job.job_id, args.worker_id, str(e))
+            except LeaseLost:
+                pass
+    print(f"Worker {args.worker_id} arrêté")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Résultat d'une transcription, commun au serveur et aux workers de la file partagée
+
+Reprise après les segments déjà produits, mise en forme des segments décodés, progression
+et assemblage du résultat tel qu'il est mis en cache et renvoyé aux clients.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from audio_preprocessing import SAMPLING_RATE
+
+
+def resume_after(audio: np.ndarray, previous: List[Dict[str, Any]]) -> Tuple[np.ndarray, float]:
+    """Audio restant après les segments déjà produits, et son décalage en secondes"""
+    resume_offset = previous[-1]["end"] if previous else 0.0
+    if resume_offset > 0:
+        audio = audio[int(resume_offset * SAMPLING_RATE):]
+    return audio, resume_offset
+
+
+def format_segment(segment, resume_offset: float = 0.0) -> Dict[str, Any]:
+    """Segment décodé (sur l'audio restant) replacé sur l'audio complet"""
+    return {
+        "start": round(segment.start + resume_offset, 3) if resume_offset else segment.start,
+        "end": round(segment.end + resume_offset, 3) if resume_offset else segment.end,
+        "text": segment.text.strip()
+    }
+
+
+def segment_progress(processed_until: float, total_duration: float) -> int:
+    """Progression : 20 % à la fin du VAD, 90 % au dernier segment"""
+    if total_duration <= 0:
+        return 20
+    return 20 + int(min(1.0, processed_until / total_duration) * 70)
+
+
+def build_result(segments: List[Dict[str, Any]], info, total_duration: float, processing_time: float, file_size: int, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Résultat complet ; metadata : champs propres à l'exécutant (modèle, profil, device...)"""
+    file_size_mb = file_size / (1024 * 1024)
+    return {
+        "text": " ".join(segment["text"] for segment in segments).strip(),
+        "segments": segments,
+        "info": {
+            "language": info.language,
+            "duration": total_duration,
+            "processing_time": processing_time,
+            "speed_ratio": info.duration / processing_time if processing_time > 0 else 0,
+            "total_segments": len(segments),
+            "processing_speed_mb_per_min": (file_size_mb / processing_time) * 60 if processing_time > 0 else 0
+        },
+        "metadata": {**metadata, "file_size_mb": file_size_mb}
+    }
@@ -5,23 +5,59 @@ echo "🚀 Démarrage ReTexte Production..."
 # Créer les dossiers si nécessaire
 mkdir -p cache logs jobs
 
+# Workers de transcription séparés (TRANSCRIPTION_WORKERS > 0) : le serveur Python ne fait plus que l'API
+TRANSCRIPTION_WORKERS=${TRANSCRIPTION_WORKERS:-0}
+if [ "$TRANSCRIPTION_WORKERS" -gt 0 ]; then
+    export JOB_QUEUE=${JOB_QUEUE:-sqlite://jobs/queue.sqlite3}
+fi
+
 # Démarrer le serveur Python en arrière-plan
 echo "🐍 Démarrage du serveur de transcription..."
 python scripts/transcription-server-async.py &
 PYTHON_PID=$!
 
-# Attendre que le serveur Python soit prêt
-echo "⏳ Attente du serveur Python..."
-sleep 5
-
-# Vérifier que le serveur Python fonctionne
-if ! curl -f http://localhost:8000/health > /dev/null 2>&1; then
-    echo "❌ Erreur: Le serveur Python n'a pas démarré correctement"
-    exit 1
-fi
+# Attendre que le modèle soit chargé et préchauffé (/health répond avant, /ready seulement ensuite)
+echo "⏳ Attente du serveur Python (chargement du modèle)..."
+READY_TIMEOUT=${READY_TIMEOUT:-600}
+WAITED=0
+until curl -sf http://localhost:8000/ready > /dev/null 2>&1; do
+    if ! kill -0 $PYTHON_PID 2>/dev/null; then
+        echo "❌ Erreur: Le serveur Python n'a pas démarré correctement"
+        exit 1
+    fi
+    if [ $WAITED -ge $READY_TIMEOUT ]; then
+        echo "❌ Erreur: Le serveur Python n'est pas prêt après ${READY_TIMEOUT}s"
+        curl -s http://localhost:8000/ready
+        kill $PYTHON_PID 2>/dev/null
+        exit 1
+    fi
+    sleep 1
+    WAITED=$((WAITED + 1))
+done
 
 echo "✅ Serveur Python prêt"
 
+# Un worker par GPU, ou par nœud NUMA sur CPU (calcul et mémoire sur le même nœud)
+WORKER_PIDS=""
+if [ "$TRANSCRIPTION_WORKERS" -gt 0 ]; then
+    echo "🧵 Démarrage de $TRANSCRIPTION_WORKERS worker(s) de transcription..."
+    GPU_COUNT=$(nvidia-smi -L 2>/dev/null | wc -l)
+    NUMA_NODES=$(ls -d /sys/devices/system/node/node[0-9]* 2>/dev/null | wc -l)
+    CPU_THREADS=$(( $(nproc) / TRANSCRIPTION_WORKERS ))
+    [ "$CPU_THREADS" -lt 1 ] && CPU_THREADS=1
+    for i in $(seq 0 $((TRANSCRIPTION_WORKERS - 1))); do
+        DEVICE_INDEX=0
+        [ "$GPU_COUNT" -gt 0 ] && DEVICE_INDEX=$((i % GPU_COUNT))
+        WORKER_CMD="python scripts/transcription-worker.py --device-index $DEVICE_INDEX --cpu-threads $CPU_THREADS"
+        if [ "$NUMA_NODES" -gt 1 ] && command -v numactl > /dev/null; then
+            NODE=$((i % NUMA_NODES))
+            WORKER_CMD="numactl --cpunodebind=$NODE --membind=$NODE $WORKER_CMD"
+        fi
+        $WORKER_CMD > logs/worker-$i.log 2>&1 &
+        WORKER_PIDS="$WORKER_PIDS $!"
+    done
+fi
+
 # Démarrer l'application Next.js
 echo "🌐 Démarrage de l'application web..."
 npm start &
@@ -34,7 +70,7 @@ echo "🔌 API serveur: http://localhost:8000"
 # Fonction pour arrêter proprement les processus
 cleanup() {
     echo "🛑 Arrêt des services..."
-    kill $PYTHON_PID $NEXTJS_PID 2>/dev/null
+    kill $PYTHON_PID $NEXTJS_PID $WORKER_PIDS 2>/dev/null
     exit 0
 }
 